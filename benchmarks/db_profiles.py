@@ -0,0 +1,150 @@
+"""Compare the storage profiles in economy/db.py on a mixed economy workload.
+
+Run from the repository root:
+
+    python -m benchmarks.db_profiles [--seconds 10] [--concurrency 20] [--users 500]
+
+Every profile runs in its own process on a fresh copy of space.db.
+Simulated commands (balance, pay-style credits, shop purchases, inventory,
+daily, stock trades, market overview) run concurrently while a price-fluctuation loop writes in the
+background, and the script prints the completed commands per second.
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from economy import db, writer, setup_database, initialize_stocks
+from economy.inventory import get_inventory
+from economy.market import market
+from economy.other import can_claim_daily, claim_daily
+from economy.pay import add_balance, get_balance
+from economy.stocks import get_stock_price, get_stocks, update_stock_price, update_user_balance, update_user_portfolio
+from economy.store import buy_item, get_shop_items
+
+
+async def balance(user_id, items, stocks):
+    await get_balance(user_id)
+
+async def earn(user_id, items, stocks):
+    await add_balance(user_id, random.randint(50, 250))
+
+async def buy(user_id, items, stocks):
+    await buy_item(user_id, random.choice(items))
+
+async def inventory(user_id, items, stocks):
+    await get_inventory(user_id)
+
+async def daily(user_id, items, stocks):
+    can_claim, _ = await can_claim_daily(user_id)
+    if can_claim:
+        await claim_daily(user_id)
+
+async def trade_stock(user_id, items, stocks):
+    stock_id = random.choice(stocks)
+    price = await get_stock_price(stock_id)
+    await update_user_balance(user_id, -math.ceil(price))
+    await update_user_portfolio(user_id, stock_id, 1)
+    await update_stock_price(stock_id, price * 0.025)
+
+async def overview(user_id, items, stocks):
+    await get_stocks('DESC')
+
+# (command, weight) pairs roughly matching the bot's traffic.
+WORKLOAD = [
+    (balance, 35),
+    (earn, 15),
+    (buy, 10),
+    (inventory, 15),
+    (daily, 5),
+    (trade_stock, 10),
+    (overview, 10),
+]
+
+
+async def fluctuate(stocks, stop: asyncio.Event):
+    while not stop.is_set():
+        for stock_id in stocks:
+            await update_stock_price(stock_id, random.uniform(-5.0, 5.0))
+        await asyncio.sleep(0.5)
+
+
+async def run_profile(profile: str, source: str, seconds: float, concurrency: int, users: int) -> float:
+    workdir = tempfile.mkdtemp(prefix=f"space-bench-{profile}-")
+    path = os.path.join(workdir, "space.db")
+    shutil.copy(source, path)
+    try:
+        await db.init_pool(path, size=concurrency, profile=profile, backend_name="sqlite")
+        await writer.start_writer()
+        await setup_database()
+        await initialize_stocks()
+
+        items = [row[0] for row in await get_shop_items()]
+        stocks = [row[0] for row in await get_stocks()]
+        await asyncio.gather(*(add_balance(user_id, 1_000_000) for user_id in range(1, users + 1)))
+
+        commands, weights = zip(*WORKLOAD)
+        stop = asyncio.Event()
+        completed = 0
+
+        async def worker():
+            nonlocal completed
+            while not stop.is_set():
+                command = random.choices(commands, weights)[0]
+                await command(random.randint(1, users), items, stocks)
+                completed += 1
+
+        background = asyncio.create_task(fluctuate(stocks, stop))
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        started = time.perf_counter()
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(background, *workers)
+        return completed / (time.perf_counter() - started)
+    finally:
+        await market.stop()
+        await writer.stop_writer()
+        await db.close_pool()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_isolated(profile: str, args) -> float:
+    """Run one profile in a fresh interpreter.
+
+    The account cache, cooldowns, catalog and market are module-level, so
+    profiles run in one process would start from the previous run's state.
+    """
+    command = [sys.executable, "-m", "benchmarks.db_profiles", "--in-process",
+               "--seconds", str(args.seconds), "--concurrency", str(args.concurrency),
+               "--users", str(args.users), "--database", args.database, profile]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return float(output.split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--database", default="space.db", help="database to copy for every run")
+    parser.add_argument("--in-process", action="store_true", help="run every profile in this process (used for each isolated run)")
+    parser.add_argument("profiles", nargs="*", default=list(db.PROFILES))
+    args = parser.parse_args()
+
+    print(f"{'profile':<12}{'commands/sec':>14}", flush=True)
+    for profile in args.profiles:
+        if args.in_process:
+            rate = asyncio.run(run_profile(profile, args.database, args.seconds, args.concurrency, args.users))
+        else:
+            rate = run_isolated(profile, args)
+        print(f"{profile:<12}{rate:>14.1f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
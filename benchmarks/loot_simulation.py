@@ -0,0 +1,111 @@
+"""Simulate millions of digs to check drop rates and credit inflation.
+
+Run from the repository root:
+
+    python -m benchmarks.loot_simulation [--digs 5000000] [--tier rare=20] [--weight moon_rock=2]
+
+The loot table is built from a copy of space.db exactly as the bot builds it,
+optionally with changed tier or item weights, and the digs are drawn with
+numpy from the same alias table. The script prints each item's expected and
+simulated drop rate and how many credits (found, and as the sell value of
+the items found) a thousand digs bring into the economy.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from economy import db, writer, setup_database
+from economy.catalog import catalog
+from economy.inventory import SELL_RATE
+from economy.loot import ITEM_CHANCE, CREDITS_CHANCE, ITEM_CREDITS, FOUND_CREDITS, build_loot_table
+
+
+async def load_catalog(source: str):
+    workdir = tempfile.mkdtemp(prefix="space-loot-")
+    path = os.path.join(workdir, "space.db")
+    shutil.copy(source, path)
+    try:
+        await db.init_pool(path, size=1, backend_name="sqlite")
+        await writer.start_writer()
+        await setup_database()
+        return catalog.items(), dict(catalog.tiers())
+    finally:
+        await writer.stop_writer()
+        await db.close_pool()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def overrides(pairs) -> dict:
+    result = {}
+    for pair in pairs:
+        name, _, value = pair.partition('=')
+        result[name] = float(value)
+    return result
+
+
+def simulate(table, digs: int, rng: np.random.Generator):
+    """Draw ``digs`` digs at once. Returns (item index or -1 per dig, credits per dig)."""
+    prob = np.array(table.alias.prob)
+    alias = np.array(table.alias.alias)
+
+    found_item = rng.random(digs) < ITEM_CHANCE
+    found_credits = ~found_item & (rng.random(digs) < CREDITS_CHANCE)
+
+    # The alias draw, vectorised: pick a column, then it or its alias
+    columns = rng.integers(0, len(prob), digs)
+    drawn = np.where(rng.random(digs) < prob[columns], columns, alias[columns])
+    items = np.where(found_item, drawn, -1)
+
+    credits = np.zeros(digs, dtype=np.int64)
+    credits[found_item] = rng.integers(ITEM_CREDITS[0], ITEM_CREDITS[1] + 1, found_item.sum())
+    credits[found_credits] = rng.integers(FOUND_CREDITS[0], FOUND_CREDITS[1] + 1, found_credits.sum())
+    return items, credits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--digs", type=int, default=5_000_000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--database", default="space.db", help="database to read the catalog from (it is copied, not changed)")
+    parser.add_argument("--tier", action="append", default=[], metavar="TIER=WEIGHT", help="try a different tier weight")
+    parser.add_argument("--weight", action="append", default=[], metavar="ITEM=WEIGHT", help="try a different item loot_weight")
+    args = parser.parse_args()
+
+    items, tiers = asyncio.run(load_catalog(args.database))
+    tiers.update(overrides(args.tier))
+    weights = overrides(args.weight)
+    items = [item._replace(loot_weight=weights.get(item.item_id, item.loot_weight)) for item in items]
+
+    table = build_loot_table(items, tiers)
+    if table is None:
+        print("Nothing can drop with these weights.")
+        return
+
+    drawn, credits = simulate(table, args.digs, np.random.default_rng(args.seed))
+    counts = np.bincount(drawn[drawn >= 0], minlength=len(table.items))
+
+    print(f"{'item':<24}{'tier':<11}{'expected':>10}{'simulated':>11}")
+    for item, chance, count in zip(table.items, table.chances, counts):
+        print(f"{item.item_id:<24}{item.tier:<11}{ITEM_CHANCE * chance:>10.4%}{count / args.digs:>11.4%}")
+
+    print()
+    print(f"{'tier':<12}{'weight':>8}{'simulated':>11}")
+    for tier in sorted(tiers, key=tiers.get, reverse=True):
+        count = sum(count for item, count in zip(table.items, counts) if item.tier == tier)
+        print(f"{tier:<12}{tiers[tier]:>8g}{count / args.digs:>11.4%}")
+
+    sell_prices = np.array([int(item.item_price * SELL_RATE) for item in table.items])
+    found = credits.sum() / args.digs * 1000
+    sold = (counts * sell_prices).sum() / args.digs * 1000
+    print()
+    print(f"credits found per 1000 digs       {found:>12.1f}")
+    print(f"item sell value per 1000 digs     {sold:>12.1f}")
+    print(f"total per 1000 digs               {found + sold:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
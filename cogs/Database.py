@@ -0,0 +1,220 @@
+import discord
+from discord.ext import commands, tasks
+import settings
+from economy.backup import backup_database, BackupResult
+from economy import maintenance
+from economy.retention import apply_retention
+from economy.cooldowns import cooldowns
+from economy.market import market
+from economy.settlement import settle, recent_runs
+from economy.ledger import take_snapshot
+
+def backup_embed(result: BackupResult) -> discord.Embed:
+    embed = discord.Embed(
+        title="Database backup complete",
+        description=f"`{result.path.name}`",
+        color=discord.Color.green()
+    )
+    embed.add_field(name="Size", value=f"{result.size / 1024 / 1024:.2f} MiB ({result.pages} pages)")
+    embed.add_field(name="Duration", value=f"{result.duration:.2f}s")
+    embed.add_field(name="Worst pause", value=f"{result.worst_pause * 1000:.1f} ms")
+    if result.removed:
+        embed.add_field(name="Old backups removed", value=str(result.removed))
+    return embed
+
+def maintenance_embed(report: maintenance.MaintenanceReport) -> discord.Embed:
+    if report.skipped:
+        return discord.Embed(title="Database maintenance skipped", description=report.skipped, color=discord.Color.orange())
+    embed = discord.Embed(title="Database maintenance complete", color=discord.Color.green())
+    embed.add_field(name="Pages freed", value=f"{report.pages_freed} ({report.pages_freed * report.page_size / 1024 / 1024:.2f} MiB)")
+    embed.add_field(name="Free pages left", value=str(report.free_pages))
+    embed.add_field(name="ANALYZE", value="ran" if report.analyzed else "not due")
+    embed.add_field(name="Duration", value=f"{report.duration:.2f}s")
+    return embed
+
+class Database(commands.Cog):
+
+    def __init__(self, bot: commands.Bot):
+        self.bot: commands.Bot = bot
+        self.flush_cooldowns.change_interval(seconds=settings.COOLDOWN_FLUSH_SECONDS)
+        self.flush_cooldowns.start()
+        self.scheduled_settlement.start()
+        if settings.BACKUP_INTERVAL_HOURS > 0 and settings.DB_BACKEND == "sqlite":
+            self.scheduled_backup.change_interval(hours=settings.BACKUP_INTERVAL_HOURS)
+            self.scheduled_backup.start()
+        if settings.MAINTENANCE_INTERVAL_MINUTES > 0 and settings.DB_BACKEND == "sqlite":
+            self.scheduled_maintenance.change_interval(minutes=settings.MAINTENANCE_INTERVAL_MINUTES)
+            self.scheduled_maintenance.start()
+        if settings.RETENTION_INTERVAL_MINUTES > 0:
+            self.scheduled_retention.change_interval(minutes=settings.RETENTION_INTERVAL_MINUTES)
+            self.scheduled_retention.start()
+        if settings.LEDGER_SNAPSHOT_HOURS > 0:
+            self.scheduled_snapshots.change_interval(hours=settings.LEDGER_SNAPSHOT_HOURS)
+            self.scheduled_snapshots.start()
+
+    async def cog_unload(self):
+        self.scheduled_backup.cancel()
+        self.scheduled_maintenance.cancel()
+        self.scheduled_retention.cancel()
+        self.scheduled_snapshots.cancel()
+        self.flush_cooldowns.cancel()
+        self.scheduled_settlement.cancel()
+        # Don't lose the cooldowns started and the prices moved since the last flush
+        await cooldowns.flush()
+        await market.flush()
+
+    @commands.command(name="backup")
+    @commands.is_owner()
+    async def backup(self, ctx: commands.Context):
+        """Take an online backup of the database now (owner only)."""
+        msg = await ctx.reply("Backing up the database...")
+        try:
+            result = await backup_database()
+        except RuntimeError as e:
+            await msg.edit(content=str(e))
+            return
+        await msg.edit(content=None, embed=backup_embed(result))
+
+    @commands.command(name="maintenance")
+    @commands.is_owner()
+    async def maintenance(self, ctx: commands.Context):
+        """Run database maintenance now, even if paused or busy (owner only)."""
+        msg = await ctx.reply("Running database maintenance...")
+        report = await maintenance.run_maintenance(force=True)
+        await msg.edit(content=None, embed=maintenance_embed(report))
+
+    @commands.command(name="maintenance-pause")
+    @commands.is_owner()
+    async def maintenance_pause(self, ctx: commands.Context):
+        """Stop scheduled database maintenance until resumed (owner only)."""
+        maintenance.pause()
+        await ctx.reply("Scheduled database maintenance paused.")
+
+    @commands.command(name="maintenance-resume")
+    @commands.is_owner()
+    async def maintenance_resume(self, ctx: commands.Context):
+        """Resume scheduled database maintenance (owner only)."""
+        maintenance.resume()
+        await ctx.reply("Scheduled database maintenance resumed.")
+
+    @commands.command(name="enable-incremental-vacuum")
+    @commands.is_owner()
+    async def enable_incremental_vacuum(self, ctx: commands.Context):
+        """Let maintenance hand free pages back; rewrites the database once and blocks writes meanwhile (owner only)."""
+        msg = await ctx.reply("Rewriting the database to enable incremental vacuum...")
+        duration = await maintenance.enable_incremental_vacuum()
+        if duration is None:
+            await msg.edit(content="Incremental vacuum is already enabled.")
+        else:
+            await msg.edit(content=f"Incremental vacuum enabled in {duration:.2f}s.")
+
+    @commands.command(name="prune")
+    @commands.is_owner()
+    async def prune(self, ctx: commands.Context):
+        """Apply the retention policies now (owner only)."""
+        msg = await ctx.reply("Pruning old rows...")
+        results = await apply_retention()
+        embed = discord.Embed(title="Retention applied", color=discord.Color.green())
+        for result in results:
+            embed.add_field(name=result.table, value=f"{result.removed} rows {'archived' if result.archived else 'deleted'} in {result.duration:.2f}s")
+        await msg.edit(content=None, embed=embed)
+
+    @commands.command(name="settle")
+    @commands.is_owner()
+    async def settle(self, ctx: commands.Context):
+        """Pay out any unsettled days of dividends and interest, and show the last runs (owner only)."""
+        msg = await ctx.reply("Settling dividends and interest...")
+        ran = await settle()
+        embed = discord.Embed(
+            title="Settlement",
+            description=f"Settled {len(ran)} day(s) now." if ran else "Every day is already settled.",
+            color=discord.Color.green()
+        )
+        for run in await recent_runs():
+            embed.add_field(
+                name=run.period,
+                value=f"Dividends: {run.dividend_accounts} accounts\nInterest: {run.interest_accounts} accounts\n{run.duration:.2f}s"
+            )
+        await msg.edit(content=None, embed=embed)
+
+    @tasks.loop(hours=24)
+    async def scheduled_backup(self):
+        # The loop fires as soon as it starts; wait a full interval instead of backing up on every restart
+        if self.scheduled_backup.current_loop == 0:
+            return
+        try:
+            result = await backup_database()
+        except Exception as e:
+            print(f"Scheduled database backup failed: {e}")
+            return
+        print(f"Database backed up to {result.path} in {result.duration:.2f}s (worst pause {result.worst_pause * 1000:.1f} ms)")
+
+    @scheduled_backup.before_loop
+    async def before_scheduled_backup(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(minutes=30)
+    async def scheduled_maintenance(self):
+        try:
+            report = await maintenance.run_maintenance()
+        except Exception as e:
+            print(f"Scheduled database maintenance failed: {e}")
+            return
+        if not report.skipped:
+            print(f"Database maintenance freed {report.pages_freed} pages in {report.duration:.2f}s"
+                  f"{' (with ANALYZE)' if report.analyzed else ''}, {report.free_pages} free pages left")
+
+    @scheduled_maintenance.before_loop
+    async def before_scheduled_maintenance(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(minutes=60)
+    async def scheduled_retention(self):
+        try:
+            results = await apply_retention()
+        except Exception as e:
+            print(f"Scheduled retention run failed: {e}")
+            return
+        for result in results:
+            if result.removed:
+                print(f"Retention {'archived' if result.archived else 'deleted'} {result.removed} {result.table} rows in {result.duration:.2f}s")
+
+    @scheduled_retention.before_loop
+    async def before_scheduled_retention(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(hours=6)
+    async def scheduled_snapshots(self):
+        try:
+            run = await take_snapshot()
+        except Exception as e:
+            print(f"Ledger snapshot failed, it will be retried: {e}")
+            return
+        if run is not None:
+            print(f"Snapshot of {run.users} balances up to ledger row {run.ledger_id} in {run.duration:.2f}s")
+
+    @scheduled_snapshots.before_loop
+    async def before_scheduled_snapshots(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=5)
+    async def flush_cooldowns(self):
+        try:
+            await cooldowns.flush()
+        except Exception as e:
+            print(f"Writing cooldowns failed, retrying at the next flush: {e}")
+
+    @tasks.loop(minutes=30)
+    async def scheduled_settlement(self):
+        # Cheap when the day is already settled: one read
+        try:
+            await settle()
+        except Exception as e:
+            print(f"Scheduled settlement failed, it will be retried: {e}")
+
+    @scheduled_settlement.before_loop
+    async def before_scheduled_settlement(self):
+        await self.bot.wait_until_ready()
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Database(bot))
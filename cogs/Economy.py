@@ -3,14 +3,46 @@ from discord.ext import commands
 import math
 import random
 import asyncio
+from typing import Optional
 from economy import *
 from economy.inventory import *
 from economy.job import *
 from economy.other import *
 from economy.pay import *
 from economy.store import *
+from economy.guilds import *
+from economy.locks import *
+from economy.catalog import catalog
+from economy.loot import loot_table, roll_dig
+from economy.leaderboard import leaderboards, BOARDS
 from utils import *
 
+SHOP_ITEMS_PER_PAGE = 5
+
+# Other names users type for the leaderboard subjects
+LEADERBOARD_ALIASES = {'balance': 'credits', 'networth': 'net_worth', 'worth': 'net_worth'}
+
+def shop_page(page: int) -> discord.Embed:
+    """A page of the shop, rendered once per catalog version."""
+    def render():
+        items = catalog.items()
+        total_pages = math.ceil(len(items) / SHOP_ITEMS_PER_PAGE)
+        start = (page - 1) * SHOP_ITEMS_PER_PAGE
+        embed = discord.Embed(
+            title="Shop",
+            description=f"Available items for purchase (Page {page}/{total_pages}):",
+            color=discord.Color.gold()
+        )
+        for item in items[start:start + SHOP_ITEMS_PER_PAGE]:
+            embed.add_field(
+                name=f"{item.item_name}", 
+                value=f"Price: **{item.item_price} space credits**\n Item ID: *{item.item_id}* (used for buying)", 
+                inline=False
+            )
+        return embed
+
+    return catalog.cached(('shop page', page), render)
+
 class Economy(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
@@ -21,10 +53,21 @@ class Economy(commands.Cog):
     async def balance(self, ctx: commands.Context, user: discord.Member = commands.Author):
         """Check the user's balance."""
         user_id = user.id
-        balance = await get_balance(user_id)
+        scope = economy_scope(ctx.guild)
+        # Checking your own balance collects what your job earned so far, into the economy the job is from
+        earned, job_scope = await settle_income(user_id) if user == ctx.author else (0, None)
+        balance = await get_balance(user_id, scope)
+        pending = await get_pending_income(user_id) if user != ctx.author else 0
+        description = f"{user.mention} has **{balance:.2f} space credits**."
+        if earned and job_scope == scope:
+            description += f"\n{earned} credits of job income were just added."
+        elif earned:
+            description += f"\n{earned} credits of job income were just added to your balance in the economy you took your job in."
+        elif pending:
+            description += f"\n{pending} more credits of job income are waiting to be collected."
         embed = discord.Embed(
             title=f"{user.display_name}'s Balance",
-            description=f"{user.mention} has **{balance:.2f} space credits**.",
+            description=description,
             color=discord.Color.blue()
         )
         await ctx.reply(embed=embed)
@@ -48,10 +91,13 @@ class Economy(commands.Cog):
     async def daily(self, ctx: commands.Context):
         """Claim the daily reward."""
         user_id = ctx.author.id
+        scope = economy_scope(ctx.guild)
         
-        can_claim, time_left = await can_claim_daily(user_id)
+        async with user_lock(user_id, guild_id=scope):
+            can_claim, time_left = await can_claim_daily(user_id, scope)
+            if can_claim:
+                reward = await claim_daily(user_id, scope)
         if can_claim:
-            reward = await claim_daily(user_id)
             embed = discord.Embed(
                 title="Successfully claimed daily reward!",
                 description=f"{ctx.author.mention}, you have earned **{reward}** space credits for claiming your daily reward!",
@@ -92,7 +138,12 @@ class Economy(commands.Cog):
 
         sender_id = ctx.author.id
         receiver_id = member.id
-        sender_balance = await get_balance(sender_id)
+        scope = economy_scope(ctx.guild)
+        # Hold both users until the transfer is written so nothing can spend the balance in between
+        async with user_lock(sender_id, receiver_id, guild_id=scope):
+            sender_balance = await get_balance(sender_id, scope)
+            if sender_balance >= amount:
+                await transfer_credits(sender_id, receiver_id, amount, scope)
 
         if sender_balance < amount:
             embed = discord.Embed(
@@ -102,7 +153,6 @@ class Economy(commands.Cog):
             await ctx.reply(embed=embed)
             return
 
-        await transfer_credits(sender_id, receiver_id, amount)
         embed = discord.Embed(
             title="Payment Successful",
             description=f"{ctx.author.mention} has paid {member.mention} {amount} space credits.",
@@ -137,27 +187,10 @@ class Economy(commands.Cog):
             await ctx.reply(embed=embed)
             return
         
-        items_per_page = 5
-        total_pages = math.ceil(len(items) / items_per_page)
+        total_pages = math.ceil(len(items) / SHOP_ITEMS_PER_PAGE)
         page = max(1, min(page, total_pages))
 
-        start = (page - 1) * items_per_page
-        end = start + items_per_page
-        items_on_page = items[start:end]
-
-        embed = discord.Embed(
-            title="Shop",
-            description=f"Available items for purchase (Page {page}/{total_pages}):",
-            color=discord.Color.gold()
-        )
-        for item_id, item_name, item_price in items_on_page:
-            embed.add_field(
-                name=f"{item_name}", 
-                value=f"Price: **{item_price} space credits**\n Item ID: *{item_id}* (used for buying)", 
-                inline=False
-            )
-
-        message = await ctx.reply(embed=embed)
+        message = await ctx.reply(embed=shop_page(page))
         
         if total_pages > 1:
             await message.add_reaction('◀️')
@@ -182,23 +215,7 @@ class Economy(commands.Cog):
                 if page > total_pages:
                     page = 1
 
-            start = (page - 1) * items_per_page
-            end = start + items_per_page
-            items_on_page = items[start:end]
-            
-            embed = discord.Embed(
-                title="Shop",
-                description=f"Available items for purchase (Page {page}/{total_pages}):",
-                color=discord.Color.gold()
-            )
-            for item_id, item_name, item_price in items_on_page:
-                embed.add_field(
-                    name=f"{item_name}", 
-                    value=f"Price: **{item_price} space credits**\n Item ID: *{item_id}* (used for buying)", 
-                    inline=False
-                )
-
-            await message.edit(embed=embed)
+            await message.edit(embed=shop_page(page))
             await message.remove_reaction(reaction.emoji, user)
 
     @shop.error
@@ -220,7 +237,7 @@ class Economy(commands.Cog):
     async def buy(self, ctx: commands.Context, item_id: str):
         """Buy an item from the shop."""
         user_id = ctx.author.id
-        success, message = await buy_item(user_id, item_id)
+        success, message = await buy_item(user_id, item_id, economy_scope(ctx.guild))
         
         embed = discord.Embed(
             description=message,
@@ -247,7 +264,7 @@ class Economy(commands.Cog):
     async def inventory(self, ctx: commands.Context, user: discord.Member = commands.Author, page: int = 1):
         """Show your inventory."""
         user_id = ctx.author.id
-        inventory = await get_inventory(user_id)
+        inventory = await get_inventory(user_id, economy_scope(ctx.guild))
         if not inventory:
             embed=discord.Embed(
                 description="You don't have any items in your inventory.",
@@ -260,29 +277,22 @@ class Economy(commands.Cog):
         total_pages = math.ceil(len(inventory) / items_per_page)
         page = max(1, min(page, total_pages))
 
-        start = (page - 1) * items_per_page
-        end = start + items_per_page
-        items_on_page = inventory[start:end]
-
-        embed = discord.Embed(
-            title="Your Inventory",
-            description=f"Items you own (Page {page}/{total_pages}):",
-            color=discord.Color.blue()
-        )
-        for item_name, item_id, quantity in items_on_page:
-            async with asqlite.connect('space.db') as conn:
-                async with conn.cursor() as cursor:
-                    await cursor.execute('SELECT item_price FROM shop_items WHERE item_id = ?', (item_id,))
-                    price = await cursor.fetchone()
-                    sell_price = int(price[0] * 0.75) if price else 0
-
-            embed.add_field(
-                name=item_name,
-                value=f"Quantity: **{quantity}**\nSell price: **{sell_price} space tokens\n**Item ID: *{item_id}* (used for selling)",
-                inline=False
+        def inventory_page(page: int) -> discord.Embed:
+            start = (page - 1) * items_per_page
+            embed = discord.Embed(
+                title="Your Inventory",
+                description=f"Items you own (Page {page}/{total_pages}):",
+                color=discord.Color.blue()
             )
+            for item in inventory[start:start + items_per_page]:
+                embed.add_field(
+                    name=item.item_name,
+                    value=f"Quantity: **{item.quantity}**\nSell price: **{item.sell_price} space tokens**\nItem ID: *{item.item_id}* (used for selling)",
+                    inline=False
+                )
+            return embed
 
-        message = await ctx.reply(embed=embed)
+        message = await ctx.reply(embed=inventory_page(page))
         
         if total_pages > 1:
             await message.add_reaction('◀️')
@@ -307,29 +317,8 @@ class Economy(commands.Cog):
                 if page > total_pages:
                     page = 1
 
-            start = (page - 1) * items_per_page
-            end = start + items_per_page
-            items_on_page = inventory[start:end]
-
-            embed = discord.Embed(
-                title="Your Inventory",
-                description=f"Items you own (Page {page}/{total_pages}):",
-                color=discord.Color.blue()
-            )
-            for item_name, item_id, quantity in items_on_page:
-                async with asqlite.connect('space.db') as conn:
-                    async with conn.cursor() as cursor:
-                        await cursor.execute('SELECT item_price FROM shop_items WHERE item_id = ?', (item_id,))
-                        price = await cursor.fetchone()
-                        sell_price = int(price[0] * 0.75) if price else 0
-
-                embed.add_field(
-                    name=item_name,
-                    value=f"Quantity: **{quantity}**\nItem ID: *{item_id}* (used for selling)\nSell price: **{sell_price} space tokens**",
-                    inline=False
-                )
-
-            await message.edit(embed=embed)
+            # Flipping pages reuses the inventory read above
+            await message.edit(embed=inventory_page(page))
             await message.remove_reaction(reaction.emoji, user)
 
     @inventory.error
@@ -352,51 +341,38 @@ class Economy(commands.Cog):
     async def sell(self, ctx: commands.Context, *, item_id: str):
         """Sell an item from your inventory."""
         user_id = ctx.author.id
+        scope = economy_scope(ctx.guild)
 
-        inventory = await get_inventory(user_id)
-        item_found = False
-        item_price = 0
+        async with user_lock(user_id, guild_id=scope):
+            item = await get_inventory_item(user_id, item_id, scope)
+            if not item:
+                embed=discord.Embed(
+                    description="Item not found in your inventory.",
+                    color=discord.Color.red()
+                )
+                await ctx.reply(embed=embed)
+                return
+            if item.quantity < 1:
+                embed=discord.Embed(
+                    description=f"You don't have any **{item.item_name}** in your inventory.",
+                    color=discord.Color.red()
+                )
+                await ctx.reply(embed=embed)
+                return
 
+            item_id = item.item_id
+            total_price = item.sell_price
 
-        for item_name, id, qty in inventory:
-            if id.lower() == item_id.lower():
-                if qty < 1:
-                    embed=discord.Embed(
-                        description=f"You don't have any **{item_name}** in your inventory.",
-                        color=discord.Color.red()
-                    )
-                    await ctx.reply(embed=embed)
-                    return
-                item_found = True
-                async with asqlite.connect('space.db') as conn:
-                    async with conn.cursor() as cursor:
-                        await cursor.execute('SELECT item_price FROM shop_items WHERE item_id = ?', (item_id,))
-                        price = await cursor.fetchone()
-                        if price:
-                            item_price = price[0]
-                        else:
-                            embed=discord.Embed(
-                                description=f"Item price not found.",
-                                color=discord.Color.red()
-                            )
-                            await ctx.reply(embed=embed)
-                            return
-                break
+            sold = await sell_item(user_id, item_id, total_price, scope)
 
-        if not item_found:
+        if not sold:
             embed=discord.Embed(
-                description="Item not found in your inventory.",
+                description=f"You don't have any **{item.item_name}** in your inventory.",
                 color=discord.Color.red()
             )
             await ctx.reply(embed=embed)
             return
 
-        sell_price = int(item_price * 0.75)
-        total_price = sell_price
-
-        await remove_item(user_id, item_id, 1)
-        await add_balance(user_id, total_price)
-
         embed = discord.Embed(
             title="Item Sold!",
             description=f"You have sold **1** of **{item_id}** for **{total_price}** space credits.",
@@ -423,14 +399,9 @@ class Economy(commands.Cog):
     async def dig(self, ctx: commands.Context):
         """Dig for space items."""
         user_id = ctx.author.id
+        scope = economy_scope(ctx.guild)
 
-        # Fetch all shop items from the database
-        async with asqlite.connect('space.db') as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute('SELECT item_id, item_name, item_price FROM shop_items')
-                shop_items = await cursor.fetchall()
-
-        if not shop_items:
+        if loot_table() is None:
             embed = discord.Embed(
                 description="There are no items to dig up.",
                 color=discord.Color.red()
@@ -438,21 +409,19 @@ class Economy(commands.Cog):
             await ctx.reply(embed=embed)
             return
 
-        if random.random() < 0.25:
-            item = random.choice(shop_items)
-            item_id, item_name, item_price = item
-
-            await add_to_inventory(user_id, item_id, 1)
-
-            credits_amount = random.randint(50,250)
+        item, credits_amount = roll_dig()
+        if item:
+            await add_to_inventory(user_id, item.item_id, 1, scope)
+        if credits_amount:
+            await add_balance(user_id, credits_amount, scope)
 
+        if item:
             embed = discord.Embed(
                 title="You found an item!",
-                description=f"You dug up **{item_name}**! You also found **{credits_amount}** space credits!",
+                description=f"You dug up **{item.item_name}**! You also found **{credits_amount}** space credits!",
                 color=discord.Color.green()
             )
-        elif random.random() < 0.5:
-            credits_amount = random.randint(50,150)
+        elif credits_amount:
             embed = discord.Embed(
                 title="You found space credits!",
                 description=f"You dug and dug, and found **{credits_amount}** space credits!",
@@ -496,32 +465,34 @@ class Economy(commands.Cog):
 
         user_id = ctx.author.id
         target_id = member.id
+        scope = economy_scope(ctx.guild)
 
-        target_balance = await get_balance(target_id)
-        if target_balance < 100:
-            embed = discord.Embed(
-                description=f"{member.mention} doesn't have enough space credits to rob.",
-                color=discord.Color.red()
-            )
-            await ctx.reply(embed=embed)
-            return
+        async with user_lock(user_id, target_id, guild_id=scope):
+            target_balance = await get_balance(target_id, scope)
+            if target_balance < 100:
+                embed = discord.Embed(
+                    description=f"{member.mention} doesn't have enough space credits to rob.",
+                    color=discord.Color.red()
+                )
+                await ctx.reply(embed=embed)
+                return
 
-        success_chance = random.randint(1, 100)
-        if success_chance <= 40:
-            stolen_amount = random.randint(100, int(target_balance * 0.6))
-            await transfer_credits(target_id, user_id, stolen_amount)
-            embed = discord.Embed(
-                title="Robbery Successful!",
-                description=f"You successfully robbed {member.mention} and stole **{stolen_amount}** space credits!",
-                color=discord.Color.green()
-            )
-        else:
-            fine = random.randint(50, 200)
-            await remove_balance(user_id, fine)
-            embed = discord.Embed(
-                description=f"Your robbery attempt failed, and you were fined **{fine}** space credits.",
-                color=discord.Color.red()
-            )
+            success_chance = random.randint(1, 100)
+            if success_chance <= 40:
+                stolen_amount = random.randint(100, int(target_balance * 0.6))
+                await transfer_credits(target_id, user_id, stolen_amount, scope)
+                embed = discord.Embed(
+                    title="Robbery Successful!",
+                    description=f"You successfully robbed {member.mention} and stole **{stolen_amount}** space credits!",
+                    color=discord.Color.green()
+                )
+            else:
+                fine = random.randint(50, 200)
+                await remove_balance(user_id, fine, scope)
+                embed = discord.Embed(
+                    description=f"Your robbery attempt failed, and you were fined **{fine}** space credits.",
+                    color=discord.Color.red()
+                )
         await ctx.reply(embed=embed)
 
     @rob.error
@@ -569,8 +540,8 @@ class Economy(commands.Cog):
             await ctx.reply(embed=embed)
             return
 
-        user_job = await get_user_job(user_id)
-        if not user_job:
+        status = await get_work_status(user_id)
+        if not status:
             embed = discord.Embed(
                 description="You don't have a job yet! Use `s!apply` to apply for a job. Use `s!job list` for a list of available jobs.",
                 color=discord.Color.red()
@@ -578,14 +549,12 @@ class Economy(commands.Cog):
             await ctx.reply(embed=embed)
             return
 
-        job_name, job_description, job_pay = user_job
+        job_name, job_pay, remaining_time = status
         
         # Check cooldown
-        last_work_time = await get_last_work_time(user_id)
-        if last_work_time and datetime.utcnow() - last_work_time < timedelta(hours=1):
-            remaining_time = timedelta(hours=1) - (datetime.utcnow() - last_work_time)
+        if remaining_time:
             embed = discord.Embed(
-                description=f"You can't work right now. You need to wait **{str(remaining_time).split('.')[0]}** before you can work again.",
+                description=f"You can't work right now. You need to wait **{remaining_time}** before you can work again.",
                 color=discord.Color.red()
             )
             await ctx.reply(embed=embed)
@@ -595,7 +564,7 @@ class Economy(commands.Cog):
         num2 = random.randint(1, 12)
         correct_answer = num1 * num2
 
-        await ctx.reply(f"To earn your pay and job points, solve this problem: **{num1} x {num2} = ?**")
+        await ctx.reply(f"To collect your pay and earn job points, solve this problem: **{num1} x {num2} = ?**")
 
         def check(m: discord.Message):
             return m.author == ctx.author and m.channel == ctx.channel and m.content.isdigit()
@@ -603,13 +572,19 @@ class Economy(commands.Cog):
         try:
             answer = await self.bot.wait_for('message', timeout=30.0, check=check)
             if int(answer.content) == correct_answer:
-                await update_last_work_time(user_id)
-                await add_balance(user_id, job_pay)
-                job_points = await update_job_points(user_id)
-                embed = discord.Embed(
-                    description=f"Correct! You have earned {job_pay} credits and {job_points} job points for your work.",
-                    color=discord.Color.green()
-                )
+                result = await work(user_id)
+                if result is None:
+                    embed = discord.Embed(
+                        description="You have already worked this shift. Try again later.",
+                        color=discord.Color.red()
+                    )
+                else:
+                    earned, job_points, job_scope = result
+                    where = "" if job_scope == economy_scope(ctx.guild) else " in the economy you took your job in"
+                    embed = discord.Embed(
+                        description=f"Correct! You have collected {earned} credits of pay and earned {job_points} job points for your work{where}.",
+                        color=discord.Color.green()
+                    )
                 await ctx.reply(embed=embed)
             else:
                 embed = discord.Embed(
@@ -660,7 +635,7 @@ class Economy(commands.Cog):
             await ctx.reply(embed=embed)
             return
 
-        success, message = await apply_for_job(user_id, job_id)
+        success, message = await apply_for_job(user_id, job_id, economy_scope(ctx.guild))
         if success:
             embed = make_embed(
                 title="Job Application Success",
@@ -696,7 +671,7 @@ class Economy(commands.Cog):
         """Quit your job."""
         user_id = ctx.author.id
 
-        success, message = await resign_from_job(user_id)
+        success, message = await resign_from_job(user_id, economy_scope(ctx.guild))
         if success:
             embed = make_embed(
                 title="Resignation Success",
@@ -726,70 +701,109 @@ class Economy(commands.Cog):
             )
             await ctx.reply(embed=embed)
 
+    @commands.hybrid_command(name='guild-economy', description="Give this server its own economy, or go back to the global one.")
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def guild_economy(self, ctx: commands.Context, enabled: bool):
+        """Switch this server between its own economy and the global one (admin only)."""
+        if enabled:
+            await enable_guild_economy(ctx.guild.id)
+            description = "This server now has its own economy. Balances, items, stocks and trades here are separate from the global economy."
+        else:
+            await disable_guild_economy(ctx.guild.id)
+            description = "This server now uses the global economy again. Its own economy is kept in case you switch back."
+        embed = discord.Embed(
+            description=description,
+            color=discord.Color.green()
+        )
+        await ctx.reply(embed=embed)
+
+    async def display_names(self, guild: Optional[discord.Guild], user_ids) -> dict:
+        """{user_id: name} from the member and user caches, asking the gateway once for members not cached."""
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            user = (guild.get_member(user_id) if guild else None) or self.bot.get_user(user_id)
+            if user:
+                names[user_id] = user.display_name
+            else:
+                missing.append(user_id)
+        if guild and missing:
+            try:
+                for member in await guild.query_members(user_ids=missing[:100], limit=len(missing[:100]), cache=True):
+                    names[member.id] = member.display_name
+            except (asyncio.TimeoutError, discord.ClientException):
+                pass
+        return names
+
     @commands.command(name="leaderboard")
     @commands.cooldown(1, 3, commands.BucketType.user)
     async def leaderboard(self, ctx: commands.Context, subject: str = "credits"):
-        """Display the top users based on their balance or job."""
-        if subject not in ["credits", "job_points"]:
-            await ctx.reply("Invalid subject. Use 'credits' or 'job_points'.")
+        """Display the top users based on their balance, net worth or job."""
+        subject = LEADERBOARD_ALIASES.get(subject, subject)
+        if subject not in BOARDS:
+            await ctx.reply("Invalid subject. Use 'credits', 'net_worth' or 'job_points'.")
             return
-        if subject == "balance":
-            async with asqlite.connect('space.db') as conn:
-                async with conn.cursor() as cursor:
-                    await cursor.execute('''
-                        SELECT user_id, balance 
-                        FROM users 
-                        ORDER BY balance DESC 
-                        LIMIT 10
-                    ''')
-                    top_users = await cursor.fetchall()
-
-            if top_users:
-                embed = discord.Embed(
-                    title="Leaderboard",
-                    description="Top users based on their balance.",
-                    color=discord.Color.gold()
-                )
-                for idx, (user_id, balance) in enumerate(top_users, start=1):
-                    user = self.bot.get_user(user_id)
-                    username = user.name if user else "Unknown"
-                    embed.add_field(
-                        name=f"{idx}. {username}",
-                        value=f"{balance} credits",
-                        inline=False
-                    )
-                await ctx.reply(embed=embed)
-            else:
-                await ctx.reply("No users found in the database.")
+        scope = economy_scope(ctx.guild)
+        top_users = await leaderboards.top(subject, scope)
+        if not top_users:
+            await ctx.reply("No job performance data found." if subject == "job_points" else "No users found in the database.")
+            return
+
+        if subject == "credits":
+            embed = discord.Embed(
+                title="Leaderboard",
+                description="Top users based on their balance.",
+                color=discord.Color.gold()
+            )
+            unit = "credits"
+        elif subject == "net_worth":
+            embed = discord.Embed(
+                title="Net Worth Leaderboard",
+                description="Top users based on their balance plus the value of their stocks and items.",
+                color=discord.Color.gold()
+            )
+            unit = "credits"
         else:
-            async with asqlite.connect('space.db') as conn:
-                async with conn.cursor() as cursor:
-                    # Get the top 10 users by job points
-                    await cursor.execute('''
-                        SELECT user_id, job_points 
-                        FROM users 
-                        ORDER BY job_points DESC 
-                        LIMIT 10
-                    ''')
-                    top_users = await cursor.fetchall()
-
-            if top_users:
-                embed = discord.Embed(
-                    title="Job Performance Leaderboard",
-                    description="Top users based on their job performance points.",
-                    color=discord.Color.blue()
-                )
-                for idx, (user_id, job_points) in enumerate(top_users, start=1):
-                    user = self.bot.get_user(user_id)
-                    username = user.name if user else "Unknown"
-                    embed.add_field(
-                        name=f"{idx}. {username}",
-                        value=f"{job_points} points",
-                        inline=False
-                        )
-                await ctx.reply(embed=embed)
-            else:
-                await ctx.reply("No job performance data found.")
+            embed = discord.Embed(
+                title="Job Performance Leaderboard",
+                description="Top users based on their job performance points.",
+                color=discord.Color.blue()
+            )
+            unit = "points"
+
+        names = await self.display_names(ctx.guild, [user_id for user_id, _ in top_users])
+        for idx, (user_id, value) in enumerate(top_users, start=1):
+            embed.add_field(
+                name=f"{idx}. {names.get(user_id, 'Unknown')}",
+                value=f"{int(value)} {unit}",
+                inline=False
+            )
+        standing = await leaderboards.standing(ctx.author.id, subject, scope)
+        if standing:
+            embed.set_footer(text=f"You are #{standing.rank} of {standing.total} (top {standing.percentile:.1f}%)")
+        await ctx.reply(embed=embed)
+
+    @commands.command(name="rank")
+    @commands.cooldown(1, 3, commands.BucketType.user)
+    async def rank(self, ctx: commands.Context, member: Optional[discord.Member] = None, subject: str = "credits"):
+        """Show where you (or someone else) stand on the credits, net_worth or job_points leaderboard."""
+        member = member or ctx.author
+        subject = LEADERBOARD_ALIASES.get(subject, subject)
+        if subject not in BOARDS:
+            await ctx.reply("Invalid subject. Use 'credits', 'net_worth' or 'job_points'.")
+            return
+        standing = await leaderboards.standing(member.id, subject, economy_scope(ctx.guild))
+        if not standing:
+            await ctx.reply(f"{member.display_name} isn't on the leaderboard yet.")
+            return
+        unit = "points" if subject == "job_points" else "credits"
+        embed = discord.Embed(
+            title=f"{member.display_name}'s rank",
+            description=f"**#{standing.rank}** of {standing.total} with **{int(standing.value)}** {unit} (top {standing.percentile:.1f}%)",
+            color=discord.Color.gold()
+        )
+        await ctx.reply(embed=embed)
 
     @leaderboard.error
     async def leaderboard_error(self, ctx: commands.Context, error: commands.CommandError):
@@ -1,6 +1,44 @@
+import csv
+import io
+import time
 import discord
 from discord.ext import commands
+from datetime import datetime, timezone
+from typing import Union
 import settings
+from economy.migrations import check_query_plans
+from economy.accounts import accounts
+from economy import profiler, ledger
+from economy.bulk import grant_credits, revoke_credits, grant_items, revoke_items
+from economy.catalog import catalog
+from economy.guilds import economy_scope
+
+# Roles, members, or user ids, for the bulk grant and revoke commands
+BulkTargets = commands.Greedy[Union[discord.Role, discord.Member]]
+
+async def bulk_entries(ctx: commands.Context, targets, amount: int) -> list:
+    """(user_id, amount) pairs from the given roles and members and any attached CSV.
+
+    CSV rows are ``user_id[,amount]``; rows without an amount use ``amount``,
+    and rows that don't start with a user id (like a header) are skipped.
+    """
+    entries = {}
+    if any(isinstance(target, discord.Role) for target in targets) and ctx.guild and not ctx.guild.chunked:
+        await ctx.guild.chunk()
+    for target in targets:
+        if isinstance(target, discord.Role):
+            entries.update((member.id, amount) for member in target.members if not member.bot)
+        else:
+            entries[target.id] = amount
+    for attachment in ctx.message.attachments:
+        if not attachment.filename.lower().endswith('.csv'):
+            continue
+        for row in csv.reader(io.StringIO((await attachment.read()).decode('utf-8-sig'))):
+            if not row or not row[0].strip().isdigit():
+                continue
+            value = row[1].strip() if len(row) > 1 else ''
+            entries[int(row[0])] = int(value) if value.lstrip('-').isdigit() else amount
+    return list(entries.items())
 
 
 
@@ -78,6 +116,151 @@ class Owner(commands.Cog):
         )
         await ctx.reply(embed=embed)
 
+    @commands.command(name="query-plans", aliases=["queryplans"])
+    @commands.is_owner()
+    async def query_plans(self, ctx: commands.Context):
+        """Check with EXPLAIN QUERY PLAN that every hot query uses its index (owner only)."""
+        results = await check_query_plans()
+        embed = discord.Embed(
+            title="Query plans",
+            description=None if results else "Query plans are only checked on SQLite.",
+            color=discord.Color.green() if all(uses_index for _, uses_index, _ in results) else discord.Color.red()
+        )
+        for name, uses_index, plan in results:
+            embed.add_field(
+                name=f"{'✅' if uses_index else '❌'} {name}",
+                value=f"```{plan[:1000]}```",
+                inline=False
+            )
+        await ctx.reply(embed=embed)
+
+    @commands.command(name="account-cache", aliases=["accountcache"])
+    @commands.is_owner()
+    async def account_cache(self, ctx: commands.Context):
+        """Show how well the account cache fits the active users (owner only)."""
+        stats = accounts.stats()
+        embed = discord.Embed(
+            title="Account cache",
+            description=f"**{stats['size']}** of **{stats['capacity']}** accounts cached\n"
+                        f"Hits: **{stats['hits']}** · Misses: **{stats['misses']}** · Hit rate: **{stats['hit_rate']:.1%}**",
+            color=discord.Color.blue()
+        )
+        await ctx.reply(embed=embed)
+
+    @commands.command(name="slow-queries", aliases=["slowqueries"])
+    @commands.is_owner()
+    async def slow_queries(self, ctx: commands.Context, count: int = 5):
+        """Show the slowest and the most frequent database statements (owner only)."""
+        if not profiler.enabled:
+            await ctx.reply("The query profiler is off. Set DB_PROFILER to enable it.")
+            return
+        # Two embeds share the 6000 character limit of a message
+        count = max(1, min(count, 5))
+        embeds = []
+        for title, by in (("Slowest statements (total time)", "total"), ("Most frequent statements", "count")):
+            embed = discord.Embed(title=title, color=discord.Color.blue())
+            for stats in profiler.top(count, by):
+                command, _ = stats.commands.most_common(1)[0]
+                embed.add_field(
+                    name=f"{stats.count}× · mean {stats.mean * 1000:.2f} ms · p95 ≤{stats.percentile(0.95) * 1000:.2f} ms · max {stats.max * 1000:.1f} ms",
+                    value=f"```sql\n{stats.fingerprint[:300]}```{stats.rows} rows · mostly `{command}`",
+                    inline=False
+                )
+            if not embed.fields:
+                embed.description = "No statements recorded yet."
+            embeds.append(embed)
+        await ctx.reply(embeds=embeds)
+
+    async def run_bulk(self, ctx: commands.Context, title: str, entries: list, run):
+        if not entries:
+            await ctx.reply("Give some roles or members, or attach a CSV of user ids.")
+            return
+        msg = await ctx.reply(f"{title}: 0/{len(entries)} users...")
+        last_edit = time.monotonic()
+
+        async def progress(done: int, total: int):
+            nonlocal last_edit
+            # Stay well inside the message edit rate limit
+            if done < total and time.monotonic() - last_edit >= 1:
+                last_edit = time.monotonic()
+                await msg.edit(content=f"{title}: {done}/{total} users...")
+
+        result = await run(entries, progress)
+        embed = discord.Embed(
+            title=f"{title} complete",
+            description=f"**{result.users}** users in {result.chunks} transaction(s), {result.duration:.2f}s",
+            color=discord.Color.green()
+        )
+        await msg.edit(content=None, embed=embed)
+
+    @commands.command(name="grant-credits")
+    @commands.is_owner()
+    async def grant_credits(self, ctx: commands.Context, amount: int, targets: BulkTargets):
+        """Give credits to every member of the given roles, the given members, or the users of an attached CSV (owner only)."""
+        scope = economy_scope(ctx.guild)
+        entries = await bulk_entries(ctx, targets, amount)
+        await self.run_bulk(ctx, "Granting credits", entries, lambda entries, progress: grant_credits(entries, scope, progress))
+
+    @commands.command(name="revoke-credits")
+    @commands.is_owner()
+    async def revoke_credits(self, ctx: commands.Context, amount: int, targets: BulkTargets):
+        """Take credits from roles, members or the users of an attached CSV; balances stop at 0 (owner only)."""
+        scope = economy_scope(ctx.guild)
+        entries = await bulk_entries(ctx, targets, amount)
+        await self.run_bulk(ctx, "Revoking credits", entries, lambda entries, progress: revoke_credits(entries, scope, progress))
+
+    @commands.command(name="grant-item")
+    @commands.is_owner()
+    async def grant_item(self, ctx: commands.Context, item_id: str, quantity: int, targets: BulkTargets):
+        """Give an item to roles, members or the users of an attached CSV (owner only)."""
+        if not catalog.item(item_id):
+            await ctx.reply(f"There is no item `{item_id}`.")
+            return
+        scope = economy_scope(ctx.guild)
+        entries = await bulk_entries(ctx, targets, quantity)
+        await self.run_bulk(ctx, f"Granting {item_id}", entries, lambda entries, progress: grant_items(entries, item_id, scope, progress))
+
+    @commands.command(name="revoke-item")
+    @commands.is_owner()
+    async def revoke_item(self, ctx: commands.Context, item_id: str, quantity: int, targets: BulkTargets):
+        """Take an item from roles, members or the users of an attached CSV (owner only)."""
+        scope = economy_scope(ctx.guild)
+        entries = await bulk_entries(ctx, targets, quantity)
+        await self.run_bulk(ctx, f"Revoking {item_id}", entries, lambda entries, progress: revoke_items(entries, item_id, scope, progress))
+
+    @commands.command(name="ledger")
+    @commands.is_owner()
+    async def ledger_history(self, ctx: commands.Context, member: discord.User, count: int = 10):
+        """Show a user's last balance changes and the commands behind them (owner only)."""
+        count = max(1, min(count, 25))
+        entries = await ledger.history(member.id, economy_scope(ctx.guild), count)
+        embed = discord.Embed(title=f"Ledger for {member.display_name}", color=discord.Color.blue())
+        if entries:
+            embed.description = '\n'.join(
+                f"`{entry.created_at[:19].replace('T', ' ')}` **{entry.delta:+,}** → {entry.balance:,} · `{entry.command or 'background'}`"
+                for entry in entries
+            )
+        else:
+            embed.description = "No balance changes recorded."
+        await ctx.reply(embed=embed)
+
+    @commands.command(name="balance-at", aliases=["balanceat"])
+    @commands.is_owner()
+    async def past_balance(self, ctx: commands.Context, member: discord.User, *, when: str):
+        """Show a user's balance at a past UTC time, e.g. `2024-05-01 18:30` (owner only)."""
+        try:
+            moment = datetime.fromisoformat(when.strip())
+        except ValueError:
+            await ctx.reply("Give the time as `YYYY-MM-DD HH:MM` (UTC).")
+            return
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        balance = await ledger.balance_at(member.id, moment, economy_scope(ctx.guild))
+        if balance is None:
+            await ctx.reply("That is before the ledger started.")
+            return
+        await ctx.reply(f"{member.display_name} had **{balance:,}** credits at {moment.isoformat(sep=' ', timespec='minutes')} UTC.")
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Owner(bot))
\ No newline at end of file
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from typing import NamedTuple
+from economy import db
+from economy.leaderboard import leaderboards
+import settings
+
+class Account(NamedTuple):
+    balance: int
+    job_points: int
+
+# Columns to SELECT or RETURN to build an Account
+ACCOUNT_COLUMNS = 'balance, job_points'
+
+# A user without a users row reads exactly like a freshly created one
+NEW_ACCOUNT = Account(0, 0)
+
+class AccountCache:
+    """Bounded LRU of users rows, keyed by (guild_id, user_id).
+
+    Reads go through get(). Every write to users must afterwards either put()
+    the row it RETURNED or invalidate() the user. A read that started before
+    a write never fills the cache, so a slow read cannot overwrite a newer row.
+    The cache only sees this process's writes. The rows put() and clear() also
+    keep the cached leaderboards fresh.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._rows = OrderedDict()
+        self._epoch = 0
+
+    async def get(self, user_id: int, guild_id: int = 0) -> Account:
+        key = (guild_id, user_id)
+        account = self._rows.get(key)
+        if account is not None:
+            self._rows.move_to_end(key)
+            self.hits += 1
+            return account
+
+        self.misses += 1
+        epoch = self._epoch
+        async with db.acquire() as conn:
+            row = await conn.fetchone(f'SELECT {ACCOUNT_COLUMNS} FROM users WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+        account = Account(*row) if row else NEW_ACCOUNT
+        if epoch == self._epoch:
+            self._store(key, account)
+        return account
+
+    def put(self, user_id: int, guild_id: int, row) -> None:
+        """Record the row a write RETURNED, or forget the user if it returned nothing."""
+        if row is None:
+            self.invalidate(user_id, guild_id)
+            return
+        self._epoch += 1
+        account = Account(*row)
+        self._store((guild_id, user_id), account)
+        leaderboards.account_changed(user_id, guild_id, account)
+
+    def invalidate(self, user_id: int, guild_id: int = 0) -> None:
+        self._epoch += 1
+        self._rows.pop((guild_id, user_id), None)
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._rows.clear()
+        leaderboards.invalidate()
+
+    def _store(self, key, account: Account) -> None:
+        if self.size <= 0:
+            return
+        self._rows[key] = account
+        self._rows.move_to_end(key)
+        if len(self._rows) > self.size:
+            self._rows.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._rows),
+            "capacity": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+accounts = AccountCache(settings.ACCOUNT_CACHE_SIZE)
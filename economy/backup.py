@@ -0,0 +1,108 @@
+import asyncio
+import gzip
+import os
+import pathlib
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+from economy import db
+import settings
+
+# Backups are named <database stem>-YYYYmmdd-HHMMSS.db, plus .gz when compressed,
+# so sorting the names sorts them by age.
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+class BackupResult(NamedTuple):
+    path: pathlib.Path
+    size: int  # bytes on disk
+    pages: int
+    duration: float  # seconds
+    worst_pause: float  # longest event loop stall seen while backing up, in seconds
+    removed: int  # old backups deleted by the retention count
+
+def _copy_pages(database: str, destination: str, pages_per_step: int) -> int:
+    """Copy the database with SQLite's online backup API. Runs in a worker thread."""
+    source = sqlite3.connect(f"{pathlib.Path(database).resolve().as_uri()}?mode=ro", uri=True, isolation_level=None)
+    target = sqlite3.connect(destination)
+    total = 0
+
+    def progress(status, remaining, count):
+        nonlocal total
+        total = count
+
+    try:
+        # Pin one read snapshot for the whole copy. Otherwise every commit from
+        # the writer restarts the backup, and a busy bot never finishes one.
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        source.backup(target, pages=pages_per_step, progress=progress, sleep=0.001)
+        source.execute('COMMIT')
+    finally:
+        target.close()
+        source.close()
+    return total
+
+def _compress(path: str) -> str:
+    compressed = f"{path}.gz"
+    with open(path, 'rb') as src, gzip.open(compressed, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.remove(path)
+    return compressed
+
+def _prune(directory: pathlib.Path, stem: str, keep: int) -> int:
+    if keep <= 0:
+        return 0
+    backups = sorted(p for p in directory.glob(f"{stem}-*.db*") if not p.name.endswith('.tmp'))
+    old = backups[:-keep]
+    for path in old:
+        path.unlink()
+    return len(old)
+
+async def _watch_loop(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Return the longest time the event loop was late to wake this task up."""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - started - interval)
+    return worst
+
+async def backup_database(directory: str = settings.BACKUP_DIR, compress: bool = settings.BACKUP_COMPRESS,
+                          keep: int = settings.BACKUP_KEEP, database: Optional[str] = None,
+                          pages_per_step: int = settings.BACKUP_PAGES_PER_STEP) -> BackupResult:
+    """Snapshot the SQLite database into ``directory`` while the bot keeps running.
+
+    The copy is made in small page steps on a worker thread, so the event loop
+    stays free. Only the newest ``keep`` backups are kept (0 keeps them all).
+    """
+    if db.backend is None or db.backend.name != "sqlite":
+        raise RuntimeError("Online backups are only available with the SQLite backend. Use pg_dump for PostgreSQL.")
+    database = database or db.backend.database
+    target_dir = pathlib.Path(directory)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    stem = pathlib.Path(database).stem
+    path = target_dir / f"{stem}-{datetime.utcnow().strftime(TIMESTAMP_FORMAT)}.db"
+    partial = f"{path}.tmp"
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_loop(stop))
+    started = time.perf_counter()
+    try:
+        pages = await loop.run_in_executor(None, _copy_pages, database, partial, pages_per_step)
+        os.replace(partial, path)
+        final = await loop.run_in_executor(None, _compress, str(path)) if compress else str(path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        stop.set()
+        worst_pause = await watcher
+    duration = time.perf_counter() - started
+
+    removed = await loop.run_in_executor(None, _prune, target_dir, stem, keep)
+    return BackupResult(pathlib.Path(final), os.path.getsize(final), pages, duration, worst_pause, removed)
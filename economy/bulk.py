@@ -0,0 +1,70 @@
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional
+from economy import writer
+from economy.accounts import accounts
+import settings
+
+# Owner tools that credit or debit thousands of users at once, e.g. event
+# rewards. ``entries`` is a list of (user_id, amount) pairs. Each chunk of
+# BULK_CHUNK_SIZE users is one executemany in one writer transaction, and
+# ``progress(done, total)`` is awaited after every chunk.
+
+Progress = Optional[Callable[[int, int], Awaitable[None]]]
+
+class BulkResult(NamedTuple):
+    users: int
+    chunks: int
+    duration: float  # seconds
+
+async def _grant_credits(conn, guild_id: int, chunk):
+    await conn.executemany('''INSERT INTO users (guild_id, user_id, balance) VALUES (?, ?, ?)
+                              ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = users.balance + excluded.balance''',
+                           [(guild_id, user_id, amount) for user_id, amount in chunk])
+
+async def _revoke_credits(conn, guild_id: int, chunk):
+    # Never below zero; users without a row have nothing to take
+    await conn.executemany('''UPDATE users SET balance = CASE WHEN balance > ? THEN balance - ? ELSE 0 END
+                              WHERE guild_id = ? AND user_id = ?''',
+                           [(amount, amount, guild_id, user_id) for user_id, amount in chunk])
+
+async def _grant_items(conn, guild_id: int, chunk, item_id: str):
+    await conn.executemany('''INSERT INTO user_inventory (guild_id, user_id, item_id, quantity) VALUES (?, ?, ?, ?)
+                              ON CONFLICT(guild_id, user_id, item_id) DO UPDATE SET quantity = user_inventory.quantity + excluded.quantity''',
+                           [(guild_id, user_id, item_id, quantity) for user_id, quantity in chunk])
+
+async def _revoke_items(conn, guild_id: int, chunk, item_id: str):
+    await conn.executemany('UPDATE user_inventory SET quantity = quantity - ? WHERE guild_id = ? AND user_id = ? AND item_id = ?',
+                           [(quantity, guild_id, user_id, item_id) for user_id, quantity in chunk])
+    await conn.executemany('DELETE FROM user_inventory WHERE guild_id = ? AND user_id = ? AND item_id = ? AND quantity <= 0',
+                           [(guild_id, user_id, item_id) for user_id, _ in chunk])
+
+async def _run_chunks(func, entries, guild_id: int, *args, progress: Progress = None,
+                      chunk_size: int = settings.BULK_CHUNK_SIZE) -> BulkResult:
+    started = time.perf_counter()
+    chunks = 0
+    for start in range(0, len(entries), chunk_size):
+        chunk = entries[start:start + chunk_size]
+        await writer.run(func, guild_id, chunk, *args)
+        chunks += 1
+        if progress is not None:
+            await progress(start + len(chunk), len(entries))
+    return BulkResult(len(entries), chunks, time.perf_counter() - started)
+
+async def grant_credits(entries, guild_id: int = 0, progress: Progress = None) -> BulkResult:
+    try:
+        return await _run_chunks(_grant_credits, entries, guild_id, progress=progress)
+    finally:
+        # Cheaper than invalidating thousands of users one by one
+        accounts.clear()
+
+async def revoke_credits(entries, guild_id: int = 0, progress: Progress = None) -> BulkResult:
+    try:
+        return await _run_chunks(_revoke_credits, entries, guild_id, progress=progress)
+    finally:
+        accounts.clear()
+
+async def grant_items(entries, item_id: str, guild_id: int = 0, progress: Progress = None) -> BulkResult:
+    return await _run_chunks(_grant_items, entries, guild_id, item_id, progress=progress)
+
+async def revoke_items(entries, item_id: str, guild_id: int = 0, progress: Progress = None) -> BulkResult:
+    return await _run_chunks(_revoke_items, entries, guild_id, item_id, progress=progress)
\ No newline at end of file
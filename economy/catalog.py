@@ -0,0 +1,89 @@
+from typing import Callable, NamedTuple, Optional
+from economy import db
+
+# The shop items and jobs change only when add_shop_item or add_job writes
+# them, so they are read once at startup and served from memory. Every change
+# bumps ``version``; values derived from the catalog (like rendered shop pages)
+# go through cached() and are rebuilt once the version moves on. Like the
+# account cache, this only sees this process's writes.
+
+# shop_items.tier of items added without one
+DEFAULT_TIER = 'common'
+
+class ShopItem(NamedTuple):
+    item_id: str
+    item_name: str
+    item_price: int
+    tier: str = DEFAULT_TIER
+    loot_weight: float = 1.0  # relative to the other items of its tier, 0 never drops
+
+class Job(NamedTuple):
+    job_id: str
+    job_name: str
+    job_description: str
+    job_pay: int
+    acceptance_chance: float
+
+class Catalog:
+
+    def __init__(self):
+        self.version = 0
+        self._items = {}
+        self._jobs = {}
+        self._item_list = []
+        self._job_list = []
+        self._tiers = {}
+        self._derived = {}
+
+    async def load(self):
+        """Read every shop item and job. Called once at startup."""
+        async with db.acquire() as conn:
+            items = await conn.fetchall('SELECT item_id, item_name, item_price, tier, loot_weight FROM shop_items')
+            jobs = await conn.fetchall('SELECT job_id, job_name, job_description, job_pay, acceptance_chance FROM jobs')
+            tiers = await conn.fetchall('SELECT tier, weight FROM loot_tiers')
+        self._items = {row[0]: ShopItem(*row) for row in items}
+        self._jobs = {row[0]: Job(*row) for row in jobs}
+        self._tiers = {tier: weight for tier, weight in tiers}
+        self._changed()
+
+    def item(self, item_id: str) -> Optional[ShopItem]:
+        return self._items.get(item_id)
+
+    def items(self) -> list:
+        """Every shop item, cheapest first."""
+        return self._item_list
+
+    def job(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list:
+        """Every job, best paid first."""
+        return self._job_list
+
+    def tiers(self) -> dict:
+        """{tier: weight} of the loot tiers."""
+        return self._tiers
+
+    def put_item(self, item: ShopItem):
+        self._items[item.item_id] = item
+        self._changed()
+
+    def put_job(self, job: Job):
+        self._jobs[job.job_id] = job
+        self._changed()
+
+    def cached(self, key, build: Callable):
+        """``build()``, computed once per catalog version and ``key``."""
+        entry = self._derived.get(key)
+        if entry is None or entry[0] != self.version:
+            entry = (self.version, build())
+            self._derived[key] = entry
+        return entry[1]
+
+    def _changed(self):
+        self._item_list = sorted(self._items.values(), key=lambda item: (item.item_price, item.item_name))
+        self._job_list = sorted(self._jobs.values(), key=lambda job: (-job.job_pay, job.job_name))
+        self._derived.clear()
+        self.version += 1
+
+catalog = Catalog()
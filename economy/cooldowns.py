@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+from economy import db, writer
+
+# Every economy cooldown (daily rewards, work shifts, job applications,
+# resigning) lives in the cooldowns table, keyed by (user_id, action, scope)
+# with the expiry as Unix seconds. The live cooldowns are kept in memory, so
+# checking one never touches the database; changes are written behind by
+# flush(), which the Database cog runs every few seconds and on shutdown.
+# scope is the guild_id of the economy the cooldown belongs to, 0 for
+# cooldowns that are not per economy.
+
+def _now() -> int:
+    return int(time.time())
+
+class CooldownStore:
+
+    def __init__(self):
+        self._expiry = {}
+        self._dirty = set()
+
+    async def load(self):
+        """Read every cooldown that has not expired yet. Called once at startup."""
+        async with db.acquire() as conn:
+            rows = await conn.fetchall('SELECT user_id, action, scope, expires_at FROM cooldowns WHERE expires_at > ?', (_now(),))
+        loaded = {(user_id, action, scope): expires_at for user_id, action, scope, expires_at in rows}
+        # Anything set before loading is newer than the database
+        loaded.update(self._expiry)
+        self._expiry = loaded
+
+    def remaining(self, user_id: int, action: str, scope: int = 0) -> timedelta:
+        """How long until ``user_id`` can do ``action`` again; zero if they can now."""
+        expires_at = self._expiry.get((user_id, action, scope))
+        if expires_at is None:
+            return timedelta(0)
+        left = expires_at - _now()
+        return timedelta(seconds=left) if left > 0 else timedelta(0)
+
+    def start(self, user_id: int, action: str, duration: timedelta, scope: int = 0):
+        key = (user_id, action, scope)
+        self._expiry[key] = _now() + int(duration.total_seconds())
+        self._dirty.add(key)
+
+    def try_start(self, user_id: int, action: str, duration: timedelta, scope: int = 0) -> timedelta:
+        """Start the cooldown unless it is still running.
+
+        Returns zero if it was started, otherwise the time left. Checking and
+        starting happen without yielding, so two commands cannot both pass.
+        """
+        left = self.remaining(user_id, action, scope)
+        if not left:
+            self.start(user_id, action, duration, scope)
+        return left
+
+    def clear(self, user_id: int, action: str, scope: int = 0):
+        key = (user_id, action, scope)
+        if self._expiry.pop(key, None) is not None:
+            self._dirty.add(key)
+
+    async def flush(self) -> int:
+        """Write the cooldowns changed since the last flush and return how many there were."""
+        if not self._dirty:
+            return 0
+        keys, self._dirty = self._dirty, set()
+        now = _now()
+        upserts = []
+        deletes = []
+        for key in keys:
+            expires_at = self._expiry.get(key)
+            if expires_at is None:
+                deletes.append(key)
+            else:
+                upserts.append((*key, expires_at))
+        try:
+            await writer.run(_write, upserts, deletes)
+        except Exception:
+            # Keep them for the next flush, unless they changed again meanwhile
+            self._dirty.update(keys)
+            raise
+        # Expired cooldowns are no different from missing ones
+        for key in [key for key, expires_at in self._expiry.items() if expires_at <= now]:
+            del self._expiry[key]
+        return len(keys)
+
+    def __len__(self):
+        return len(self._expiry)
+
+async def _write(conn, upserts, deletes):
+    if upserts:
+        await conn.executemany('''INSERT INTO cooldowns (user_id, action, scope, expires_at) VALUES (?, ?, ?, ?)
+                                  ON CONFLICT(user_id, action, scope) DO UPDATE SET expires_at = excluded.expires_at''', upserts)
+    if deletes:
+        await conn.executemany('DELETE FROM cooldowns WHERE user_id = ? AND action = ? AND scope = ?', deletes)
+
+cooldowns = CooldownStore()
@@ -0,0 +1,391 @@
+import asqlite
+import asyncio
+import contextlib
+import contextvars
+import functools
+import math
+import pathlib
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from economy import profiler
+import settings
+
+# Named storage profiles, applied to the writer and to every pooled reader.
+# asqlite already switches each connection to WAL; the profiles pin it anyway
+# so the journal mode does not depend on the driver.
+PROFILES = {
+    # Every commit is fsynced, nothing is lost on power failure.
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -2000,  # 2 MiB
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+    # WAL with synchronous=NORMAL can only lose the last transactions on power loss, never corrupt.
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,  # 16 MiB
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # No fsync at all, for throwaway or easily rebuilt databases.
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -64000,  # 64 MiB
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+    },
+}
+
+def apply_profile(conn: sqlite3.Connection, profile: str) -> None:
+    """Apply the PRAGMAs of a storage profile to a raw sqlite3 connection."""
+    try:
+        pragmas = PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown database profile {profile!r}. Use one of: {', '.join(PROFILES)}.") from None
+    for pragma, value in pragmas.items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
+
+# The economy modules only talk to the database through the connection
+# interface below (fetchone, fetchall, execute, executemany, execute_bulk).
+# Queries use ``?`` placeholders and SQL that SQLite and PostgreSQL both
+# understand, so the same helpers run against either backend. A backend owns a pool of read
+# connections and the single connection economy.writer sends writes through.
+# PostgreSQL infers a parameter's type from its context, so a ``?`` that is
+# not compared with or stored into a column (a CASE branch, a bare SELECT ?,
+# a float rate multiplying an integer) is written as CAST(? AS <type>).
+# PostgreSQL rounds when it casts a float to an integer and SQLite truncates,
+# so credits computed from a float are cast from TRUNC(...).
+
+# Statements worth an EXPLAIN when they turn out slow
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+def _profiled(count_rows, many: bool = False):
+    """Time a connection method with economy.profiler. ``count_rows`` turns its result into a row count."""
+    def decorate(method):
+        @functools.wraps(method)
+        async def wrapper(self, sql: str, params=()):
+            if not profiler.enabled:
+                return await method(self, sql, params)
+            if many:
+                params = list(params)
+            started = time.perf_counter()
+            result = await method(self, sql, params)
+            elapsed = time.perf_counter() - started
+            rows = count_rows(result)
+            if profiler.record(sql, elapsed, rows):
+                plan = None
+                if sql.lstrip().upper().startswith(_EXPLAINABLE) and (params or not many):
+                    with contextlib.suppress(Exception):
+                        plan = await self._explain(sql, params[0] if many else params)
+                profiler.log_slow(sql, elapsed, rows, plan)
+            return result
+        return wrapper
+    return decorate
+
+def _found(row) -> int:
+    return int(row is not None)
+
+def _changed(rowcount: int) -> int:
+    return max(rowcount, 0)
+
+def _add_math_functions(conn: sqlite3.Connection) -> None:
+    """Give SQLite builds without the math functions the ones the shared SQL uses."""
+    try:
+        conn.execute('SELECT TRUNC(1.5)')
+    except sqlite3.OperationalError:
+        conn.create_function('TRUNC', 1, lambda value: None if value is None else math.trunc(value), deterministic=True)
+
+class SQLiteConnection:
+    """Wraps an asqlite connection."""
+
+    def __init__(self, conn: asqlite.Connection):
+        self.raw = conn
+
+    @_profiled(_found)
+    async def fetchone(self, sql: str, params=()):
+        return await self.raw.fetchone(sql, tuple(params))
+
+    @_profiled(len)
+    async def fetchall(self, sql: str, params=()):
+        return await self.raw.fetchall(sql, tuple(params))
+
+    @_profiled(_changed)
+    async def execute(self, sql: str, params=()) -> int:
+        """Run a statement and return the number of rows it changed."""
+        async with self.raw.execute(sql, tuple(params)) as cursor:
+            return cursor.get_cursor().rowcount
+
+    @_profiled(_changed, many=True)
+    async def executemany(self, sql: str, seq_of_params) -> int:
+        async with self.raw.executemany(sql, [tuple(params) for params in seq_of_params]) as cursor:
+            return cursor.get_cursor().rowcount
+
+    async def execute_bulk(self, sql: str, params=()) -> int:
+        """Like execute(), for statements that touch a large part of a table."""
+        return await self.execute(sql, params)
+
+    async def _explain(self, sql: str, params) -> str:
+        rows = await self.raw.fetchall(f'EXPLAIN QUERY PLAN {sql}', tuple(params))
+        return '; '.join(row[3] for row in rows)
+
+
+class SQLiteWriterConnection(SQLiteConnection):
+    """The writer's own sqlite3 connection.
+
+    Statements inside a write batch take microseconds, so they run inline
+    instead of paying a thread hop each; COMMIT, which may fsync and
+    checkpoint the WAL, runs on a dedicated thread.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.raw = conn
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="space-db-writer")
+
+    @_profiled(_found)
+    async def fetchone(self, sql: str, params=()):
+        return self.raw.execute(sql, params).fetchone()
+
+    @_profiled(len)
+    async def fetchall(self, sql: str, params=()):
+        return self.raw.execute(sql, params).fetchall()
+
+    @_profiled(_changed)
+    async def execute(self, sql: str, params=()) -> int:
+        if sql == 'COMMIT':
+            await self.run_in_thread(lambda conn: conn.execute(sql))
+            return -1
+        return self.raw.execute(sql, params).rowcount
+
+    async def run_in_thread(self, func, *args):
+        """Run ``func(sqlite3_connection, *args)`` on the writer thread, for slow statements like VACUUM or ANALYZE."""
+        # In the caller's context, so triggers calling economy_command() see its command
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, context.run, func, self.raw, *args)
+
+    @_profiled(_changed, many=True)
+    async def executemany(self, sql: str, seq_of_params) -> int:
+        return self.raw.executemany(sql, seq_of_params).rowcount
+
+    @_profiled(_changed)
+    async def execute_bulk(self, sql: str, params=()) -> int:
+        # Set-wide statements can take seconds, too long to block the event loop
+        return await self.run_in_thread(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def _explain(self, sql: str, params) -> str:
+        return '; '.join(row[3] for row in self.raw.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall())
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.raw.close)
+        self._executor.shutdown(wait=True)
+
+
+class SQLiteBackend:
+    name = "sqlite"
+    begin = "BEGIN IMMEDIATE"
+
+    def __init__(self, database: str, profile: str):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown database profile {profile!r}. Use one of: {', '.join(PROFILES)}.")
+        self.database = database
+        self.profile = profile
+        self.pool: Optional[asqlite.Pool] = None
+        self.writer: Optional[SQLiteWriterConnection] = None
+
+    def _init_reader(self, conn: sqlite3.Connection) -> None:
+        apply_profile(conn, self.profile)
+        _add_math_functions(conn)
+        conn.execute('PRAGMA query_only = 1')
+
+    def _connect_writer(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON')
+        # The command behind the current write, for the ledger triggers (see economy/ledger.py)
+        conn.create_function('economy_command', 0, profiler.current_command.get)
+        _add_math_functions(conn)
+        apply_profile(conn, self.profile)
+        return conn
+
+    async def open(self, size: int):
+        # The writer goes first: it creates the file the read-only pool opens
+        self.writer = SQLiteWriterConnection(self._connect_writer())
+        reader_uri = f"{pathlib.Path(self.database).resolve().as_uri()}?mode=ro"
+        self.pool = await asqlite.create_pool(reader_uri, size=size, uri=True, init=self._init_reader)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+        if self.writer is not None:
+            await self.writer.close()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        async with self.pool.acquire() as conn:
+            yield SQLiteConnection(conn)
+
+    def translate_ddl(self, statement: str) -> str:
+        return statement
+
+    async def set_command(self, conn, command: Optional[str]):
+        # economy_command() reads profiler.current_command directly
+        pass
+
+
+def _numbered_placeholders(sql: str) -> str:
+    """Rewrite ``?`` placeholders as ``$1, $2, ...``, leaving quoted text alone."""
+    out = []
+    number = 0
+    quote = None
+    for char in sql:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == '?':
+            number += 1
+            out.append(f'${number}')
+            continue
+        out.append(char)
+    return ''.join(out)
+
+
+class PostgresConnection:
+    """Wraps an asyncpg connection behind the same interface as SQLiteConnection."""
+
+    _statements = {}
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def _sql(self, sql: str) -> str:
+        translated = self._statements.get(sql)
+        if translated is None:
+            translated = self._statements[sql] = _numbered_placeholders(sql)
+        return translated
+
+    @_profiled(_found)
+    async def fetchone(self, sql: str, params=()):
+        return await self.raw.fetchrow(self._sql(sql), *params)
+
+    @_profiled(len)
+    async def fetchall(self, sql: str, params=()):
+        return await self.raw.fetch(self._sql(sql), *params)
+
+    @_profiled(_changed)
+    async def execute(self, sql: str, params=()) -> int:
+        """Run a statement and return the number of rows it changed."""
+        status = await self.raw.execute(self._sql(sql), *params)
+        # asyncpg returns the command tag, e.g. "UPDATE 3" or "INSERT 0 1"
+        count = status.rsplit(' ', 1)[-1]
+        return int(count) if count.isdigit() else -1
+
+    @_profiled(_changed, many=True)
+    async def executemany(self, sql: str, seq_of_params) -> int:
+        seq_of_params = [tuple(params) for params in seq_of_params]
+        await self.raw.executemany(self._sql(sql), seq_of_params)
+        return len(seq_of_params)
+
+    async def execute_bulk(self, sql: str, params=()) -> int:
+        """Like execute(), for statements that touch a large part of a table."""
+        return await self.execute(sql, params)
+
+    async def _explain(self, sql: str, params) -> str:
+        rows = await self.raw.fetch(self._sql(f'EXPLAIN {sql}'), *params)
+        return '; '.join(row[0].strip() for row in rows)
+
+
+class PostgresBackend:
+    name = "postgres"
+    begin = "BEGIN"
+
+    # SQLite column types that need a wider or different PostgreSQL type
+    _DDL_TYPES = [
+        ("INTEGER PRIMARY KEY AUTOINCREMENT", "BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY"),
+        ("INTEGER", "BIGINT"),
+        ("REAL", "DOUBLE PRECISION"),
+    ]
+
+    def __init__(self, dsn: str):
+        if not dsn:
+            raise ValueError("DB_BACKEND=postgres needs POSTGRES_DSN to be set.")
+        self.dsn = dsn
+        self.pool = None
+        self.writer: Optional[PostgresConnection] = None
+
+    async def open(self, size: int):
+        try:
+            import asyncpg
+        except ImportError:
+            raise RuntimeError("DB_BACKEND=postgres needs the asyncpg package (pip install asyncpg).") from None
+        self.writer = PostgresConnection(await asyncpg.connect(self.dsn))
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=size)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+        if self.writer is not None:
+            await self.writer.raw.close()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        async with self.pool.acquire() as conn:
+            yield PostgresConnection(conn)
+
+    async def set_command(self, conn, command: Optional[str]):
+        """Expose the command behind the current write to the ledger trigger, until the transaction ends."""
+        await conn.execute("SELECT set_config('economy.command', ?, true)", (command or '',))
+
+    def translate_ddl(self, statement: str) -> str:
+        for sqlite_type, postgres_type in self._DDL_TYPES:
+            statement = statement.replace(sqlite_type, postgres_type)
+        return statement
+
+
+backend = None
+
+async def init_pool(database: str = settings.DATABASE, size: int = settings.DB_POOL_SIZE, profile: str = settings.DB_PROFILE,
+                    backend_name: str = settings.DB_BACKEND):
+    """Open the configured storage backend: the writer connection and the read pool.
+
+    Safe to call more than once. ``database`` and ``profile`` only apply to
+    SQLite; PostgreSQL connects to POSTGRES_DSN.
+    """
+    global backend
+    if backend is None:
+        if backend_name == "postgres":
+            new_backend = PostgresBackend(settings.POSTGRES_DSN)
+        elif backend_name == "sqlite":
+            new_backend = SQLiteBackend(database, profile)
+        else:
+            raise ValueError(f"Unknown database backend {backend_name!r}. Use 'sqlite' or 'postgres'.")
+        await new_backend.open(size)
+        backend = new_backend
+    return backend
+
+async def close_pool():
+    """Close every connection, waiting for in-flight queries to be released."""
+    global backend
+    if backend is not None:
+        await backend.close()
+        backend = None
+
+def acquire():
+    """Borrow a read connection from the pool.
+
+    Use as ``async with db.acquire() as conn:``; the connection goes back to
+    the pool when the block exits. SQLite readers are read-only and, under
+    WAL, never wait for the writer.
+    """
+    if backend is None:
+        raise RuntimeError("The database pool has not been initialised. Call init_pool() first.")
+    return backend.acquire()
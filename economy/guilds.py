@@ -0,0 +1,37 @@
+from economy import db, writer
+from datetime import datetime
+from typing import Optional
+import discord
+
+# Every economy row carries a guild_id. Guilds that opted in to their own
+# economy use their id; everyone else shares the global economy, guild 0.
+GLOBAL_ECONOMY = 0
+
+# Opted-in guilds, loaded once at startup and kept in sync by the functions below
+_enabled = set()
+
+async def load_guild_economies():
+    async with db.acquire() as conn:
+        rows = await conn.fetchall('SELECT guild_id FROM guild_economies')
+    _enabled.clear()
+    _enabled.update(row[0] for row in rows)
+
+def economy_scope(guild: Optional[discord.abc.Snowflake]) -> int:
+    """The guild_id economy rows are stored under for commands run in ``guild``."""
+    if guild is not None and guild.id in _enabled:
+        return guild.id
+    return GLOBAL_ECONOMY
+
+def has_guild_economy(guild_id: int) -> bool:
+    return guild_id in _enabled
+
+async def enable_guild_economy(guild_id: int):
+    """Give a guild its own economy. Members start from scratch there."""
+    await writer.execute('INSERT INTO guild_economies (guild_id, enabled_at) VALUES (?, ?) ON CONFLICT(guild_id) DO NOTHING',
+                         (guild_id, datetime.utcnow().isoformat()))
+    _enabled.add(guild_id)
+
+async def disable_guild_economy(guild_id: int):
+    """Switch a guild back to the global economy. Its own rows are kept for if it opts in again."""
+    await writer.execute('DELETE FROM guild_economies WHERE guild_id = ?', (guild_id,))
+    _enabled.discard(guild_id)
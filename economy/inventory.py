@@ -1,26 +1,80 @@
-import asqlite
+from typing import NamedTuple
+from economy import db, writer
+from economy.accounts import accounts, ACCOUNT_COLUMNS
 
-async def get_inventory(user_id: int):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('''SELECT shop_items.item_name, shop_items.item_id, user_inventory.quantity
-                                   FROM user_inventory
-                                   JOIN shop_items ON user_inventory.item_id = shop_items.item_id
-                                   WHERE user_inventory.user_id = ?''', (user_id,))
-            inventory = await cursor.fetchall()
-    return inventory
+# Items sell back for this share of their shop price
+SELL_RATE = 0.75
 
+class InventoryItem(NamedTuple):
+    item_name: str
+    item_id: str
+    quantity: int
+    item_price: int
+    sell_price: int
 
+# Everything the inventory and sell commands show, in one join
+_INVENTORY = '''SELECT shop_items.item_name, shop_items.item_id, user_inventory.quantity,
+                     shop_items.item_price, CAST(TRUNC(shop_items.item_price * CAST(? AS DOUBLE PRECISION)) AS BIGINT)
+              FROM user_inventory
+              JOIN shop_items ON user_inventory.item_id = shop_items.item_id
+              WHERE user_inventory.guild_id = ? AND user_inventory.user_id = ?'''
 
+async def get_inventory(user_id: int, guild_id: int = 0) -> list:
+    """The user's items as InventoryItems, with their prices, ordered by item id."""
+    async with db.acquire() as conn:
+        rows = await conn.fetchall(f'{_INVENTORY} ORDER BY user_inventory.item_id', (SELL_RATE, guild_id, user_id))
+    return [InventoryItem(*row) for row in rows]
 
+async def get_inventory_item(user_id: int, item_id: str, guild_id: int = 0):
+    """One InventoryItem of the user, matching ``item_id`` case-insensitively, or None."""
+    async with db.acquire() as conn:
+        row = await conn.fetchone(f'{_INVENTORY} AND LOWER(user_inventory.item_id) = LOWER(?)', (SELL_RATE, guild_id, user_id, item_id))
+    return InventoryItem(*row) if row else None
 
-async def remove_item(user_id: int, item_id: str, quantity: int) -> None:
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT quantity FROM user_inventory WHERE user_id = ? AND item_id = ?', (user_id, item_id))
-            result = await cursor.fetchone()
-            if result and result[0] >= quantity:
-                await cursor.execute('UPDATE user_inventory SET quantity = quantity - ? WHERE user_id = ? AND item_id = ?', (quantity, user_id, item_id))
-                if result[0] - quantity == 0:
-                    await cursor.execute('DELETE FROM user_inventory WHERE user_id = ? AND item_id = ?', (user_id, item_id))
-                await conn.commit()
\ No newline at end of file
+async def get_item_quantity(user_id: int, item_id: str, guild_id: int = 0) -> int:
+    async with db.acquire() as conn:
+        row = await conn.fetchone('SELECT quantity FROM user_inventory WHERE guild_id = ? AND user_id = ? AND item_id = ?', (guild_id, user_id, item_id))
+    return row[0] if row else 0
+
+async def get_item_quantities(user_id: int, item_ids, guild_id: int = 0) -> dict:
+    """How many of each of ``item_ids`` the user has, in one query. Items they lack are left out."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    async with db.acquire() as conn:
+        rows = await conn.fetchall(f'''SELECT item_id, quantity FROM user_inventory
+                                       WHERE guild_id = ? AND user_id = ? AND item_id IN ({', '.join('?' for _ in item_ids)})''',
+                                   (guild_id, user_id, *item_ids))
+    return {item_id: quantity for item_id, quantity in rows}
+
+_REMOVE = 'UPDATE user_inventory SET quantity = quantity - ? WHERE guild_id = ? AND user_id = ? AND item_id = ? AND quantity >= ?'
+_DROP_EMPTY = 'DELETE FROM user_inventory WHERE guild_id = ? AND user_id = ? AND item_id = ? AND quantity <= 0'
+
+async def remove_item(user_id: int, item_id: str, quantity: int, guild_id: int = 0) -> bool:
+    """Take ``quantity`` of an item from the user. False, and nothing removed, if they have fewer."""
+    removed, _ = await writer.execute_many(
+        (_REMOVE, (quantity, guild_id, user_id, item_id, quantity)),
+        (_DROP_EMPTY, (guild_id, user_id, item_id)),
+    )
+    return removed > 0
+
+async def sell_item(user_id: int, item_id: str, price: int, guild_id: int = 0) -> bool:
+    """Take one of an item from the user and pay them ``price``, in one write.
+
+    False, and nothing paid, if they no longer have the item.
+    """
+    async def sell(conn):
+        # The check before may be stale (e.g. an owner revoked the item), so only pay for what was removed
+        if await conn.execute(_REMOVE, (1, guild_id, user_id, item_id, 1)) == 0:
+            return None
+        await conn.execute(_DROP_EMPTY, (guild_id, user_id, item_id))
+        return await conn.fetchone(f'''INSERT INTO users (guild_id, user_id, balance) VALUES (?, ?, ?)
+                                       ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = users.balance + excluded.balance
+                                       RETURNING {ACCOUNT_COLUMNS}''',
+                                   (guild_id, user_id, price))
+
+    account = await writer.run(sell)
+    if account is None:
+        return False
+    accounts.put(user_id, guild_id, account)
+    return True
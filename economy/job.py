@@ -1,116 +1,220 @@
-import asqlite
+from economy import db, writer
+from economy.accounts import accounts, ACCOUNT_COLUMNS
+from economy.cooldowns import cooldowns
+from economy.catalog import catalog, Job
 from datetime import datetime, timedelta
 import random
 
+# How long a user waits before applying for the same job again
+APPLICATION_COOLDOWN = timedelta(hours=1)
+# How long a user waits between two shifts of work
+WORK_COOLDOWN = timedelta(hours=1)
+# How long a new hire stays before they may resign
+RESIGN_COOLDOWN = timedelta(hours=2)
+
+# A job pays job_pay credits per hour, counted from user_jobs.accrued_at.
+# Nothing is paid out on a schedule: the income is computed when it is read
+# and folded into the balance, moving accrued_at forward, when the user
+# works, resigns or checks their balance. Income left unsettled for longer
+# than MAX_ACCRUAL stops growing. A user has one job across every economy,
+# so it pays into the economy it was taken in (user_jobs.guild_id), wherever
+# the settlement happens.
+MAX_ACCRUAL = timedelta(hours=24)
+
 async def add_job(job_id: str, job_name: str, job_description: str, job_pay: int, acceptance_chance: float):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('''INSERT OR REPLACE INTO jobs (job_id, job_name, job_description, job_pay, acceptance_chance)
-                                    VALUES (?, ?, ?, ?, ?)''',
-                                 (job_id, job_name, job_description, job_pay, acceptance_chance))
-        await conn.commit()
-
-
-async def get_jobs():
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT job_id, job_name, job_description, job_pay, acceptance_chance FROM jobs')
-            jobs = await cursor.fetchall()
-    return jobs
-
-async def apply_for_job(user_id: int, job_id: str):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            # Check if user already has a job
-            await cursor.execute('SELECT job_id FROM user_jobs WHERE user_id = ?', (user_id,))
-            current_job = await cursor.fetchone()
-            if current_job:
-                return False, "You already have a job. Resign before applying for a new one."
-
-            # Check cooldown
-            now = datetime.utcnow()
-            await cursor.execute('SELECT application_time FROM job_applications WHERE user_id = ? AND job_id = ?', (user_id, job_id))
-            result = await cursor.fetchone()
-            if result:
-                last_application_time = datetime.fromisoformat(result[0])
-                if now - last_application_time < timedelta(hours=1):
-                    remaining_time = timedelta(hours=1) - (now - last_application_time)
-                    return False, f"You need to wait **{str(remaining_time).split('.')[0]}** before applying for this job again."
-
-            # Log the application attempt
-            await cursor.execute('INSERT INTO job_applications (user_id, job_id, application_time) VALUES (?, ?, ?)',
-                                 (user_id, job_id, now.isoformat()))
-
-            # Get the job's acceptance chance
-            await cursor.execute('SELECT acceptance_chance FROM jobs WHERE job_id = ?', (job_id,))
-            job = await cursor.fetchone()
-            if not job:
-                return False, "Job not found."
-
-            acceptance_chance = job[0]
-            if random.random() <= acceptance_chance:
-                await cursor.execute('INSERT INTO user_jobs (user_id, job_id, start_time) VALUES (?, ?, ?)',
-                                     (user_id, job_id, now.isoformat()))
-                await conn.commit()
-                return True, "Congratulations! You've been accepted for the job."
-            else:
-                await conn.commit()
-                return False, "Unfortunately, you were not accepted for the job."
-
-
-
-async def resign_from_job(user_id: int):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT start_time FROM user_jobs WHERE user_id = ?', (user_id,))
-            job = await cursor.fetchone()
-            if not job:
-                return False, "You don't have a job to resign from."
-
-            start_time = datetime.fromisoformat(job[0])
-            now = datetime.utcnow()
-            if now - start_time < timedelta(hours=2):
-                return False, "You can only resign 2 hours after applying for the job."
-
-            await cursor.execute('DELETE FROM user_jobs WHERE user_id = ?', (user_id,))
-            await conn.commit()
-            return True, "You have successfully resigned from your job."
+    await writer.execute('''INSERT INTO jobs (job_id, job_name, job_description, job_pay, acceptance_chance)
+                            VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT(job_id) DO UPDATE SET job_name = excluded.job_name, job_description = excluded.job_description,
+                                job_pay = excluded.job_pay, acceptance_chance = excluded.acceptance_chance''',
+                         (job_id, job_name, job_description, job_pay, acceptance_chance))
+    catalog.put_job(Job(job_id, job_name, job_description, job_pay, acceptance_chance))
+
+
+async def get_jobs() -> list:
+    """Every job as (job_id, job_name, job_description, job_pay, acceptance_chance), best paid first."""
+    return catalog.jobs()
+
+async def apply_for_job(user_id: int, job_id: str, guild_id: int = 0):
+    job = catalog.job(job_id)
+    started = []  # cooldowns this application started
+
+    async def apply(conn):
+        # Check if user already has a job
+        current_job = await conn.fetchone('SELECT job_id FROM user_jobs WHERE user_id = ?', (user_id,))
+        if current_job:
+            return False, "You already have a job. Resign before applying for a new one."
+
+        # Check cooldown
+        remaining_time = cooldowns.remaining(user_id, f'apply:{job_id}')
+        if remaining_time:
+            return False, f"You need to wait **{remaining_time}** before applying for this job again."
+
+        if not job:
+            return False, "Job not found."
+
+        # Log the application attempt
+        now = datetime.utcnow()
+        await conn.execute('INSERT INTO users (guild_id, user_id, balance) VALUES (?, ?, 0) ON CONFLICT(guild_id, user_id) DO NOTHING', (guild_id, user_id))
+        cooldowns.start(user_id, f'apply:{job_id}', APPLICATION_COOLDOWN)
+        started.append(f'apply:{job_id}')
+
+        acceptance_chance = job.acceptance_chance
+        if random.random() <= acceptance_chance:
+            await conn.execute('INSERT INTO user_jobs (user_id, job_id, start_time, accrued_at, guild_id) VALUES (?, ?, ?, ?, ?)',
+                               (user_id, job_id, now.isoformat(), now.isoformat(), guild_id))
+            cooldowns.start(user_id, 'resign', RESIGN_COOLDOWN)
+            started.append('resign')
+            return True, "Congratulations! You've been accepted for the job."
+        else:
+            return False, "Unfortunately, you were not accepted for the job."
+
+    try:
+        result = await writer.run(apply)
+    except Exception:
+        # The application was rolled back, so it must not hold the user back either
+        for action in started:
+            cooldowns.clear(user_id, action)
+        raise
+    accounts.invalidate(user_id, guild_id)
+    return result
+
+
+
+def accrued_income(job_pay: int, accrued_at: datetime, now: datetime):
+    """Credits earned since ``accrued_at``, and the checkpoint to store once they are paid.
+
+    The checkpoint only moves by the time actually paid for, so fractions of
+    a credit carry over to the next settlement.
+    """
+    elapsed = now - accrued_at
+    if job_pay <= 0 or elapsed <= timedelta(0):
+        return 0, accrued_at
+    if elapsed >= MAX_ACCRUAL:
+        return int(job_pay * (MAX_ACCRUAL / timedelta(hours=1))), now
+    earned = int(job_pay * (elapsed / timedelta(hours=1)))
+    return earned, accrued_at + timedelta(hours=earned / job_pay)
+
+async def _get_accrual(conn, user_id: int):
+    return await conn.fetchone('''SELECT jobs.job_pay, user_jobs.accrued_at, user_jobs.guild_id
+                                  FROM user_jobs
+                                  JOIN jobs ON user_jobs.job_id = jobs.job_id
+                                  WHERE user_jobs.user_id = ?''', (user_id,))
+
+async def _settle(conn, user_id: int, now: datetime, job_points: int = 0):
+    """Fold a user's accrued income (and ``job_points``) into their account in the job's economy in one statement.
+
+    Returns (credits paid, the job's guild_id, account row), with no row if
+    nothing changed.
+    """
+    job = await _get_accrual(conn, user_id)
+    if not job:
+        return 0, None, None
+    job_pay, accrued_at, guild_id = job
+    earned, checkpoint = accrued_income(job_pay, datetime.fromisoformat(accrued_at), now)
+    if earned:
+        await conn.execute('UPDATE user_jobs SET accrued_at = ? WHERE user_id = ?', (checkpoint.isoformat(), user_id))
+    if not earned and not job_points:
+        return 0, guild_id, None
+    row = await conn.fetchone(f'''INSERT INTO users (guild_id, user_id, balance, job_points) VALUES (?, ?, ?, ?)
+                                  ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = users.balance + excluded.balance,
+                                      job_points = users.job_points + excluded.job_points
+                                  RETURNING {ACCOUNT_COLUMNS}''',
+                              (guild_id, user_id, earned, job_points))
+    return earned, guild_id, row
+
+async def get_pending_income(user_id: int) -> int:
+    """Income a user's job accrued that has not been added to their balance yet."""
+    async with db.acquire() as conn:
+        job = await _get_accrual(conn, user_id)
+    if not job:
+        return 0
+    return accrued_income(job[0], datetime.fromisoformat(job[1]), datetime.utcnow())[0]
+
+async def settle_income(user_id: int):
+    """Pay a user the income their job accrued so far.
+
+    Returns (credits paid, guild_id of the economy they went to); the economy
+    is None if nothing was paid.
+    """
+    if not await get_pending_income(user_id):
+        return 0, None
+    earned, guild_id, row = await writer.run(_settle, user_id, datetime.utcnow())
+    if row is None:
+        return 0, None
+    accounts.put(user_id, guild_id, row)
+    return earned, guild_id
+
+async def resign_from_job(user_id: int, guild_id: int = 0):
+    async def resign(conn):
+        job = await conn.fetchone('SELECT job_id FROM user_jobs WHERE user_id = ?', (user_id,))
+        if not job:
+            return False, "You don't have a job to resign from.", None, None
+
+        if cooldowns.remaining(user_id, 'resign'):
+            return False, "You can only resign 2 hours after applying for the job.", None, None
+        now = datetime.utcnow()
+
+        # Pay out what the job earned up to now before it is gone
+        earned, job_guild_id, row = await _settle(conn, user_id, now)
+        await conn.execute('DELETE FROM user_jobs WHERE user_id = ?', (user_id,))
+        message = "You have successfully resigned from your job."
+        if earned:
+            where = "your balance" if job_guild_id == guild_id else "your balance in the economy you took the job in"
+            message += f" Your final pay of {earned} credits has been added to {where}."
+        return True, message, job_guild_id, row
+
+    success, message, job_guild_id, row = await writer.run(resign)
+    if row is not None:
+        accounts.put(user_id, job_guild_id, row)
+    return success, message
 
 async def get_user_job(user_id: int):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('''SELECT jobs.job_name, jobs.job_description, jobs.job_pay
-                                   FROM user_jobs
-                                   JOIN jobs ON user_jobs.job_id = jobs.job_id
-                                   WHERE user_jobs.user_id = ?''', (user_id,))
-            job = await cursor.fetchone()
-    return job
-
-
-async def get_last_work_time(user_id):
-    """Fetch the last work time from the database."""
-    async with asqlite.connect('space.db') as db:
-        cursor = await db.execute('SELECT last_work_time FROM user_jobs WHERE user_id = ?', (user_id,))
-        result = await cursor.fetchone()
-        return datetime.fromisoformat(result[0]) if result and result[0] else None
-
-async def update_last_work_time(user_id):
-    """Update the last work time in the database."""
-    now = datetime.utcnow().isoformat()
-    async with asqlite.connect('space.db') as db:
-        await db.execute('UPDATE user_jobs SET last_work_time = ? WHERE user_id = ?', (now, user_id))
-        await db.commit()
-
-
-async def update_job_points(user_id: int):
-    """Update job points for the user with a random amount."""
+    async with db.acquire() as conn:
+        return await conn.fetchone('''SELECT jobs.job_name, jobs.job_description, jobs.job_pay
+                                      FROM user_jobs
+                                      JOIN jobs ON user_jobs.job_id = jobs.job_id
+                                      WHERE user_jobs.user_id = ?''', (user_id,))
+
+async def get_work_status(user_id: int):
+    """(job_name, job_pay, time until the next shift) of the user's job, or None if they have none."""
+    async with db.acquire() as conn:
+        row = await conn.fetchone('''SELECT jobs.job_name, jobs.job_pay
+                                     FROM user_jobs
+                                     JOIN jobs ON user_jobs.job_id = jobs.job_id
+                                     WHERE user_jobs.user_id = ?''', (user_id,))
+    if not row:
+        return None
+    return row[0], row[1], cooldowns.remaining(user_id, 'work')
+
+async def work(user_id: int):
+    """Finish a shift: start the work cooldown, pay the accrued income and award job points.
+
+    Everything happens in one write, in the economy the job was taken in.
+    Returns (credits paid, job points, guild_id of that economy), or None if
+    the user has no job or is still on cooldown.
+    """
     job_points = random.randint(100, 1000)  # Adjust range as needed
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('''
-                UPDATE users
-                SET job_points = job_points + ?
-                WHERE user_id = ?
-            ''', (job_points, user_id))
-        await conn.commit()
-    return job_points
\ No newline at end of file
+    claimed = False
+
+    async def shift(conn):
+        nonlocal claimed
+        if not await conn.fetchone('SELECT job_id FROM user_jobs WHERE user_id = ?', (user_id,)):
+            return None
+        # Claim the shift only if the cooldown is over, so two answers cannot both be paid
+        if cooldowns.try_start(user_id, 'work', WORK_COOLDOWN):
+            return None
+        claimed = True
+        return await _settle(conn, user_id, datetime.utcnow(), job_points)
+
+    try:
+        result = await writer.run(shift)
+    except Exception:
+        # The shift was rolled back, so the user may work it again
+        if claimed:
+            cooldowns.clear(user_id, 'work')
+        raise
+    if result is None:
+        return None
+    earned, job_guild_id, row = result
+    accounts.put(user_id, job_guild_id, row)
+    return earned, job_points, job_guild_id
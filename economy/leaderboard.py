@@ -0,0 +1,77 @@
+import time
+from typing import NamedTuple, Optional
+from economy import db
+import settings
+
+# Leaderboards per economy, read through the (guild_id, column) indexes.
+# The top LEADERBOARD_SIZE of each board is kept for LEADERBOARD_TTL_SECONDS,
+# and dropped early when a write the account cache sees could change it: the
+# user is on the board, or now has more than its last entry. Bulk balance
+# changes drop every board. Net worth adds users.holdings, which triggers
+# keep at the value of the user's stocks and items, so holdings changes and
+# price ticks only reach the net worth board through its TTL.
+
+# subject -> users column or expression, each backed by an index on (guild_id, it)
+BOARDS = {
+    'credits': 'balance',
+    'job_points': 'job_points',
+    'net_worth': 'balance + holdings',
+}
+
+class Standing(NamedTuple):
+    value: int
+    rank: int         # 1 is the top
+    total: int        # users in the economy
+    percentile: float # share of users at or above this rank, in percent
+
+class Leaderboards:
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._top = {}  # (subject, guild_id) -> (expires, [(user_id, value)])
+
+    async def top(self, subject: str, guild_id: int = 0) -> list:
+        """The top users of a board as (user_id, value), best first."""
+        key = (subject, guild_id)
+        cached = self._top.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        column = BOARDS[subject]
+        async with db.acquire() as conn:
+            rows = await conn.fetchall(f'SELECT user_id, {column} FROM users WHERE guild_id = ? ORDER BY {column} DESC LIMIT ?',
+                                       (guild_id, self.size))
+        rows = [(user_id, value) for user_id, value in rows]
+        self._top[key] = (time.monotonic() + self.ttl, rows)
+        return rows
+
+    async def standing(self, user_id: int, subject: str, guild_id: int = 0) -> Optional[Standing]:
+        """Where a user stands on a board, or None if they have no account there."""
+        column = BOARDS[subject]
+        async with db.acquire() as conn:
+            row = await conn.fetchone(f'''WITH me AS (SELECT {column} AS value FROM users WHERE guild_id = ? AND user_id = ?)
+                                          SELECT me.value,
+                                              (SELECT COUNT(*) FROM users WHERE guild_id = ? AND {column} > me.value),
+                                              (SELECT COUNT(*) FROM users WHERE guild_id = ?)
+                                          FROM me''', (guild_id, user_id, guild_id, guild_id))
+        if not row:
+            return None
+        value, ahead, total = row
+        return Standing(value, ahead + 1, total, (ahead + 1) / total * 100)
+
+    def account_changed(self, user_id: int, guild_id: int, account):
+        """Drop the boards a new users row could change. ``account`` is an Account."""
+        for subject, column in BOARDS.items():
+            cached = self._top.get((subject, guild_id))
+            if not cached:
+                continue
+            rows = cached[1]
+            # Boards on more than an Account holds only notice the users already on them
+            value = getattr(account, column, None)
+            if any(row[0] == user_id for row in rows) or value is not None and (len(rows) < self.size or value > rows[-1][1]):
+                del self._top[(subject, guild_id)]
+
+    def invalidate(self):
+        self._top.clear()
+
+leaderboards = Leaderboards(settings.LEADERBOARD_SIZE, settings.LEADERBOARD_TTL_SECONDS)
@@ -0,0 +1,86 @@
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+from economy import db, writer
+
+# Every change to a balance appends a ledger row with its delta and the
+# command behind it. Triggers on users write the rows (see migration 11), so
+# they land in the same batched transaction as the change itself and cost no
+# extra commit, whichever code path moved the credits. Every few hours a
+# snapshot run records the balance of each user whose balance changed since
+# the previous run. A past balance is then the user's latest snapshot before
+# that time plus the ledger rows after it, which never reaches past the next
+# run: a short range scan instead of a replay of the whole ledger.
+
+class LedgerEntry(NamedTuple):
+    id: int
+    delta: int
+    balance: int           # the balance right after this change
+    command: Optional[str] # None for background work
+    created_at: str
+
+class SnapshotRun(NamedTuple):
+    ledger_id: int  # the last ledger row the snapshots include
+    taken_at: str
+    users: int
+    duration: float  # seconds
+
+async def _snapshot(conn) -> Optional[SnapshotRun]:
+    started = time.perf_counter()
+    taken_at = datetime.utcnow().isoformat()
+    previous = (await conn.fetchone('SELECT MAX(ledger_id) FROM snapshot_runs'))[0] or 0
+    last = (await conn.fetchone('SELECT MAX(id) FROM ledger'))[0] or 0
+    if last <= previous:
+        return None
+    users = await conn.execute_bulk('''INSERT INTO balance_snapshots (guild_id, user_id, ledger_id, balance, taken_at)
+                                       SELECT users.guild_id, users.user_id, ?, users.balance, ?
+                                       FROM users
+                                       JOIN (SELECT DISTINCT guild_id, user_id FROM ledger WHERE id > ?) changed
+                                           ON changed.guild_id = users.guild_id AND changed.user_id = users.user_id''',
+                                    (last, taken_at, previous))
+    duration = time.perf_counter() - started
+    await conn.execute('INSERT INTO snapshot_runs (ledger_id, taken_at, users, duration) VALUES (?, ?, ?, ?)',
+                       (last, taken_at, users, duration))
+    return SnapshotRun(last, taken_at, users, duration)
+
+async def take_snapshot() -> Optional[SnapshotRun]:
+    """Snapshot the balances changed since the last run. Returns None if none did."""
+    return await writer.run(_snapshot)
+
+async def balance_at(user_id: int, when: datetime, guild_id: int = 0) -> Optional[int]:
+    """A user's balance at ``when`` (UTC), or None if that is before the ledger started."""
+    when = when.isoformat()
+    async with db.acquire() as conn:
+        first, until = await conn.fetchone('''SELECT MIN(taken_at), (SELECT MIN(ledger_id) FROM snapshot_runs WHERE taken_at > ?)
+                                              FROM snapshot_runs''', (when,))
+        if first is None or when < first:
+            return None
+        snapshot = await conn.fetchone('''SELECT ledger_id, balance FROM balance_snapshots
+                                          WHERE guild_id = ? AND user_id = ? AND taken_at <= ?
+                                          ORDER BY ledger_id DESC LIMIT 1''', (guild_id, user_id, when))
+        # No snapshot means the balance was 0 at the first run and has not changed at a run since
+        since, balance = snapshot or (0, 0)
+        # Rows past the next run are newer than ``when`` anyway
+        bound = ' AND id <= ?' if until is not None else ''
+        params = (guild_id, user_id, since, when) + ((until,) if until is not None else ())
+        row = await conn.fetchone(f'''SELECT COALESCE(SUM(delta), 0) FROM ledger
+                                      WHERE guild_id = ? AND user_id = ? AND id > ? AND created_at <= ?{bound}''', params)
+    return balance + row[0]
+
+async def history(user_id: int, guild_id: int = 0, count: int = 10) -> list:
+    """A user's last ``count`` balance changes as LedgerEntry, newest first."""
+    async with db.acquire() as conn:
+        # Walk back from the current balance over the newest rows only
+        rows = await conn.fetchall('''SELECT id, delta,
+                                          COALESCE((SELECT balance FROM users WHERE guild_id = ? AND user_id = ?), 0)
+                                              - COALESCE(SUM(delta) OVER (ORDER BY id DESC ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0),
+                                          command, created_at
+                                      FROM (SELECT id, delta, command, created_at FROM ledger
+                                            WHERE guild_id = ? AND user_id = ? ORDER BY id DESC LIMIT ?) recent
+                                      ORDER BY id DESC''', (guild_id, user_id, guild_id, user_id, count))
+    return [LedgerEntry(*row) for row in rows]
+
+async def recent_runs(count: int = 5) -> list:
+    async with db.acquire() as conn:
+        rows = await conn.fetchall('SELECT ledger_id, taken_at, users, duration FROM snapshot_runs ORDER BY ledger_id DESC LIMIT ?', (count,))
+    return [SnapshotRun(*row) for row in rows]
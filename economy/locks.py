@@ -0,0 +1,26 @@
+import asyncio
+import contextlib
+
+# Commands that read a balance or an inventory, check it, and then write are
+# serialized per user with a fixed set of lock stripes, so memory stays flat
+# no matter how many users the bot sees. Two users may share a stripe; that
+# only costs a little concurrency, never correctness.
+STRIPES = 1024
+
+_locks = [asyncio.Lock() for _ in range(STRIPES)]
+
+def _stripe(user_id: int, guild_id: int) -> int:
+    return hash((guild_id, user_id)) % STRIPES
+
+@contextlib.asynccontextmanager
+async def user_lock(*user_ids: int, guild_id: int = 0):
+    """Hold the locks of every given user in one economy for the duration of the block.
+
+    Stripes are always taken in ascending order, so two commands locking the
+    same users in a different order cannot deadlock.
+    """
+    stripes = sorted({_stripe(user_id, guild_id) for user_id in user_ids})
+    async with contextlib.AsyncExitStack() as stack:
+        for stripe in stripes:
+            await stack.enter_async_context(_locks[stripe])
+        yield
@@ -0,0 +1,81 @@
+import random
+from typing import NamedTuple, Optional
+from economy.catalog import catalog, ShopItem
+
+# What a dig turns up. With ITEM_CHANCE the user finds an item plus a few
+# credits; otherwise CREDITS_CHANCE of the remaining digs find credits only,
+# and the rest find nothing. Which item is found comes from the loot table:
+# a tier is picked by its loot_tiers weight, then an item of that tier by its
+# loot_weight. The table is rebuilt only when the catalog changes, and every
+# draw from it takes constant time.
+ITEM_CHANCE = 0.25
+CREDITS_CHANCE = 0.5
+ITEM_CREDITS = (50, 250)     # credits found along with an item
+FOUND_CREDITS = (50, 150)    # credits found without an item
+
+class AliasTable:
+    """Walker's alias method: O(n) to build, O(1) per draw from a fixed discrete distribution."""
+
+    def __init__(self, weights):
+        count = len(weights)
+        total = sum(weights)
+        if not count or total <= 0:
+            raise ValueError("an alias table needs at least one positive weight")
+        # Each column holds ``prob`` of its own outcome, topped up with its alias
+        scaled = [weight * count / total for weight in weights]
+        self.prob = [1.0] * count
+        self.alias = list(range(count))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            short, tall = small.pop(), large.pop()
+            self.prob[short] = scaled[short]
+            self.alias[short] = tall
+            scaled[tall] -= 1 - scaled[short]
+            (small if scaled[tall] < 1 else large).append(tall)
+        # Whatever is left is 1 up to rounding
+
+    def __len__(self):
+        return len(self.prob)
+
+    def draw(self, rng=random) -> int:
+        column = rng.randrange(len(self.prob))
+        return column if rng.random() < self.prob[column] else self.alias[column]
+
+class LootTable(NamedTuple):
+    items: list          # the ShopItems that can drop
+    chances: list        # the chance of each of them, given that an item drops
+    alias: AliasTable
+
+    def draw(self, rng=random) -> ShopItem:
+        return self.items[self.alias.draw(rng)]
+
+def build_loot_table(items, tiers: dict) -> Optional[LootTable]:
+    """The loot table for ``items`` and {tier: weight}, or None if nothing can drop."""
+    tier_totals = {}
+    for item in items:
+        if item.loot_weight > 0 and tiers.get(item.tier, 0) > 0:
+            tier_totals[item.tier] = tier_totals.get(item.tier, 0) + item.loot_weight
+    if not tier_totals:
+        return None
+    # Tiers without any droppable items don't take a share
+    tiers_total = sum(tiers[tier] for tier in tier_totals)
+    droppable = [item for item in items if item.tier in tier_totals and item.loot_weight > 0]
+    chances = [tiers[item.tier] / tiers_total * item.loot_weight / tier_totals[item.tier] for item in droppable]
+    return LootTable(droppable, chances, AliasTable(chances))
+
+def loot_table() -> Optional[LootTable]:
+    """The loot table of the current catalog."""
+    return catalog.cached('loot table', lambda: build_loot_table(catalog.items(), catalog.tiers()))
+
+class Dig(NamedTuple):
+    item: Optional[ShopItem]
+    credits: int
+
+def roll_dig(rng=random) -> Dig:
+    table = loot_table()
+    if table is not None and rng.random() < ITEM_CHANCE:
+        return Dig(table.draw(rng), rng.randint(*ITEM_CREDITS))
+    if rng.random() < CREDITS_CHANCE:
+        return Dig(None, rng.randint(*FOUND_CREDITS))
+    return Dig(None, 0)
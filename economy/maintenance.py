@@ -0,0 +1,155 @@
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from economy import db, writer
+import settings
+
+# Rows examined per index by PRAGMA optimize, so it never turns into a full ANALYZE
+ANALYSIS_LIMIT = 400
+
+class MaintenanceReport(NamedTuple):
+    optimized: bool
+    analyzed: bool
+    pages_freed: int
+    free_pages: int  # pages still on the freelist afterwards
+    page_size: int
+    duration: float  # seconds
+    skipped: Optional[str] = None  # why nothing ran, if it didn't
+
+_paused = False
+_last_write_count = 0
+last_report: Optional[MaintenanceReport] = None
+
+def _is_sqlite() -> bool:
+    return db.backend is not None and db.backend.name == "sqlite"
+
+def pause():
+    global _paused
+    _paused = True
+
+def resume():
+    global _paused
+    _paused = False
+
+def is_paused() -> bool:
+    return _paused
+
+async def _in_thread(conn, func, *args):
+    return await conn.run_in_thread(func, *args)
+
+async def _pragma(name: str) -> int:
+    async with db.acquire() as conn:
+        row = await conn.fetchone(f'PRAGMA {name}')
+    return row[0]
+
+def _auto_vacuum(conn) -> int:
+    return conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+
+def _enable_incremental_vacuum(conn):
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+def _enable_incremental_vacuum_if_empty(conn) -> bool:
+    # Without any tables yet the VACUUM has nothing to rewrite
+    if conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0]:
+        return False
+    _enable_incremental_vacuum(conn)
+    return True
+
+def _optimize(conn):
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    try:
+        conn.execute('PRAGMA optimize')
+    finally:
+        # The limit sticks to the writer connection; everything else analyzes in full
+        conn.execute('PRAGMA analysis_limit = 0')
+
+def _analyze(conn):
+    conn.execute('PRAGMA analysis_limit = 0')
+    conn.execute('ANALYZE')
+
+def _vacuum_slice(conn, pages: int) -> int:
+    # incremental_vacuum frees one page per step, and execute() only steps once
+    # for statements that return no rows, so run it as a script
+    conn.executescript(f'PRAGMA incremental_vacuum({pages})')
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+async def incremental_vacuum_enabled() -> bool:
+    # Asked on the writer: a pooled reader can keep reporting the setting it opened with
+    return _is_sqlite() and await writer.run_unbatched(_in_thread, _auto_vacuum) == 2
+
+async def check_incremental_vacuum():
+    """Use incremental auto_vacuum for a new database, and tell the owner how to switch an existing one.
+
+    Runs before the migrations. Switching an existing database needs a full
+    VACUUM, which blocks every write while it runs, so that is left to
+    enable_incremental_vacuum().
+    """
+    if not _is_sqlite() or await incremental_vacuum_enabled():
+        return
+    if not await writer.run_unbatched(_in_thread, _enable_incremental_vacuum_if_empty):
+        print("Incremental vacuum is off, so maintenance cannot hand free pages back. "
+              "Run s!enable-incremental-vacuum once at a quiet time; it rewrites the database.")
+
+async def enable_incremental_vacuum() -> Optional[float]:
+    """Switch the database to incremental auto_vacuum with one full VACUUM.
+
+    Returns how long it took, or None if it was already on.
+    """
+    if not _is_sqlite() or await incremental_vacuum_enabled():
+        return None
+    started = time.perf_counter()
+    await writer.run_unbatched(_in_thread, _enable_incremental_vacuum)
+    return time.perf_counter() - started
+
+async def _last_run(task: str) -> Optional[datetime]:
+    async with db.acquire() as conn:
+        row = await conn.fetchone('SELECT ran_at FROM maintenance_runs WHERE task = ?', (task,))
+    return datetime.fromisoformat(row[0]) if row else None
+
+async def _record_run(task: str, ran_at: datetime):
+    await writer.execute('INSERT INTO maintenance_runs (task, ran_at) VALUES (?, ?) ON CONFLICT(task) DO UPDATE SET ran_at = excluded.ran_at',
+                         (task, ran_at.isoformat()))
+
+async def run_maintenance(force: bool = False) -> MaintenanceReport:
+    """Run PRAGMA optimize, ANALYZE when it is due, and release free pages in bounded slices.
+
+    Unless ``force`` is set nothing runs while paused or when the bot wrote more
+    than MAINTENANCE_QUIET_WRITES times since the previous check.
+    """
+    global _last_write_count, last_report
+    writes = writer.write_count - _last_write_count
+    _last_write_count = writer.write_count
+    if not _is_sqlite():
+        return MaintenanceReport(False, False, 0, 0, 0, 0.0, "maintenance only applies to SQLite")
+    if not force and _paused:
+        return MaintenanceReport(False, False, 0, 0, 0, 0.0, "paused")
+    if not force and writes >= settings.MAINTENANCE_QUIET_WRITES:
+        return MaintenanceReport(False, False, 0, 0, 0, 0.0, f"busy ({writes} writes since the last check)")
+
+    started = time.perf_counter()
+    await writer.run_unbatched(_in_thread, _optimize)
+    # The last ANALYZE is kept in the database, so a restart doesn't make it due.
+    # A database that never had one starts counting now; PRAGMA optimize covers it meanwhile.
+    now = datetime.utcnow()
+    last_analyze = await _last_run('analyze')
+    analyzed = last_analyze is not None and now - last_analyze >= timedelta(hours=settings.ANALYZE_INTERVAL_HOURS)
+    if analyzed:
+        await writer.run_unbatched(_in_thread, _analyze)
+    if analyzed or last_analyze is None:
+        await _record_run('analyze', now)
+
+    free_before = free_pages = await _pragma('freelist_count')
+    # incremental_vacuum does nothing until s!enable-incremental-vacuum ran
+    slices = settings.VACUUM_MAX_SLICES if await incremental_vacuum_enabled() else 0
+    # Each slice is its own short transaction, so commands queued meanwhile wait for one slice at most
+    for _ in range(slices):
+        if free_pages == 0 or (_paused and not force):
+            break
+        free_pages = await writer.run_unbatched(_in_thread, _vacuum_slice, settings.VACUUM_PAGES_PER_SLICE)
+
+    last_report = MaintenanceReport(True, analyzed, free_before - free_pages, free_pages,
+                                    await _pragma('page_size'), time.perf_counter() - started)
+    # Don't count our own slices as traffic at the next check
+    _last_write_count = writer.write_count
+    return last_report
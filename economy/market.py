@@ -0,0 +1,182 @@
+import asyncio
+import datetime
+from typing import Any, Awaitable, Callable, NamedTuple, Optional, Tuple
+from economy import db, writer
+import settings
+
+# Current stock prices live here. Once loaded, the market's prices are the
+# real ones: trading, the market overview and portfolios read them from
+# memory. Every price change goes through one task, in the order it was
+# asked for, so concurrent trades and the fluctuation loop never overwrite
+# each other's moves, and a trade is settled at the very price it moves
+# from (see Market.trade). The task writes the changed prices, with a
+# stock_price_history row per change, behind in one transaction every
+# MARKET_FLUSH_SECONDS; the stocks.price update then fires the triggers that
+# keep users.holdings in step. Like the account cache, this assumes a single
+# bot process.
+
+class Stock(NamedTuple):
+    stock_id: str
+    name: str
+    price: float
+
+class _Move(NamedTuple):
+    stock_id: str
+    amount: float
+    future: asyncio.Future
+
+class _Trade(NamedTuple):
+    stock_id: str
+    settle: Callable[[float], Awaitable[Tuple[Any, float]]]
+    future: asyncio.Future
+
+class _Flush(NamedTuple):
+    future: asyncio.Future
+    stop: bool = False
+
+class Market:
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._stocks = {}
+        self._dirty = set()  # stock_ids whose price is not written yet
+        self._history = []   # (stock_id, price, timestamp) rows not written yet
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self):
+        """Read every stock and start the price task. Safe to call again, e.g. after adding stocks."""
+        async with db.acquire() as conn:
+            rows = await conn.fetchall('SELECT stock_id, name, price FROM stocks')
+        for stock_id, name, price in rows:
+            # Prices not written yet are newer than the database
+            if stock_id in self._dirty:
+                price = self._stocks[stock_id].price
+            self._stocks[stock_id] = Stock(stock_id, name, price)
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    def stock(self, stock_id: str) -> Optional[Stock]:
+        return self._stocks.get(stock_id)
+
+    def stocks(self, descending: bool = False) -> list:
+        """Every stock, cheapest first unless ``descending``."""
+        return sorted(self._stocks.values(), key=lambda stock: stock.price, reverse=descending)
+
+    def move(self, stock_id: str, amount: float) -> "asyncio.Future[Optional[float]]":
+        """Queue a price change of ``amount``. Resolves to the new price, or None if there is no such stock.
+
+        Prices never go below 0.
+        """
+        return self._submit(_Move, stock_id, amount)
+
+    def trade(self, stock_id: str, settle) -> "asyncio.Future[Optional[Tuple[Any, float]]]":
+        """Queue ``await settle(price)`` at the stock's current price, then move the price.
+
+        ``settle`` returns (result, amount) and the price moves by ``amount``.
+        No other move happens in between. Resolves to (result, new price), or
+        None if there is no such stock.
+        """
+        return self._submit(_Trade, stock_id, settle)
+
+    def flush(self) -> "asyncio.Future[int]":
+        """Write the pending prices and history now. Resolves to the number of price changes written."""
+        return self._submit(_Flush)
+
+    async def stop(self):
+        """Write everything behind and stop the price task."""
+        if self._task is None:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Flush(future, stop=True))
+        await self._task
+        self._queue = self._task = None
+        await future
+
+    def _submit(self, kind, *args) -> asyncio.Future:
+        if self._task is None:
+            raise RuntimeError("The market is not running. Call market.load() first.")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(kind(*args, future))
+        return future
+
+    def _apply(self, stock_id: str, amount: float) -> Optional[float]:
+        stock = self._stocks.get(stock_id)
+        if stock is None:
+            return None
+        price = max(stock.price + amount, 0)
+        self._stocks[stock_id] = stock._replace(price=price)
+        self._dirty.add(stock_id)
+        self._history.append((stock_id, price, datetime.datetime.utcnow().isoformat()))
+        return price
+
+    async def _trade(self, request: _Trade):
+        stock = self._stocks.get(request.stock_id)
+        if stock is None:
+            outcome = None
+        else:
+            try:
+                result, amount = await request.settle(stock.price)
+            except Exception as e:
+                if not request.future.done():
+                    request.future.set_exception(e)
+                return
+            # A trade that did not go through leaves the price alone
+            outcome = result, self._apply(request.stock_id, amount) if amount else stock.price
+        if not request.future.done():
+            request.future.set_result(outcome)
+
+    async def _write_behind(self) -> int:
+        if not self._history:
+            return 0
+        dirty, history = self._dirty, self._history
+        self._dirty, self._history = set(), []
+        prices = [(self._stocks[stock_id].price, stock_id) for stock_id in dirty]
+        try:
+            await writer.run(_write, prices, history)
+        except Exception:
+            # Nothing moves while this task waits, so they can simply go back
+            self._dirty, self._history = dirty, history
+            raise
+        return len(history)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while True:
+            request = None
+            timeout = deadline - loop.time()
+            if timeout > 0:
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            if isinstance(request, _Move):
+                if not request.future.done():
+                    request.future.set_result(self._apply(request.stock_id, request.amount))
+                continue
+            if isinstance(request, _Trade):
+                await self._trade(request)
+                continue
+
+            # A flush was asked for, or it is time for one
+            try:
+                written = await self._write_behind()
+            except Exception as e:
+                if request is None:
+                    print(f"Writing stock prices failed, retrying at the next flush: {e}")
+                elif not request.future.done():
+                    request.future.set_exception(e)
+            else:
+                if request is not None and not request.future.done():
+                    request.future.set_result(written)
+            deadline = loop.time() + self.flush_interval
+            if request is not None and request.stop:
+                return
+
+async def _write(conn, prices, history):
+    await conn.executemany('UPDATE stocks SET price = ? WHERE stock_id = ?', prices)
+    await conn.executemany('INSERT INTO stock_price_history (stock_id, price, timestamp) VALUES (?, ?, ?)', history)
+
+market = Market(settings.MARKET_FLUSH_SECONDS)
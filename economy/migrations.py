@@ -0,0 +1,479 @@
+from collections import Counter
+from economy import db, writer
+from datetime import datetime, timezone
+
+def _epoch(timestamp: str) -> int:
+    # Timestamps were stored as naive datetime.utcnow().isoformat()
+    return int(datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp())
+
+async def _backfill_cooldowns(conn):
+    """Copy the cooldowns still running from the columns migration 6 drops."""
+    rows = []
+    for guild_id, user_id, last_daily in await conn.fetchall('SELECT guild_id, user_id, last_daily FROM users WHERE last_daily IS NOT NULL'):
+        rows.append((user_id, 'daily', guild_id, _epoch(last_daily) + 24 * 3600))
+    for user_id, start_time, last_work_time in await conn.fetchall('SELECT user_id, start_time, last_work_time FROM user_jobs'):
+        rows.append((user_id, 'resign', 0, _epoch(start_time) + 2 * 3600))
+        if last_work_time:
+            rows.append((user_id, 'work', 0, _epoch(last_work_time) + 3600))
+    for user_id, job_id, application_time in await conn.fetchall('SELECT user_id, job_id, application_time FROM job_applications'):
+        rows.append((user_id, f'apply:{job_id}', 0, _epoch(application_time) + 3600))
+    now = int(datetime.now(timezone.utc).timestamp())
+    rows = [row for row in rows if row[3] > now]
+    if rows:
+        await conn.executemany('INSERT INTO cooldowns (user_id, action, scope, expires_at) VALUES (?, ?, ?, ?)', rows)
+
+async def _backfill_trade_items(conn):
+    """Turn the comma-separated item lists migration 8 drops into trade_items rows."""
+    for trades, items in (('trades', 'trade_items'), ('trades_archive', 'trade_items_archive')):
+        rows = []
+        for trade_id, user1_items, user2_items in await conn.fetchall(f'SELECT trade_id, user1_items, user2_items FROM {trades}'):
+            for side, listed in ((1, user1_items), (2, user2_items)):
+                quantities = Counter(item.strip() for item in (listed or '').split(',') if item.strip())
+                rows.extend((trade_id, side, item_id, quantity) for item_id, quantity in quantities.items())
+        if rows:
+            await conn.executemany(f'INSERT INTO {items} (trade_id, side, item_id, quantity) VALUES (?, ?, ?, ?)', rows)
+
+# (holdings table, key column, priced table, price column) summed into users.holdings
+_HOLDINGS = [
+    ('user_stocks', 'stock_id', 'stocks', 'price'),
+    ('user_inventory', 'item_id', 'shop_items', 'item_price'),
+]
+
+def _sqlite_holdings_triggers(table: str, key: str, priced: str, price: str) -> list:
+    value = lambda row: f"{row}.quantity * (SELECT {price} FROM {priced} WHERE {key} = {row}.{key})"
+    add = lambda row, sign: f'''INSERT INTO users (guild_id, user_id, holdings) VALUES ({row}.guild_id, {row}.user_id, {sign}{value(row)})
+                 ON CONFLICT(guild_id, user_id) DO UPDATE SET holdings = users.holdings + excluded.holdings;'''
+    return [
+        f"CREATE TRIGGER {table}_holdings_insert AFTER INSERT ON {table} BEGIN {add('NEW', '')} END",
+        f"CREATE TRIGGER {table}_holdings_update AFTER UPDATE OF quantity ON {table} BEGIN {add('OLD', '-')} {add('NEW', '')} END",
+        f"CREATE TRIGGER {table}_holdings_delete AFTER DELETE ON {table} BEGIN {add('OLD', '-')} END",
+        f'''CREATE TRIGGER {priced}_holdings_price AFTER UPDATE OF {price} ON {priced} BEGIN
+               UPDATE users SET holdings = holdings + (NEW.{price} - OLD.{price}) * {table}.quantity
+               FROM {table} WHERE {table}.{key} = NEW.{key} AND {table}.guild_id = users.guild_id AND {table}.user_id = users.user_id;
+           END''',
+    ]
+
+def _postgres_holdings_triggers(table: str, key: str, priced: str, price: str) -> list:
+    value = lambda row: f"{row}.quantity * (SELECT {price} FROM {priced} WHERE {key} = {row}.{key})"
+    add = lambda row, sign: f'''INSERT INTO users (guild_id, user_id, holdings) VALUES ({row}.guild_id, {row}.user_id, {sign}{value(row)})
+                 ON CONFLICT (guild_id, user_id) DO UPDATE SET holdings = users.holdings + excluded.holdings;'''
+    return [
+        f'''CREATE FUNCTION {table}_holdings() RETURNS trigger AS $$
+           BEGIN
+               IF TG_OP <> 'INSERT' THEN {add('OLD', '-')} END IF;
+               IF TG_OP <> 'DELETE' THEN {add('NEW', '')} END IF;
+               RETURN NULL;
+           END $$ LANGUAGE plpgsql''',
+        f"CREATE TRIGGER {table}_holdings AFTER INSERT OR UPDATE OF quantity OR DELETE ON {table} FOR EACH ROW EXECUTE FUNCTION {table}_holdings()",
+        f'''CREATE FUNCTION {priced}_holdings_price() RETURNS trigger AS $$
+           BEGIN
+               UPDATE users SET holdings = users.holdings + (NEW.{price} - OLD.{price}) * {table}.quantity
+               FROM {table} WHERE {table}.{key} = NEW.{key} AND {table}.guild_id = users.guild_id AND {table}.user_id = users.user_id;
+               RETURN NULL;
+           END $$ LANGUAGE plpgsql''',
+        f"CREATE TRIGGER {priced}_holdings_price AFTER UPDATE OF {price} ON {priced} FOR EACH ROW EXECUTE FUNCTION {priced}_holdings_price()",
+    ]
+
+async def _holdings_triggers(conn):
+    """Keep users.holdings in step with every write to holdings or prices, whatever code makes it."""
+    build = _postgres_holdings_triggers if db.backend.name == 'postgres' else _sqlite_holdings_triggers
+    for holdings in _HOLDINGS:
+        for statement in build(*holdings):
+            await conn.execute(statement)
+
+# The time a ledger row is written, in the format datetime.isoformat() uses elsewhere
+_SQLITE_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+_POSTGRES_NOW = """to_char(clock_timestamp() AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US')"""
+
+async def _ledger_triggers(conn):
+    """Append a ledger row for every change to a balance, in the transaction that makes it."""
+    if db.backend.name == 'postgres':
+        statements = [
+            f'''CREATE FUNCTION users_ledger() RETURNS trigger AS $$
+               BEGIN
+                   INSERT INTO ledger (guild_id, user_id, delta, command, created_at)
+                   VALUES (NEW.guild_id, NEW.user_id, NEW.balance - CASE TG_OP WHEN 'INSERT' THEN 0 ELSE OLD.balance END,
+                           NULLIF(current_setting('economy.command', true), ''), {_POSTGRES_NOW});
+                   RETURN NULL;
+               END $$ LANGUAGE plpgsql''',
+            '''CREATE TRIGGER users_ledger_insert AFTER INSERT ON users FOR EACH ROW
+               WHEN (NEW.balance <> 0) EXECUTE FUNCTION users_ledger()''',
+            '''CREATE TRIGGER users_ledger_update AFTER UPDATE OF balance ON users FOR EACH ROW
+               WHEN (NEW.balance <> OLD.balance) EXECUTE FUNCTION users_ledger()''',
+        ]
+    else:
+        # economy_command() is registered on the writer connection (see economy/db.py)
+        insert = lambda delta: f'''INSERT INTO ledger (guild_id, user_id, delta, command, created_at)
+                 VALUES (NEW.guild_id, NEW.user_id, {delta}, economy_command(), {_SQLITE_NOW});'''
+        statements = [
+            f"CREATE TRIGGER users_ledger_insert AFTER INSERT ON users WHEN NEW.balance <> 0 BEGIN {insert('NEW.balance')} END",
+            f"CREATE TRIGGER users_ledger_update AFTER UPDATE OF balance ON users WHEN NEW.balance <> OLD.balance BEGIN {insert('NEW.balance - OLD.balance')} END",
+        ]
+    for statement in statements:
+        await conn.execute(statement)
+
+async def _baseline_snapshot(conn):
+    """Snapshot every balance as it stands before the ledger starts, as run 0."""
+    taken_at = datetime.utcnow().isoformat()
+    users = await conn.execute('''INSERT INTO balance_snapshots (guild_id, user_id, ledger_id, balance, taken_at)
+                                  SELECT guild_id, user_id, 0, balance, ? FROM users WHERE balance <> 0''', (taken_at,))
+    await conn.execute('INSERT INTO snapshot_runs (ledger_id, taken_at, users) VALUES (0, ?, ?)', (taken_at, users))
+
+# Ordered schema migrations. Each entry is (version, description, statements);
+# a migration runs once, inside a single transaction, and is recorded in schema_version.
+# A statement is either SQL or an ``async def step(conn)`` for data that plain
+# SQL cannot move portably.
+# Never edit a migration that has shipped, append a new one instead.
+MIGRATIONS = [
+    (1, "initial schema", [
+        '''CREATE TABLE IF NOT EXISTS channels (
+               guild_id INTEGER PRIMARY KEY,
+               channel_id INTEGER NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS potd_last_post (
+               date TEXT PRIMARY KEY)''',
+        '''CREATE TABLE IF NOT EXISTS users (
+               user_id INTEGER PRIMARY KEY,
+               balance INTEGER NOT NULL DEFAULT 0,
+               last_daily TEXT,
+               job_points INTEGER NOT NULL DEFAULT 0)''',
+        '''CREATE TABLE IF NOT EXISTS shop_items (
+               item_id TEXT PRIMARY KEY,
+               item_name TEXT NOT NULL,
+               item_price INTEGER NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS user_inventory (
+               user_id INTEGER NOT NULL,
+               item_id TEXT NOT NULL,
+               quantity INTEGER NOT NULL,
+               PRIMARY KEY (user_id, item_id),
+               FOREIGN KEY (item_id) REFERENCES shop_items(item_id))''',
+        '''CREATE TABLE IF NOT EXISTS jobs (
+               job_id TEXT PRIMARY KEY,
+               job_name TEXT NOT NULL,
+               job_description TEXT,
+               job_pay INTEGER NOT NULL,
+               acceptance_chance REAL NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS user_jobs (
+               user_id INTEGER PRIMARY KEY,
+               job_id TEXT NOT NULL,
+               start_time TEXT NOT NULL,
+               last_work_time TEXT,
+               FOREIGN KEY (job_id) REFERENCES jobs(job_id))''',
+        '''CREATE TABLE IF NOT EXISTS job_applications (
+               user_id INTEGER NOT NULL,
+               job_id TEXT NOT NULL,
+               application_time TEXT NOT NULL,
+               PRIMARY KEY (user_id, job_id),
+               FOREIGN KEY (user_id) REFERENCES users(user_id),
+               FOREIGN KEY (job_id) REFERENCES jobs(job_id))''',
+        '''CREATE TABLE IF NOT EXISTS trades (
+               trade_id INTEGER PRIMARY KEY AUTOINCREMENT,
+               user1_id INTEGER,
+               user2_id INTEGER,
+               user1_items TEXT,
+               user2_items TEXT,
+               user1_credits INTEGER,
+               user2_credits INTEGER,
+               status TEXT DEFAULT 'pending')''',
+        '''CREATE TABLE IF NOT EXISTS stocks (
+               stock_id TEXT PRIMARY KEY,
+               name TEXT NOT NULL,
+               price REAL NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS user_stocks (
+               user_id INTEGER NOT NULL,
+               stock_id TEXT NOT NULL,
+               quantity INTEGER NOT NULL,
+               PRIMARY KEY (user_id, stock_id),
+               FOREIGN KEY (stock_id) REFERENCES stocks(stock_id))''',
+        '''CREATE TABLE IF NOT EXISTS stock_price_history (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               stock_id TEXT NOT NULL,
+               price REAL NOT NULL,
+               timestamp TEXT NOT NULL,
+               FOREIGN KEY (stock_id) REFERENCES stocks(stock_id))''',
+    ]),
+    (2, "hot-path indexes", [
+        # fetch_stock_history and the per-stock MAX(timestamp) lookups in market trends
+        'CREATE INDEX IF NOT EXISTS idx_stock_price_history_stock_time ON stock_price_history (stock_id, timestamp)',
+        # Trades addressed to a user, filtered by status
+        'CREATE INDEX IF NOT EXISTS idx_trades_user2_status ON trades (user2_id, status)',
+        # Leaderboards
+        'CREATE INDEX IF NOT EXISTS idx_users_balance ON users (balance)',
+        'CREATE INDEX IF NOT EXISTS idx_users_job_points ON users (job_points)',
+    ]),
+    # Economy rows are partitioned by guild_id. Guild 0 is the global economy
+    # every existing row belongs to; guilds in guild_economies get their own.
+    (3, "per-guild economies", [
+        '''CREATE TABLE guild_economies (
+               guild_id INTEGER PRIMARY KEY,
+               enabled_at TEXT NOT NULL)''',
+        # job_applications referenced users(user_id), which stops being a key,
+        # so rebuild it without that foreign key before users can be replaced
+        '''CREATE TABLE job_applications_new (
+               user_id INTEGER NOT NULL,
+               job_id TEXT NOT NULL,
+               application_time TEXT NOT NULL,
+               PRIMARY KEY (user_id, job_id),
+               FOREIGN KEY (job_id) REFERENCES jobs(job_id))''',
+        'INSERT INTO job_applications_new (user_id, job_id, application_time) SELECT user_id, job_id, application_time FROM job_applications',
+        'DROP TABLE job_applications',
+        'ALTER TABLE job_applications_new RENAME TO job_applications',
+        '''CREATE TABLE users_new (
+               guild_id INTEGER NOT NULL DEFAULT 0,
+               user_id INTEGER NOT NULL,
+               balance INTEGER NOT NULL DEFAULT 0,
+               last_daily TEXT,
+               job_points INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (guild_id, user_id))''',
+        'INSERT INTO users_new (guild_id, user_id, balance, last_daily, job_points) SELECT 0, user_id, balance, last_daily, job_points FROM users',
+        'DROP TABLE users',
+        'ALTER TABLE users_new RENAME TO users',
+        '''CREATE TABLE user_inventory_new (
+               guild_id INTEGER NOT NULL DEFAULT 0,
+               user_id INTEGER NOT NULL,
+               item_id TEXT NOT NULL,
+               quantity INTEGER NOT NULL,
+               PRIMARY KEY (guild_id, user_id, item_id),
+               FOREIGN KEY (item_id) REFERENCES shop_items(item_id))''',
+        'INSERT INTO user_inventory_new (guild_id, user_id, item_id, quantity) SELECT 0, user_id, item_id, quantity FROM user_inventory',
+        'DROP TABLE user_inventory',
+        'ALTER TABLE user_inventory_new RENAME TO user_inventory',
+        '''CREATE TABLE user_stocks_new (
+               guild_id INTEGER NOT NULL DEFAULT 0,
+               user_id INTEGER NOT NULL,
+               stock_id TEXT NOT NULL,
+               quantity INTEGER NOT NULL,
+               PRIMARY KEY (guild_id, user_id, stock_id),
+               FOREIGN KEY (stock_id) REFERENCES stocks(stock_id))''',
+        'INSERT INTO user_stocks_new (guild_id, user_id, stock_id, quantity) SELECT 0, user_id, stock_id, quantity FROM user_stocks',
+        'DROP TABLE user_stocks',
+        'ALTER TABLE user_stocks_new RENAME TO user_stocks',
+        'ALTER TABLE trades ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0',
+        'DROP INDEX IF EXISTS idx_trades_user2_status',
+        'CREATE INDEX idx_trades_guild_user2_status ON trades (guild_id, user2_id, status)',
+        # Per-guild leaderboards
+        'CREATE INDEX idx_users_guild_balance ON users (guild_id, balance)',
+        'CREATE INDEX idx_users_guild_job_points ON users (guild_id, job_points)',
+    ]),
+    # Finished trades are moved to trades_archive some days after they close
+    # (see economy/retention.py). Trades that finished before this migration
+    # have no closed_at and are archived on the first run.
+    (4, "trade retention", [
+        'ALTER TABLE trades ADD COLUMN closed_at TEXT',
+        # Same columns, in the same order, as trades
+        '''CREATE TABLE trades_archive (
+               trade_id INTEGER PRIMARY KEY,
+               user1_id INTEGER,
+               user2_id INTEGER,
+               user1_items TEXT,
+               user2_items TEXT,
+               user1_credits INTEGER,
+               user2_credits INTEGER,
+               status TEXT,
+               guild_id INTEGER NOT NULL DEFAULT 0,
+               closed_at TEXT)''',
+    ]),
+    # Jobs pay job_pay credits per hour from accrued_at on (see economy/job.py).
+    # Existing jobs start accruing from their last payout.
+    (5, "job income accrual", [
+        'ALTER TABLE user_jobs ADD COLUMN accrued_at TEXT',
+        'UPDATE user_jobs SET accrued_at = COALESCE(last_work_time, start_time)',
+    ]),
+    # All cooldowns move to one table read by economy/cooldowns.py
+    (6, "unified cooldowns", [
+        '''CREATE TABLE cooldowns (
+               user_id INTEGER NOT NULL,
+               action TEXT NOT NULL,
+               scope INTEGER NOT NULL DEFAULT 0,
+               expires_at INTEGER NOT NULL,
+               PRIMARY KEY (user_id, action, scope))''',
+        # Loading the live cooldowns at startup and pruning expired ones
+        'CREATE INDEX idx_cooldowns_expires_at ON cooldowns (expires_at)',
+        _backfill_cooldowns,
+        'ALTER TABLE users DROP COLUMN last_daily',
+        'ALTER TABLE user_jobs DROP COLUMN last_work_time',
+        'DROP TABLE job_applications',
+    ]),
+    # One row per settled day of dividends and interest (see economy/settlement.py)
+    (7, "settlement runs", [
+        '''CREATE TABLE settlement_runs (
+               period TEXT PRIMARY KEY,
+               started_at TEXT NOT NULL,
+               dividend_accounts INTEGER NOT NULL DEFAULT 0,
+               interest_accounts INTEGER NOT NULL DEFAULT 0,
+               duration REAL NOT NULL DEFAULT 0)''',
+    ]),
+    # Any number of items, with quantities, on each side of a trade (see
+    # economy/trade.py). side 1 is what user1 offers, side 2 what they ask of user2.
+    (8, "trade items", [
+        '''CREATE TABLE trade_items (
+               trade_id INTEGER NOT NULL,
+               side INTEGER NOT NULL,
+               item_id TEXT NOT NULL,
+               quantity INTEGER NOT NULL,
+               PRIMARY KEY (trade_id, side, item_id),
+               FOREIGN KEY (trade_id) REFERENCES trades(trade_id))''',
+        # Same columns, in the same order, as trade_items
+        '''CREATE TABLE trade_items_archive (
+               trade_id INTEGER NOT NULL,
+               side INTEGER NOT NULL,
+               item_id TEXT NOT NULL,
+               quantity INTEGER NOT NULL,
+               PRIMARY KEY (trade_id, side, item_id))''',
+        _backfill_trade_items,
+        'ALTER TABLE trades DROP COLUMN user1_items',
+        'ALTER TABLE trades DROP COLUMN user2_items',
+        'ALTER TABLE trades_archive DROP COLUMN user1_items',
+        'ALTER TABLE trades_archive DROP COLUMN user2_items',
+    ]),
+    # Loot weights for dig (see economy/loot.py): a tier is picked by its
+    # weight, then an item of that tier by the item's loot_weight. Existing
+    # items are tiered by price.
+    (9, "loot tables", [
+        '''CREATE TABLE loot_tiers (
+               tier TEXT PRIMARY KEY,
+               weight REAL NOT NULL)''',
+        "INSERT INTO loot_tiers (tier, weight) VALUES ('common', 60), ('uncommon', 25), ('rare', 12), ('legendary', 3)",
+        "ALTER TABLE shop_items ADD COLUMN tier TEXT NOT NULL DEFAULT 'common'",
+        'ALTER TABLE shop_items ADD COLUMN loot_weight REAL NOT NULL DEFAULT 1',
+        '''UPDATE shop_items SET tier = CASE WHEN item_price >= 700 THEN 'legendary'
+                                            WHEN item_price >= 400 THEN 'rare'
+                                            WHEN item_price >= 250 THEN 'uncommon'
+                                            ELSE 'common' END''',
+    ]),
+    # users.holdings is the value of a user's stocks and items at current
+    # prices, kept up to date by triggers, so net worth (balance + holdings)
+    # can be ranked from an index (see economy/leaderboard.py).
+    (10, "net worth", [
+        'ALTER TABLE users ADD COLUMN holdings REAL NOT NULL DEFAULT 0',
+        '''INSERT INTO users (guild_id, user_id)
+           SELECT guild_id, user_id FROM user_stocks UNION SELECT guild_id, user_id FROM user_inventory WHERE true
+           ON CONFLICT(guild_id, user_id) DO NOTHING''',
+        '''UPDATE users SET holdings =
+               COALESCE((SELECT SUM(user_stocks.quantity * stocks.price) FROM user_stocks JOIN stocks ON stocks.stock_id = user_stocks.stock_id
+                         WHERE user_stocks.guild_id = users.guild_id AND user_stocks.user_id = users.user_id), 0)
+             + COALESCE((SELECT SUM(user_inventory.quantity * shop_items.item_price) FROM user_inventory JOIN shop_items ON shop_items.item_id = user_inventory.item_id
+                         WHERE user_inventory.guild_id = users.guild_id AND user_inventory.user_id = users.user_id), 0)''',
+        _holdings_triggers,
+        'CREATE INDEX idx_users_guild_net_worth ON users (guild_id, (balance + holdings))',
+        # A price change updates every holder of that stock or item
+        'CREATE INDEX idx_user_stocks_stock ON user_stocks (stock_id)',
+        'CREATE INDEX idx_user_inventory_item ON user_inventory (item_id)',
+    ]),
+    # Every balance change as an append-only ledger row, written by triggers,
+    # plus periodic balance snapshots to read past balances from (see
+    # economy/ledger.py). Balances before the ledger are snapshot run 0.
+    (11, "economy ledger", [
+        '''CREATE TABLE ledger (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               guild_id INTEGER NOT NULL,
+               user_id INTEGER NOT NULL,
+               delta INTEGER NOT NULL,
+               command TEXT,
+               created_at TEXT NOT NULL)''',
+        'CREATE INDEX idx_ledger_user ON ledger (guild_id, user_id, id)',
+        # A row per user whose balance changed since the previous run; ledger_id is the last ledger row it includes
+        '''CREATE TABLE balance_snapshots (
+               guild_id INTEGER NOT NULL,
+               user_id INTEGER NOT NULL,
+               ledger_id INTEGER NOT NULL,
+               balance INTEGER NOT NULL,
+               taken_at TEXT NOT NULL,
+               PRIMARY KEY (guild_id, user_id, ledger_id))''',
+        '''CREATE TABLE snapshot_runs (
+               ledger_id INTEGER PRIMARY KEY,
+               taken_at TEXT NOT NULL,
+               users INTEGER NOT NULL,
+               duration REAL NOT NULL DEFAULT 0)''',
+        _baseline_snapshot,
+        _ledger_triggers,
+    ]),
+    # When each maintenance task last ran, so restarts don't make them due again (see economy/maintenance.py)
+    (12, "maintenance runs", [
+        '''CREATE TABLE maintenance_runs (
+               task TEXT PRIMARY KEY,
+               ran_at TEXT NOT NULL)''',
+    ]),
+    # A job pays into the economy it was taken in (see economy/job.py); jobs from before pay into the global one
+    (13, "job economies", [
+        'ALTER TABLE user_jobs ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0',
+    ]),
+]
+
+# (name, query, parameters, index the planner is expected to use)
+HOT_QUERIES = [
+    ("stock history",
+     'SELECT price, timestamp FROM stock_price_history WHERE stock_id = ? ORDER BY timestamp DESC',
+     ('SPC1',), 'idx_stock_price_history_stock_time'),
+    ("stock price 24h ago",
+     'SELECT price FROM stock_price_history WHERE stock_id = ? AND timestamp < ? ORDER BY timestamp DESC LIMIT 1',
+     ('SPC1', '2000-01-01'), 'idx_stock_price_history_stock_time'),
+    ("pending trades for user",
+     "SELECT * FROM trades WHERE guild_id = ? AND user2_id = ? AND status = 'pending'",
+     (0, 0), 'idx_trades_guild_user2_status'),
+    ("credits leaderboard",
+     'SELECT user_id, balance FROM users WHERE guild_id = ? ORDER BY balance DESC LIMIT 10',
+     (0,), 'idx_users_guild_balance'),
+    ("job points leaderboard",
+     'SELECT user_id, job_points FROM users WHERE guild_id = ? ORDER BY job_points DESC LIMIT 10',
+     (0,), 'idx_users_guild_job_points'),
+    ("net worth leaderboard",
+     'SELECT user_id, balance + holdings FROM users WHERE guild_id = ? ORDER BY balance + holdings DESC LIMIT 10',
+     (0,), 'idx_users_guild_net_worth'),
+    ("ledger for user",
+     'SELECT id, delta FROM ledger WHERE guild_id = ? AND user_id = ? AND id > ? ORDER BY id',
+     (0, 0, 0), 'idx_ledger_user'),
+    ("credits rank",
+     'SELECT COUNT(*) FROM users WHERE guild_id = ? AND balance > ?',
+     (0, 0), 'idx_users_guild_balance'),
+]
+
+async def _apply_migration(conn, number: int, description: str, statements):
+    for statement in statements:
+        if callable(statement):
+            await statement(conn)
+        else:
+            await conn.execute(db.backend.translate_ddl(statement))
+    await conn.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                       (number, description, datetime.utcnow().isoformat()))
+
+async def get_schema_version() -> int:
+    async with db.acquire() as conn:
+        row = await conn.fetchone('SELECT MAX(version) FROM schema_version')
+    return row[0] or 0
+
+async def run_migrations() -> int:
+    """Apply every pending migration in order and return the resulting schema version.
+
+    Each migration runs atomically through the writer.
+    """
+    await writer.execute(db.backend.translate_ddl('''CREATE TABLE IF NOT EXISTS schema_version (
+                                version INTEGER PRIMARY KEY,
+                                description TEXT NOT NULL,
+                                applied_at TEXT NOT NULL)'''))
+    version = await get_schema_version()
+    for number, description, statements in MIGRATIONS:
+        if number <= version:
+            continue
+        await writer.run(_apply_migration, number, description, statements)
+        print(f"Applied database migration {number}: {description}")
+        version = number
+    return version
+
+async def check_query_plans():
+    """Run EXPLAIN QUERY PLAN on every hot query.
+
+    Returns a list of (name, uses_expected_index, plan) tuples. The plans are
+    SQLite's, so other backends return an empty list.
+    """
+    results = []
+    if db.backend.name != "sqlite":
+        return results
+    async with db.acquire() as conn:
+        # EXPLAIN alone never opens a read transaction, so touch the schema first
+        # to make sure this connection has seen the latest migrations
+        await conn.fetchone('SELECT COUNT(*) FROM sqlite_master')
+        for name, query, params, index in HOT_QUERIES:
+            rows = await conn.fetchall(f'EXPLAIN QUERY PLAN {query}', params)
+            plan = '; '.join(row[3] for row in rows)
+            results.append((name, f'INDEX {index}' in plan, plan))
+    return results
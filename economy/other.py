@@ -1,28 +1,27 @@
-import asqlite
-from datetime import datetime, timedelta
+from economy import writer
+from economy.accounts import accounts, ACCOUNT_COLUMNS
+from economy.cooldowns import cooldowns
+from datetime import timedelta
 from typing import Tuple
 
-async def claim_daily(user_id: int) -> int:
+DAILY_COOLDOWN = timedelta(days=1)
+
+async def claim_daily(user_id: int, guild_id: int = 0) -> int:
     reward = 1000
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('UPDATE users SET balance = balance + ?, last_daily = ? WHERE user_id = ?', (reward, datetime.utcnow().isoformat(), user_id))
-            await conn.commit()
+    cooldowns.start(user_id, 'daily', DAILY_COOLDOWN, guild_id)
+    try:
+        row = await writer.fetchone(f'''INSERT INTO users (guild_id, user_id, balance) VALUES (?, ?, ?)
+                                        ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = users.balance + excluded.balance
+                                        RETURNING {ACCOUNT_COLUMNS}''',
+                                    (guild_id, user_id, reward))
+    except Exception:
+        cooldowns.clear(user_id, 'daily', guild_id)
+        raise
+    accounts.put(user_id, guild_id, row)
     return reward
 
-async def can_claim_daily(user_id: int) -> Tuple[bool, str]:
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT last_daily FROM users WHERE user_id = ?', (user_id,))
-            result = await cursor.fetchone()
-            if result and result[0]:
-                last_daily = datetime.fromisoformat(result[0])
-                next_daily = last_daily + timedelta(days=1)
-                now = datetime.utcnow()
-                if now >= next_daily:
-                    return True, ""
-                else:
-                    time_left = next_daily - now
-                    return False, str(time_left)
-            else:
-                return True, ""
\ No newline at end of file
+async def can_claim_daily(user_id: int, guild_id: int = 0) -> Tuple[bool, str]:
+    time_left = cooldowns.remaining(user_id, 'daily', guild_id)
+    if time_left:
+        return False, str(time_left)
+    return True, ""
@@ -1,34 +1,38 @@
-import asqlite 
+from economy import writer
+from economy.accounts import accounts, ACCOUNT_COLUMNS
 
-async def remove_balance(user_id: int, amount: int) -> None:
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('INSERT OR IGNORE INTO users (user_id, balance) VALUES (?, ?)', (user_id, 0))
-            await cursor.execute('UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ?', (amount, user_id, amount))
-            await conn.commit()
+# Every function takes the economy it works on as guild_id (see economy.guilds);
+# 0 is the global economy. Balances are read from the account cache, and every
+# write hands the row it RETURNED back to it.
 
-async def add_balance(user_id: int, amount: int) -> None:
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('INSERT OR IGNORE INTO users (user_id, balance) VALUES (?, ?)', (user_id, 0))
-            await cursor.execute('UPDATE users SET balance = balance + ? WHERE user_id = ?', (amount, user_id))
-            await conn.commit()
+async def remove_balance(user_id: int, amount: int, guild_id: int = 0) -> None:
+    row = await writer.fetchone(f'''INSERT INTO users (guild_id, user_id, balance) VALUES (?, ?, 0)
+                                    ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = users.balance - ? WHERE users.balance >= ?
+                                    RETURNING {ACCOUNT_COLUMNS}''',
+                                (guild_id, user_id, amount, amount))
+    accounts.put(user_id, guild_id, row)
 
-async def transfer_credits(sender_id: int, receiver_id: int, amount: int):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('UPDATE users SET balance = balance - ? WHERE user_id = ?', (amount, sender_id))
-            await cursor.execute('INSERT INTO users (user_id, balance) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET balance = balance + ?', (receiver_id, amount, amount))
-            await conn.commit()
+async def add_balance(user_id: int, amount: int, guild_id: int = 0) -> None:
+    row = await writer.fetchone(f'''INSERT INTO users (guild_id, user_id, balance) VALUES (?, ?, ?)
+                                    ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = users.balance + excluded.balance
+                                    RETURNING {ACCOUNT_COLUMNS}''',
+                                (guild_id, user_id, amount))
+    accounts.put(user_id, guild_id, row)
 
-async def get_balance(user_id: int) -> int:
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
-            result = await cursor.fetchone()
-            if result:
-                return result[0]
-            else:
-                await cursor.execute('INSERT INTO users (user_id, balance) VALUES (?, 0)', (user_id,))
-                await conn.commit()
-                return 0
\ No newline at end of file
+async def _transfer(conn, sender_id: int, receiver_id: int, amount: int, guild_id: int):
+    sender = await conn.fetchone(f'UPDATE users SET balance = balance - ? WHERE guild_id = ? AND user_id = ? RETURNING {ACCOUNT_COLUMNS}',
+                                 (amount, guild_id, sender_id))
+    receiver = await conn.fetchone(f'''INSERT INTO users (guild_id, user_id, balance) VALUES (?, ?, ?)
+                                       ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = users.balance + excluded.balance
+                                       RETURNING {ACCOUNT_COLUMNS}''',
+                                   (guild_id, receiver_id, amount))
+    return sender, receiver
+
+async def transfer_credits(sender_id: int, receiver_id: int, amount: int, guild_id: int = 0):
+    sender, receiver = await writer.run(_transfer, sender_id, receiver_id, amount, guild_id)
+    accounts.put(sender_id, guild_id, sender)
+    accounts.put(receiver_id, guild_id, receiver)
+
+async def get_balance(user_id: int, guild_id: int = 0) -> int:
+    """A user's balance; users without a row have 0. Never writes."""
+    return (await accounts.get(user_id, guild_id)).balance
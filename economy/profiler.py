@@ -0,0 +1,91 @@
+import re
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+import settings
+
+# Every statement that goes through an economy.db connection is timed here and
+# grouped by fingerprint: its SQL with literals replaced by ? and whitespace
+# collapsed. Statements slower than SLOW_QUERY_MS are printed with their plan.
+enabled = settings.DB_PROFILER
+slow_threshold = settings.SLOW_QUERY_MS / 1000
+
+# The command whose statements are running. Set before every command is
+# invoked; the writer carries it over to the statements it runs for it.
+current_command: ContextVar[Optional[str]] = ContextVar('current_command', default=None)
+
+# Upper bounds of the latency histogram buckets, in seconds; a last bucket holds the rest
+BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1.0)
+
+# Transaction control the writer issues around every batch and request, and
+# the PostgreSQL backend's per-request command tag; whatever command happens
+# to be current did not ask for them
+IGNORED = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'SELECT set_config(')
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+
+class StatementStats:
+    __slots__ = ('fingerprint', 'count', 'total', 'max', 'rows', 'buckets', 'commands')
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.commands = Counter()
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of calls (the max for the last bucket)."""
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+_stats = {}
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql: str) -> str:
+    return _WHITESPACE.sub(' ', _LITERALS.sub('?', sql)).strip()
+
+def record(sql: str, elapsed: float, rows: int) -> bool:
+    """Count one statement and return whether it was slow."""
+    key = fingerprint(sql)
+    if key.startswith(IGNORED):
+        return False
+    stats = _stats.get(key)
+    if stats is None:
+        stats = _stats[key] = StatementStats(key)
+    stats.count += 1
+    stats.total += elapsed
+    stats.rows += rows
+    if elapsed > stats.max:
+        stats.max = elapsed
+    bucket = 0
+    while bucket < len(BUCKETS) and elapsed > BUCKETS[bucket]:
+        bucket += 1
+    stats.buckets[bucket] += 1
+    stats.commands[current_command.get() or 'background'] += 1
+    return elapsed >= slow_threshold
+
+def log_slow(sql: str, elapsed: float, rows: int, plan: Optional[str]):
+    print(f"Slow query ({elapsed * 1000:.1f} ms, {rows} rows, command {current_command.get() or 'background'}): {fingerprint(sql)}")
+    if plan:
+        print(f"  plan: {plan}")
+
+def top(count: int = 10, by: str = 'total') -> list:
+    """The ``count`` statements with the highest ``by`` (total, mean, max or count)."""
+    return sorted(_stats.values(), key=lambda stats: getattr(stats, by), reverse=True)[:count]
+
+def reset():
+    _stats.clear()
@@ -0,0 +1,100 @@
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from economy import writer
+import settings
+
+class RetentionPolicy(NamedTuple):
+    """How long rows of one table are kept.
+
+    Rows matching ``where`` whose ``timestamp`` column is older than ``max_age``
+    (or NULL) are deleted, after being copied to ``archive`` when one is given.
+    ``key`` must be unique; it is the keyset the pruner walks in batches.
+    ``timestamp`` holds ISO text, or Unix seconds when ``epoch`` is set.
+    ``children`` are (table, archive) pairs of tables whose rows belong to a
+    row of this one by the same key columns; they go (and are archived) with it.
+    """
+    table: str
+    key: tuple
+    timestamp: str
+    max_age: timedelta
+    where: Optional[str] = None
+    archive: Optional[str] = None
+    epoch: bool = False
+    children: tuple = ()
+
+POLICIES = [
+    # Finished trades are only looked at for a while after they close
+    RetentionPolicy('trades', ('trade_id',), 'closed_at', timedelta(days=settings.TRADE_RETENTION_DAYS),
+                    where="status <> 'pending'", archive='trades_archive',
+                    children=(('trade_items', 'trade_items_archive'),)),
+    # An expired cooldown is never read again (see economy/cooldowns.py)
+    RetentionPolicy('cooldowns', ('user_id', 'action', 'scope'), 'expires_at', timedelta(0), epoch=True),
+]
+
+class RetentionResult(NamedTuple):
+    table: str
+    removed: int
+    archived: bool
+    duration: float  # seconds
+
+def _key_tuple(key: tuple) -> str:
+    return f"({', '.join(key)})" if len(key) > 1 else key[0]
+
+def _placeholders(key: tuple) -> str:
+    return f"({', '.join('?' for _ in key)})" if len(key) > 1 else '?'
+
+async def _prune_batch(conn, policy: RetentionPolicy, cutoff, after: Optional[tuple], size: int):
+    """Archive and delete up to ``size`` expired rows with keys after ``after``.
+
+    Returns (rows removed, last key seen), or (0, None) once nothing is left.
+    """
+    key = _key_tuple(policy.key)
+    conditions = [f"({policy.timestamp} < ? OR {policy.timestamp} IS NULL)"]
+    params = [cutoff]
+    if policy.where:
+        conditions.append(f"({policy.where})")
+    if after is not None:
+        conditions.append(f"{key} > {_placeholders(policy.key)}")
+        params.extend(after)
+    expired = ' AND '.join(conditions)
+
+    rows = await conn.fetchall(f"SELECT {', '.join(policy.key)} FROM {policy.table} WHERE {expired} ORDER BY {', '.join(policy.key)} LIMIT ?",
+                               (*params, size))
+    if not rows:
+        return 0, None
+    last = tuple(rows[-1])
+
+    # Everything expired up to and including the last key is exactly this batch
+    batch = f"{expired} AND {key} <= {_placeholders(policy.key)}"
+    batch_params = (*params, *last)
+    for child, archive in policy.children:
+        # Children first, they reference the rows about to go
+        owned = f"{key} IN (SELECT {', '.join(policy.key)} FROM {policy.table} WHERE {batch})"
+        if archive:
+            await conn.execute(f"INSERT INTO {archive} SELECT * FROM {child} WHERE {owned}", batch_params)
+        await conn.execute(f"DELETE FROM {child} WHERE {owned}", batch_params)
+    if policy.archive:
+        await conn.execute(f"INSERT INTO {policy.archive} SELECT * FROM {policy.table} WHERE {batch}", batch_params)
+    removed = await conn.execute(f"DELETE FROM {policy.table} WHERE {batch}", batch_params)
+    return removed, last
+
+async def apply_policy(policy: RetentionPolicy, batch_size: int = settings.RETENTION_BATCH_SIZE) -> RetentionResult:
+    """Prune one table in small write transactions so the write lock is never held for long."""
+    started = time.perf_counter()
+    if policy.epoch:
+        cutoff = int(time.time() - policy.max_age.total_seconds())
+    else:
+        cutoff = (datetime.utcnow() - policy.max_age).isoformat()
+    removed = 0
+    after = None
+    while True:
+        count, after = await writer.run(_prune_batch, policy, cutoff, after, batch_size)
+        if after is None:
+            break
+        removed += count
+    return RetentionResult(policy.table, removed, policy.archive is not None, time.perf_counter() - started)
+
+async def apply_retention(policies=POLICIES) -> list:
+    """Apply every retention policy and return a RetentionResult per table."""
+    return [await apply_policy(policy) for policy in policies]
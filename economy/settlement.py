@@ -0,0 +1,92 @@
+import time
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Optional
+from economy import db, writer, profiler
+from economy.accounts import accounts
+from economy.market import market
+import settings
+
+# Once a day every stock holder is paid DIVIDEND_RATE of the value of their
+# holdings and every positive balance earns INTEREST_RATE (or pays it, when
+# negative). A day is settled with a couple of set-based statements in one
+# transaction, together with its settlement_runs row: a run interrupted by a
+# restart leaves nothing behind and is simply run again, and a day that has
+# a row is never paid twice.
+
+class SettlementRun(NamedTuple):
+    period: str  # the UTC day settled, YYYY-MM-DD
+    dividend_accounts: int
+    interest_accounts: int
+    duration: float  # seconds
+
+async def _settle(conn, period: str, dividend_rate: float, interest_rate: float) -> Optional[SettlementRun]:
+    started = time.perf_counter()
+    claimed = await conn.fetchone('''INSERT INTO settlement_runs (period, started_at) VALUES (?, ?)
+                                     ON CONFLICT(period) DO NOTHING RETURNING period''',
+                                  (period, datetime.utcnow().isoformat()))
+    if not claimed:
+        return None
+
+    # Interest first, so the dividends paid today don't earn interest today
+    interest_accounts = 0
+    if interest_rate:
+        interest_accounts = await conn.execute_bulk('UPDATE users SET balance = balance + CAST(TRUNC(balance * CAST(? AS DOUBLE PRECISION)) AS BIGINT) WHERE balance > 0',
+                                                    (interest_rate,))
+    dividend_accounts = 0
+    if dividend_rate:
+        dividend_accounts = await conn.execute_bulk('''
+            INSERT INTO users (guild_id, user_id, balance)
+            SELECT user_stocks.guild_id, user_stocks.user_id, CAST(TRUNC(SUM(user_stocks.quantity * stocks.price) * CAST(? AS DOUBLE PRECISION)) AS BIGINT)
+            FROM user_stocks
+            JOIN stocks ON stocks.stock_id = user_stocks.stock_id
+            WHERE user_stocks.quantity > 0
+            GROUP BY user_stocks.guild_id, user_stocks.user_id
+            HAVING CAST(TRUNC(SUM(user_stocks.quantity * stocks.price) * CAST(? AS DOUBLE PRECISION)) AS BIGINT) > 0
+            ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = users.balance + excluded.balance
+        ''', (dividend_rate, dividend_rate))
+
+    duration = time.perf_counter() - started
+    await conn.execute('UPDATE settlement_runs SET dividend_accounts = ?, interest_accounts = ?, duration = ? WHERE period = ?',
+                       (dividend_accounts, interest_accounts, duration, period))
+    return SettlementRun(period, dividend_accounts, interest_accounts, duration)
+
+async def pending_periods(today: Optional[date] = None) -> list:
+    """The days not settled yet, oldest first: today, plus missed days up to SETTLEMENT_CATCH_UP_DAYS back."""
+    today = today or datetime.utcnow().date()
+    async with db.acquire() as conn:
+        row = await conn.fetchone('SELECT MAX(period) FROM settlement_runs')
+    if not row or not row[0]:
+        # Nothing to catch up on before the very first run
+        return [today.isoformat()]
+    first = max(today - timedelta(days=max(settings.SETTLEMENT_CATCH_UP_DAYS - 1, 0)),
+                date.fromisoformat(row[0]) + timedelta(days=1))
+    return [(first + timedelta(days=offset)).isoformat() for offset in range((today - first).days + 1)]
+
+async def settle(dividend_rate: float = settings.DIVIDEND_RATE, interest_rate: float = settings.INTEREST_RATE) -> list:
+    """Settle every pending day and return a SettlementRun for each one that ran."""
+    runs = []
+    periods = await pending_periods()
+    if periods:
+        # Dividends are paid on stocks.price, which trails the market's prices until they are written
+        await market.flush()
+    for period in periods:
+        # Shows up as the command of its ledger rows and queries
+        token = profiler.current_command.set('settlement')
+        try:
+            run = await writer.run(_settle, period, dividend_rate, interest_rate)
+        finally:
+            profiler.current_command.reset(token)
+        if run is None:
+            continue
+        # Balances changed in bulk, so start the account cache over
+        accounts.clear()
+        print(f"Settled {run.period}: dividends to {run.dividend_accounts} accounts, "
+              f"interest on {run.interest_accounts} accounts in {run.duration:.2f}s")
+        runs.append(run)
+    return runs
+
+async def recent_runs(count: int = 7) -> list:
+    async with db.acquire() as conn:
+        rows = await conn.fetchall('''SELECT period, dividend_accounts, interest_accounts, duration
+                                      FROM settlement_runs ORDER BY period DESC LIMIT ?''', (count,))
+    return [SettlementRun(*row) for row in rows]
@@ -1,5 +1,8 @@
-import asqlite
+from economy import db, writer
+from economy.accounts import accounts, ACCOUNT_COLUMNS
+from economy.market import market
 import asyncio
+import math
 import matplotlib.pyplot as plt
 import datetime
 import io
@@ -27,97 +30,156 @@ def generate_stock_graph(history, stock_id):
     return buffer
 
 async def fetch_stock_history(stock_id):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT price, timestamp FROM stock_price_history WHERE stock_id = ? ORDER BY timestamp DESC', (stock_id,))
-            history = await cursor.fetchall()
+    async with db.acquire() as conn:
+        history = await conn.fetchall('SELECT price, timestamp FROM stock_price_history WHERE stock_id = ? ORDER BY timestamp DESC', (stock_id,))
     return history
 
+async def get_market_trends():
+    """Price change of every stock over the last 24 hours as (name, current_price, previous_price) rows."""
+    twenty_four_hours_ago = (datetime.datetime.utcnow() - datetime.timedelta(days=1)).isoformat()
+    async with db.acquire() as conn:
+        rows = await conn.fetchall('''
+            SELECT s.stock_id,
+                (SELECT price FROM stock_price_history WHERE stock_id = s.stock_id AND timestamp < ? ORDER BY timestamp DESC LIMIT 1)
+            FROM stocks s
+        ''', (twenty_four_hours_ago,))
+    # The current prices are the market's, which may not be written yet
+    trends = []
+    for stock_id, previous_price in rows:
+        stock = market.stock(stock_id)
+        if stock is not None and previous_price is not None:
+            trends.append((stock.name, stock.price, previous_price))
+    return trends
+
+async def get_portfolio(user_id: int, guild_id: int = 0):
+    """The user's stocks as (stock_id, name, quantity, price) rows, priced by the market."""
+    async with db.acquire() as conn:
+        holdings = await conn.fetchall('SELECT stock_id, quantity FROM user_stocks WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+    portfolio = []
+    for stock_id, quantity in holdings:
+        stock = market.stock(stock_id)
+        if stock is not None:
+            portfolio.append((stock_id, stock.name, quantity, stock.price))
+    return portfolio
+
 async def update_stock_price(stock_id: str, amount: float):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT price FROM stocks WHERE stock_id = ?', (stock_id,))
-            current_price = await cursor.fetchone()
-            
-            if current_price:
-                new_price = max(0, current_price[0] + amount)
-                await cursor.execute('UPDATE stocks SET price = ? WHERE stock_id = ?', (new_price, stock_id))
-                
-                await log_stock_price(stock_id, new_price)
-        await conn.commit()
+    """Move a stock's price by ``amount`` and return the new price, or None if there is no such stock."""
+    return await market.move(stock_id, amount)
 
 async def clean_stock_price_history():
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT COUNT(*) FROM stock_price_history')
-            count = await cursor.fetchone()
-            
-            if count[0] > 2000:
-                await cursor.execute('''
-                    DELETE FROM stock_price_history
-                    WHERE timestamp IN (
-                        SELECT timestamp
-                        FROM stock_price_history
-                        ORDER BY timestamp ASC
-                        LIMIT 1000
-                    )
-                ''')
-        await conn.commit()
+    async def clean(conn):
+        count = await conn.fetchone('SELECT COUNT(*) FROM stock_price_history')
+
+        if count[0] > 2000:
+            # Rows are appended in time order, so the oldest rows have the lowest ids
+            await conn.execute('''
+                DELETE FROM stock_price_history
+                WHERE id IN (
+                    SELECT id
+                    FROM stock_price_history
+                    ORDER BY id ASC
+                    LIMIT 1000
+                )
+            ''')
+
+    await writer.run(clean)
 
 async def random_price_fluctuation():
     while True:
         await clean_stock_price_history()
-        async with asqlite.connect('space.db') as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute('SELECT stock_id FROM stocks')
-                stock_ids = [row[0] for row in await cursor.fetchall()]
-                
-                for stock_id in stock_ids:
-                    fluctuation = random.uniform(-5.0, 5.0)
-                    await update_stock_price(stock_id, fluctuation)
-                    
+        # The market writes the whole tick behind in one batch
+        await asyncio.gather(*(update_stock_price(stock.stock_id, random.uniform(-5.0, 5.0)) for stock in market.stocks()))
+
         await asyncio.sleep(30)
 
 
 
 
-async def check_user_balance(user_id: int, amount: int) -> bool:
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
-            balance = await cursor.fetchone()
-            return balance[0] >= amount if balance else False
-
-async def update_user_balance(user_id: int, amount: int):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('UPDATE users SET balance = balance + ? WHERE user_id = ?', (amount, user_id))
-        await conn.commit()
-
-async def update_user_portfolio(user_id: int, stock_id: str, quantity: int):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            if quantity > 0:
-                await cursor.execute('INSERT INTO user_stocks (user_id, stock_id, quantity) VALUES (?, ?, ?) ON CONFLICT(user_id, stock_id) DO UPDATE SET quantity = quantity + ?', (user_id, stock_id, quantity, quantity))
-            else:
-                await cursor.execute('UPDATE user_stocks SET quantity = quantity + ? WHERE user_id = ? AND stock_id = ?', (quantity, user_id, stock_id))
-            if quantity == 0:
-                await cursor.execute('DELETE FROM user_stocks WHERE user_id = ? AND stock_id = ?', (user_id, stock_id))
-        await conn.commit()
-
-async def get_user_stock_quantity(user_id: int, stock_id: str) -> int:
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT quantity FROM user_stocks WHERE user_id = ? AND stock_id = ?', (user_id, stock_id))
-            result = await cursor.fetchone()
-            return result[0] if result else 0
-
-async def log_stock_price(stock_id: str, price: float):
-    timestamp = datetime.datetime.utcnow().isoformat()
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute(
-                'INSERT INTO stock_price_history (stock_id, price, timestamp) VALUES (?, ?, ?)',
-                (stock_id, price, timestamp)
-            )
-        await conn.commit()
+async def check_user_balance(user_id: int, amount: int, guild_id: int = 0) -> bool:
+    account = await accounts.get(user_id, guild_id)
+    return account.balance >= amount
+
+async def update_user_balance(user_id: int, amount: int, guild_id: int = 0):
+    # Balances are whole credits; callers round amounts computed from stock prices in their own disfavour
+    row = await writer.fetchone(f'UPDATE users SET balance = balance + ? WHERE guild_id = ? AND user_id = ? RETURNING {ACCOUNT_COLUMNS}',
+                                (int(amount), guild_id, user_id))
+    accounts.put(user_id, guild_id, row)
+
+async def update_user_portfolio(user_id: int, stock_id: str, quantity: int, guild_id: int = 0):
+    if quantity > 0:
+        await writer.execute('INSERT INTO user_stocks (guild_id, user_id, stock_id, quantity) VALUES (?, ?, ?, ?) ON CONFLICT(guild_id, user_id, stock_id) DO UPDATE SET quantity = user_stocks.quantity + ?', (guild_id, user_id, stock_id, quantity, quantity))
+    else:
+        await writer.execute_many(
+            ('UPDATE user_stocks SET quantity = quantity + ? WHERE guild_id = ? AND user_id = ? AND stock_id = ?', (quantity, guild_id, user_id, stock_id)),
+            ('DELETE FROM user_stocks WHERE guild_id = ? AND user_id = ? AND stock_id = ? AND quantity <= 0', (guild_id, user_id, stock_id)),
+        )
+
+async def _buy(conn, user_id: int, stock_id: str, quantity: int, cost: int, guild_id: int):
+    account = await conn.fetchone(f'UPDATE users SET balance = balance - ? WHERE guild_id = ? AND user_id = ? AND balance >= ? RETURNING {ACCOUNT_COLUMNS}',
+                                  (cost, guild_id, user_id, cost))
+    if account is None:
+        return None
+    await conn.execute('INSERT INTO user_stocks (guild_id, user_id, stock_id, quantity) VALUES (?, ?, ?, ?) ON CONFLICT(guild_id, user_id, stock_id) DO UPDATE SET quantity = user_stocks.quantity + ?',
+                       (guild_id, user_id, stock_id, quantity, quantity))
+    return account
+
+async def _sell(conn, user_id: int, stock_id: str, quantity: int, proceeds: int, guild_id: int):
+    if await conn.execute('UPDATE user_stocks SET quantity = quantity - ? WHERE guild_id = ? AND user_id = ? AND stock_id = ? AND quantity >= ?',
+                          (quantity, guild_id, user_id, stock_id, quantity)) == 0:
+        return None
+    await conn.execute('DELETE FROM user_stocks WHERE guild_id = ? AND user_id = ? AND stock_id = ? AND quantity <= 0', (guild_id, user_id, stock_id))
+    return await conn.fetchone(f'''INSERT INTO users (guild_id, user_id, balance) VALUES (?, ?, ?)
+                                   ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = users.balance + excluded.balance
+                                   RETURNING {ACCOUNT_COLUMNS}''',
+                               (guild_id, user_id, proceeds))
+
+# Trades settle inside the market's step, at the price they then move, so
+# concurrent trades each pay the price the one before left behind. The charge
+# or payout and the shares are one write, so neither happens without the other.
+
+async def buy_shares(user_id: int, stock_id: str, quantity: int, price_adjustment: float, guild_id: int = 0):
+    """Buy shares at the current price, which then rises by ``price_adjustment`` of it per share.
+
+    Returns (cost, new_price), with cost None if the user can't afford them,
+    or None if there is no such stock.
+    """
+    async def settle(price):
+        # Balances are whole credits: round the cost up, so no share is ever free
+        cost = math.ceil(price * quantity)
+        account = await writer.run(_buy, user_id, stock_id, quantity, cost, guild_id)
+        if account is None:
+            return None, 0
+        accounts.put(user_id, guild_id, account)
+        return cost, price * price_adjustment * quantity
+
+    return await market.trade(stock_id, settle)
+
+async def sell_shares(user_id: int, stock_id: str, quantity: int, price_adjustment: float, guild_id: int = 0):
+    """Sell shares at the current price, which then falls by ``price_adjustment`` of it per share.
+
+    Returns (proceeds, new_price), with proceeds None if the user has fewer
+    shares, or None if there is no such stock.
+    """
+    async def settle(price):
+        # ...and the proceeds down, so selling never pays more than the shares are worth
+        proceeds = math.floor(price * quantity)
+        account = await writer.run(_sell, user_id, stock_id, quantity, proceeds, guild_id)
+        if account is None:
+            return None, 0
+        accounts.put(user_id, guild_id, account)
+        return proceeds, -price * price_adjustment * quantity
+
+    return await market.trade(stock_id, settle)
+
+async def get_stocks(sort_order: str = 'ASC'):
+    """Every stock as (stock_id, name, price), by price."""
+    return market.stocks(descending=sort_order == 'DESC')
+
+async def get_stock_price(stock_id: str):
+    stock = market.stock(stock_id)
+    return stock.price if stock else None
+
+async def get_user_stock_quantity(user_id: int, stock_id: str, guild_id: int = 0) -> int:
+    async with db.acquire() as conn:
+        result = await conn.fetchone('SELECT quantity FROM user_stocks WHERE guild_id = ? AND user_id = ? AND stock_id = ?', (guild_id, user_id, stock_id))
+    return result[0] if result else 0
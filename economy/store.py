@@ -1,44 +1,43 @@
-import asqlite
-
-async def buy_item(user_id: int, item_id: str):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT item_price FROM shop_items WHERE item_id = ?', (item_id,))
-            item_price = await cursor.fetchone()
-            if not item_price:
-                return False, "Item not found."
-            item_price = item_price[0]
-
-            await cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
-            balance = await cursor.fetchone()
-            if not balance or balance[0] < item_price:
-                return False, "Insufficient balance."
-
-            await cursor.execute('UPDATE users SET balance = balance - ? WHERE user_id = ?', (item_price, user_id))
-            await add_to_inventory(user_id, item_id, 1)
-        await conn.commit()
-    return True, "Purchase successful."
-
-async def add_to_inventory(user_id: int, item_id: str, quantity: int):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('''INSERT INTO user_inventory (user_id, item_id, quantity)
-                                   VALUES (?, ?, ?)
-                                   ON CONFLICT(user_id, item_id) DO UPDATE SET quantity = quantity + ?''',
-                                 (user_id, item_id, quantity, quantity))
-        await conn.commit()
-
-
-async def add_shop_item(item_id: str, item_name: str, item_price: int):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('INSERT INTO shop_items (item_id, item_name, item_price) VALUES (?, ?, ?)',
-                                 (item_id, item_name, item_price))
-        await conn.commit()
-
-async def get_shop_items():
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT item_id, item_name, item_price FROM shop_items')
-            items = await cursor.fetchall()
-    return items
+from economy import writer
+from economy.accounts import accounts, ACCOUNT_COLUMNS
+from economy.catalog import catalog, ShopItem, DEFAULT_TIER
+
+async def buy_item(user_id: int, item_id: str, guild_id: int = 0):
+    item = catalog.item(item_id)
+    if not item:
+        return False, "Item not found."
+    item_price = item.item_price
+
+    async def purchase(conn):
+        balance = await conn.fetchone('SELECT balance FROM users WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+        if not balance or balance[0] < item_price:
+            return False, "Insufficient balance.", None
+
+        account = await conn.fetchone(f'UPDATE users SET balance = balance - ? WHERE guild_id = ? AND user_id = ? RETURNING {ACCOUNT_COLUMNS}',
+                                      (item_price, guild_id, user_id))
+        await conn.execute('''INSERT INTO user_inventory (guild_id, user_id, item_id, quantity)
+                              VALUES (?, ?, ?, 1)
+                              ON CONFLICT(guild_id, user_id, item_id) DO UPDATE SET quantity = user_inventory.quantity + 1''',
+                           (guild_id, user_id, item_id))
+        return True, "Purchase successful.", account
+
+    success, message, account = await writer.run(purchase)
+    if account:
+        accounts.put(user_id, guild_id, account)
+    return success, message
+
+async def add_to_inventory(user_id: int, item_id: str, quantity: int, guild_id: int = 0):
+    await writer.execute('''INSERT INTO user_inventory (guild_id, user_id, item_id, quantity)
+                            VALUES (?, ?, ?, ?)
+                            ON CONFLICT(guild_id, user_id, item_id) DO UPDATE SET quantity = user_inventory.quantity + ?''',
+                         (guild_id, user_id, item_id, quantity, quantity))
+
+
+async def add_shop_item(item_id: str, item_name: str, item_price: int, tier: str = DEFAULT_TIER, loot_weight: float = 1.0):
+    await writer.execute('INSERT INTO shop_items (item_id, item_name, item_price, tier, loot_weight) VALUES (?, ?, ?, ?, ?)',
+                         (item_id, item_name, item_price, tier, loot_weight))
+    catalog.put_item(ShopItem(item_id, item_name, item_price, tier, loot_weight))
+
+async def get_shop_items() -> list:
+    """Every shop item as a ShopItem, cheapest first."""
+    return catalog.items()
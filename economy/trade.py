@@ -0,0 +1,170 @@
+from economy import db, writer
+from economy.locks import user_lock
+from economy.accounts import accounts, ACCOUNT_COLUMNS
+from economy.inventory import get_item_quantities
+from datetime import datetime
+
+# A trade is a trades row with the credits each side puts in, plus one
+# trade_items row per item and side. Accepting one settles it with a fixed
+# handful of set-based statements in a single write transaction, however
+# many items it holds.
+
+# trade_items.side
+OFFERED = 1    # given by user1, who proposed the trade
+REQUESTED = 2  # given by user2, who accepts it
+
+# Which user gives the items of a trade_items row: user1_id, user2_id follow as parameters
+_GIVER = 'CASE trade_items.side WHEN 1 THEN CAST(? AS BIGINT) ELSE CAST(? AS BIGINT) END'
+
+class TradeError(Exception):
+    """Raised inside a trade transaction to roll it back with a message for the user."""
+
+def parse_items(text: str) -> dict:
+    """Parse ``item_id[:quantity],item_id[:quantity],...`` into {item_id: quantity}."""
+    items = {}
+    for entry in text.split(','):
+        item_id, _, quantity = entry.strip().partition(':')
+        if not item_id:
+            continue
+        try:
+            quantity = int(quantity) if quantity else 1
+        except ValueError:
+            raise TradeError(f"Invalid quantity for {item_id}: {quantity}")
+        if quantity <= 0:
+            raise TradeError("Item quantities must be greater than zero.")
+        items[item_id] = items.get(item_id, 0) + quantity
+    if not items:
+        raise TradeError("Please list at least one item.")
+    return items
+
+def parse_offer(value: str, kind: str):
+    """One side of a trade as (items, credits) from a command's value and its 'items'/'credits' type."""
+    kind = kind.lower()
+    if kind in ('item', 'items'):
+        return parse_items(value), None
+    if kind in ('credit', 'credits'):
+        try:
+            credits = int(value)
+        except ValueError:
+            raise TradeError("Please provide a valid coin amount.")
+        if credits <= 0:
+            raise TradeError("Coin amounts must be greater than zero.")
+        return {}, credits
+    raise TradeError("Invalid type. Please specify 'items' or 'credits'.")
+
+async def first_missing_item(user_id: int, items: dict, guild_id: int = 0):
+    """The first of ``items`` the user does not have enough of, or None."""
+    owned = await get_item_quantities(user_id, items, guild_id)
+    return next((item_id for item_id, quantity in items.items() if owned.get(item_id, 0) < quantity), None)
+
+async def create_trade(user1_id: int, user2_id: int, offer_items: dict, request_items: dict, offer_credits, request_credits, guild_id: int = 0) -> int:
+    """Store a pending trade and return its id. Items are {item_id: quantity}."""
+    if user1_id == user2_id:
+        raise TradeError("You can't trade with yourself.")
+
+    async def create(conn):
+        row = await conn.fetchone(
+            "INSERT INTO trades (guild_id, user1_id, user2_id, user1_credits, user2_credits, status) VALUES (?, ?, ?, ?, ?, ?) RETURNING trade_id",
+            (guild_id, user1_id, user2_id, offer_credits, request_credits, 'pending')
+        )
+        trade_id = row[0]
+        items = [(trade_id, OFFERED, item_id, quantity) for item_id, quantity in offer_items.items()]
+        items += [(trade_id, REQUESTED, item_id, quantity) for item_id, quantity in request_items.items()]
+        if items:
+            await conn.executemany('INSERT INTO trade_items (trade_id, side, item_id, quantity) VALUES (?, ?, ?, ?)', items)
+        return trade_id
+
+    return await writer.run(create)
+
+async def _claim(conn, trade_id: int, user_id: int, guild_id: int):
+    """Mark the trade accepted and return (user1_id, user2_id, user1_credits, user2_credits)."""
+    trade = await conn.fetchone('''UPDATE trades SET status = 'accepted', closed_at = ?
+                                   WHERE trade_id = ? AND guild_id = ? AND user2_id = ? AND status = 'pending'
+                                   RETURNING user1_id, user2_id, user1_credits, user2_credits''',
+                                (datetime.utcnow().isoformat(), trade_id, guild_id, user_id))
+    if trade:
+        return trade
+
+    # Only failures pay for working out why
+    trade = await conn.fetchone("SELECT user2_id, status FROM trades WHERE trade_id = ? AND guild_id = ?", (trade_id, guild_id))
+    if not trade:
+        raise TradeError("Trade not found.")
+    if trade[1] != 'pending':
+        raise TradeError("This trade is not pending or has already been accepted/rejected.")
+    raise TradeError("This trade was not intended for you.")
+
+async def _move_credits(conn, guild_id: int, user1_id: int, user2_id: int, user1_credits, user2_credits) -> list:
+    """Settle the net credit difference in one upsert. Returns the (user_id, *Account) rows written."""
+    owed = (user1_credits or 0) - (user2_credits or 0)
+    if not owed:
+        return []
+    payer, payee = (user1_id, user2_id) if owed > 0 else (user2_id, user1_id)
+    rows = await conn.fetchall(f'''INSERT INTO users (guild_id, user_id, balance) VALUES (?, ?, ?), (?, ?, ?)
+                                   ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = users.balance + excluded.balance
+                                   RETURNING user_id, {ACCOUNT_COLUMNS}''',
+                               (guild_id, payer, -abs(owed), guild_id, payee, abs(owed)))
+    if any(row[0] == payer and row[1] < 0 for row in rows):
+        raise TradeError("User does not have enough credits" if payer == user1_id else "Recipient does not have enough credits")
+    return rows
+
+async def _move_items(conn, trade_id: int, guild_id: int, user1_id: int, user2_id: int):
+    """Check and move every item of both sides: one statement each to check, debit, tidy up and credit."""
+    short = await conn.fetchone(f'''SELECT trade_items.side, trade_items.item_id
+                                    FROM trade_items
+                                    LEFT JOIN user_inventory ON user_inventory.guild_id = ?
+                                        AND user_inventory.user_id = {_GIVER}
+                                        AND user_inventory.item_id = trade_items.item_id
+                                    WHERE trade_items.trade_id = ? AND COALESCE(user_inventory.quantity, 0) < trade_items.quantity
+                                    LIMIT 1''',
+                                (guild_id, user1_id, user2_id, trade_id))
+    if short:
+        who = "User" if short[0] == OFFERED else "Recipient"
+        raise TradeError(f"{who} does not have enough of item: {short[1]}")
+
+    moved = await conn.execute(f'''UPDATE user_inventory SET quantity = user_inventory.quantity - trade_items.quantity
+                                   FROM trade_items
+                                   WHERE trade_items.trade_id = ? AND user_inventory.guild_id = ?
+                                       AND user_inventory.user_id = {_GIVER}
+                                       AND user_inventory.item_id = trade_items.item_id''',
+                               (trade_id, guild_id, user1_id, user2_id))
+    if not moved:
+        return
+    await conn.execute('DELETE FROM user_inventory WHERE guild_id = ? AND user_id IN (?, ?) AND quantity <= 0',
+                       (guild_id, user1_id, user2_id))
+    await conn.execute('''INSERT INTO user_inventory (guild_id, user_id, item_id, quantity)
+                          SELECT CAST(? AS BIGINT), CASE side WHEN 1 THEN CAST(? AS BIGINT) ELSE CAST(? AS BIGINT) END, item_id, quantity FROM trade_items WHERE trade_id = ?
+                          ON CONFLICT(guild_id, user_id, item_id) DO UPDATE SET quantity = user_inventory.quantity + excluded.quantity''',
+                       (guild_id, user2_id, user1_id, trade_id))
+
+async def accept_trade(trade_id: int, user_id: int, guild_id: int = 0):
+    """Settle a pending trade addressed to ``user_id``.
+
+    Everything happens in one transaction: if any check fails, nothing moves
+    and TradeError is raised with the reason.
+    """
+    async def accept(conn):
+        user1_id, user2_id, user1_credits, user2_credits = await _claim(conn, trade_id, user_id, guild_id)
+        rows = await _move_credits(conn, guild_id, user1_id, user2_id, user1_credits, user2_credits)
+        await _move_items(conn, trade_id, guild_id, user1_id, user2_id)
+        return rows
+
+    # Lock both parties so a concurrent pay or rob cannot spend credits this trade relies on
+    async with db.acquire() as conn:
+        parties = await conn.fetchone("SELECT user1_id, user2_id FROM trades WHERE trade_id = ? AND guild_id = ?", (trade_id, guild_id))
+    if not parties:
+        raise TradeError("Trade not found.")
+    async with user_lock(parties[0], parties[1], guild_id=guild_id):
+        for row in await writer.run(accept):
+            accounts.put(row[0], guild_id, row[1:])
+
+async def reject_trade(trade_id: int, user_id: int, guild_id: int = 0) -> bool:
+    """Reject a pending trade addressed to ``user_id``. Returns False if there was none."""
+    updated = await writer.execute("UPDATE trades SET status = 'rejected', closed_at = ? WHERE trade_id = ? AND guild_id = ? AND user2_id = ? AND status = 'pending'",
+                                   (datetime.utcnow().isoformat(), trade_id, guild_id, user_id))
+    return updated > 0
+
+async def cancel_trade(trade_id: int, user_id: int, guild_id: int = 0) -> bool:
+    """Cancel a pending trade ``user_id`` is part of. Returns False if there was none."""
+    updated = await writer.execute("UPDATE trades SET status = 'cancelled', closed_at = ? WHERE trade_id = ? AND guild_id = ? AND (user1_id = ? OR user2_id = ?) AND status = 'pending'",
+                                   (datetime.utcnow().isoformat(), trade_id, guild_id, user_id, user_id))
+    return updated > 0
@@ -0,0 +1,188 @@
+import asyncio
+import contextlib
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+from economy import db, profiler
+import settings
+
+# Every mutation goes through one writer connection. Requests that arrive
+# within BATCH_WINDOW of each other are applied in a single transaction, so a
+# burst of commands costs one commit (and one fsync) instead of one each.
+# Each request runs inside its own SAVEPOINT: a failing request is rolled back
+# and reported to its caller without affecting the rest of the batch.
+BATCH_WINDOW = settings.DB_WRITE_BATCH_MS / 1000
+MAX_BATCH = 512
+
+_queue: Optional[asyncio.Queue] = None
+_task: Optional[asyncio.Task] = None
+
+# Requests written since start, used to spot quiet periods
+write_count = 0
+
+class _Request(NamedTuple):
+    func: Callable[..., Awaitable[Any]]
+    args: tuple
+    future: asyncio.Future
+    command: Optional[str]  # profiler.current_command of the caller
+
+class _Unbatched(NamedTuple):
+    """A request that must run on its own, outside any transaction (e.g. VACUUM)."""
+    func: Callable[..., Awaitable[Any]]
+    args: tuple
+    future: asyncio.Future
+
+async def _apply_batch(backend, batch):
+    """Apply a batch of requests in one transaction."""
+    conn = backend.writer
+    outcomes = []
+    await conn.execute(backend.begin)
+    try:
+        for request in batch:
+            await conn.execute('SAVEPOINT request')
+            token = profiler.current_command.set(request.command)
+            try:
+                await backend.set_command(conn, request.command)
+                result = await request.func(conn, *request.args)
+            except Exception as e:
+                await conn.execute('ROLLBACK TO SAVEPOINT request')
+                outcomes.append((False, e))
+            else:
+                outcomes.append((True, result))
+            finally:
+                profiler.current_command.reset(token)
+            await conn.execute('RELEASE SAVEPOINT request')
+        await conn.execute('COMMIT')
+    except BaseException:
+        # The transaction may already be gone if COMMIT itself failed
+        with contextlib.suppress(Exception):
+            await conn.execute('ROLLBACK')
+        raise
+    return outcomes
+
+async def _commit(batch):
+    global write_count
+    write_count += len(batch)
+    try:
+        outcomes = await _apply_batch(db.backend, batch)
+    except Exception as e:
+        # The commit itself failed, so nothing in the batch is durable
+        for request in batch:
+            if not request.future.done():
+                request.future.set_exception(e)
+        return
+
+    for request, (ok, result) in zip(batch, outcomes):
+        if request.future.done():
+            continue
+        if ok:
+            request.future.set_result(result)
+        else:
+            request.future.set_exception(result)
+
+async def _run_unbatched(request: _Unbatched):
+    try:
+        result = await request.func(db.backend.writer, *request.args)
+    except Exception as e:
+        request.future.set_exception(e)
+    else:
+        request.future.set_result(result)
+
+async def _run():
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        request = await _queue.get()
+        if request is None:
+            break
+        if isinstance(request, _Unbatched):
+            await _run_unbatched(request)
+            continue
+        batch = [request]
+        unbatched = None
+        deadline = loop.time() + BATCH_WINDOW
+        while len(batch) < MAX_BATCH:
+            try:
+                request = _queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(_queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if request is None:
+                stopping = True
+                break
+            if isinstance(request, _Unbatched):
+                unbatched = request
+                break
+            batch.append(request)
+        await _commit(batch)
+        if unbatched is not None:
+            await _run_unbatched(unbatched)
+
+async def start_writer():
+    """Start the batching task on the backend's writer connection. Safe to call more than once.
+
+    db.init_pool() must have opened the backend first.
+    """
+    global _queue, _task
+    if _task is not None:
+        return
+    if db.backend is None:
+        raise RuntimeError("The database pool has not been initialised. Call init_pool() first.")
+    _queue = asyncio.Queue()
+    _task = asyncio.create_task(_run())
+
+async def stop_writer():
+    """Commit every queued write and stop the batching task."""
+    global _queue, _task
+    if _task is None:
+        return
+    _queue.put_nowait(None)
+    await _task
+    _queue = _task = None
+
+def run(func: Callable[..., Awaitable[Any]], *args: Any) -> "asyncio.Future[Any]":
+    """Queue ``await func(conn, *args)`` to run atomically inside the next write batch.
+
+    ``conn`` is the backend's writer connection (see economy.db). ``func``
+    should only await queries on it. The returned future resolves to its
+    return value once the batch has been committed.
+    """
+    if _task is None:
+        raise RuntimeError("The database writer is not running. Call start_writer() first.")
+    future = asyncio.get_running_loop().create_future()
+    _queue.put_nowait(_Request(func, args, future, profiler.current_command.get()))
+    return future
+
+def run_unbatched(func: Callable[..., Awaitable[Any]], *args: Any) -> "asyncio.Future[Any]":
+    """Queue ``await func(conn, *args)`` to run alone, outside any transaction.
+
+    Writes queued earlier are committed first and later ones wait until it
+    returns. Only for statements SQLite refuses inside a transaction, like VACUUM.
+    """
+    if _task is None:
+        raise RuntimeError("The database writer is not running. Call start_writer() first.")
+    future = asyncio.get_running_loop().create_future()
+    _queue.put_nowait(_Unbatched(func, args, future))
+    return future
+
+async def _execute_many(conn, statements) -> list:
+    return [await conn.execute(sql, params) for sql, params in statements]
+
+async def execute(sql: str, params=()) -> int:
+    """Run one write statement through the writer and return its rowcount."""
+    rowcounts = await run(_execute_many, [(sql, params)])
+    return rowcounts[0]
+
+async def execute_many(*statements) -> list:
+    """Run several (sql, params) statements atomically and return their rowcounts."""
+    return await run(_execute_many, statements)
+
+async def _fetchone(conn, sql: str, params):
+    return await conn.fetchone(sql, params)
+
+async def fetchone(sql: str, params=()):
+    """Run one write statement with a RETURNING clause and return its first row, or None."""
+    return await run(_fetchone, sql, params)
@@ -6,40 +6,51 @@ from discord.ext import commands
 import settings
 from economy.job import add_job
 from economy import setup_database, initialize_stocks
+from economy.db import init_pool
+from economy.writer import start_writer
+from economy import profiler
 from economy.stocks import random_price_fluctuation
 from render_com import keep_alive
 keep_alive()
 
 def main(bot: commands.Bot):
-    @bot.event
-    async def on_ready():
-        try:
-            print(f'Logged in as {bot.user} ({bot.user.id})')
-            
-            # Load cogs
-            await load_cogs(bot)
-            print("Cogs loaded")
+    async def setup_hook():
+        # Open the storage backend, start the writer and bring the schema up to date
+        # before any cog is loaded, so no cog command or task can see an old schema
+        await init_pool()
+        await start_writer()
+        print(f"Database opened ({settings.DB_BACKEND}, {settings.DB_POOL_SIZE} readers)")
+
+        await setup_database()
+        print("Database initialized")
+
+        await initialize_stocks()
 
-            # Initialize the database
-            await setup_database()
-            print("Database initialized")
+        # Add initial jobs
+        await add_job("astronaut", "Astronaut", "Explore space and conduct research.", 5000, 0.2)
+        await add_job("engineer", "Space Engineer", "Design and build spacecraft.", 3000, 0.4)
+        await add_job("pilot", "Spacecraft Pilot", "Pilot spacecraft on missions.", 4000, 0.3)
+        await add_job("scientist", "Space Scientist", "Conduct scientific experiments in space.", 3500, 0.35)
+        await add_job("technician", "Space Technician", "Maintain and repair spacecraft.", 2500, 0.5)
+        print("Economy, jobs, and the stock market have been initialized.")
 
-            # Initialize stocks
-            await initialize_stocks()
+        # Start random price fluctuations
+        bot.loop.create_task(random_price_fluctuation())
 
-            # Start random price fluctuations
-            bot.loop.create_task(random_price_fluctuation())
-            
-            # Add initial jobs
-            await add_job("astronaut", "Astronaut", "Explore space and conduct research.", 5000, 0.2)
-            await add_job("engineer", "Space Engineer", "Design and build spacecraft.", 3000, 0.4)
-            await add_job("pilot", "Spacecraft Pilot", "Pilot spacecraft on missions.", 4000, 0.3)
-            await add_job("scientist", "Space Scientist", "Conduct scientific experiments in space.", 3500, 0.35)
-            await add_job("technician", "Space Technician", "Maintain and repair spacecraft.", 2500, 0.5)
-            print("Economy, jobs, and the stock market have been initialized.")
+        await load_cogs(bot)
+        print("Cogs loaded")
 
-        except Exception as e:
-            print(f"An error occurred during on_ready: {e}")
+    bot.setup_hook = setup_hook
+
+    @bot.before_invoke
+    async def track_command(ctx: commands.Context):
+        # Lets the query profiler attribute every statement to the command that ran it
+        profiler.current_command.set(ctx.command.qualified_name)
+
+    @bot.event
+    async def on_ready():
+        # Fires again after every reconnect, so it only reports
+        print(f'Logged in as {bot.user} ({bot.user.id})')
 
 
     @bot.event
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import pathlib
+import uuid
+
+import pytest
+
+import settings
+from economy import db, writer, setup_database, initialize_stocks
+from economy.accounts import accounts
+from economy.cooldowns import cooldowns
+from economy.market import market
+
+# Every test runs once per storage backend, each time on a freshly migrated
+# database. SQLite uses a temporary file. PostgreSQL runs when
+# TEST_POSTGRES_DSN points at a database the tests may create schemas in,
+# e.g. postgresql://postgres@localhost/space_test; each test gets its own
+# schema, dropped afterwards.
+POSTGRES_DSN = os.getenv('TEST_POSTGRES_DSN', '')
+
+REPOSITORY = pathlib.Path(__file__).resolve().parent.parent
+
+async def _create_schema(schema: str):
+    import asyncpg
+    conn = await asyncpg.connect(POSTGRES_DSN)
+    try:
+        await conn.execute(f'CREATE SCHEMA {schema}')
+    finally:
+        await conn.close()
+
+async def _drop_schema(schema: str):
+    import asyncpg
+    conn = await asyncpg.connect(POSTGRES_DSN)
+    try:
+        await conn.execute(f'DROP SCHEMA {schema} CASCADE')
+    finally:
+        await conn.close()
+
+async def _run(backend_name: str, database: str, scenario):
+    # The in-memory state is per process; start it over like a restart would
+    accounts.clear()
+    cooldowns._expiry.clear()
+    cooldowns._dirty.clear()
+    await db.init_pool(database, size=2, backend_name=backend_name)
+    try:
+        await writer.start_writer()
+        await setup_database()
+        await initialize_stocks()
+        return await scenario()
+    finally:
+        await market.stop()
+        await writer.stop_writer()
+        await db.close_pool()
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def economy(request, tmp_path, monkeypatch):
+    """``economy(scenario)`` runs ``await scenario()`` against a fresh database of the backend.
+
+    ``economy.backend`` is the backend's name, for tests of one backend only.
+    """
+    backend_name = request.param
+    schema = None
+    if backend_name == 'postgres':
+        if not POSTGRES_DSN:
+            pytest.skip("set TEST_POSTGRES_DSN to run the PostgreSQL tests")
+        pytest.importorskip('asyncpg')
+        schema = f'space_test_{uuid.uuid4().hex[:12]}'
+        asyncio.run(_create_schema(schema))
+        # asyncpg sends unknown DSN parameters as server settings
+        separator = '&' if '?' in POSTGRES_DSN else '?'
+        monkeypatch.setattr(settings, 'POSTGRES_DSN', f'{POSTGRES_DSN}{separator}search_path={schema}')
+    # initialize_stocks reads economy/stocks.json relative to the repository
+    monkeypatch.chdir(REPOSITORY)
+
+    def run(scenario):
+        return asyncio.run(_run(backend_name, str(tmp_path / 'space.db'), scenario))
+
+    run.backend = backend_name
+    yield run
+    if schema is not None:
+        asyncio.run(_drop_schema(schema))
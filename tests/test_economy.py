@@ -0,0 +1,527 @@
+import asyncio
+import contextlib
+import gzip
+import math
+import sqlite3
+from datetime import datetime, timedelta
+
+import discord
+import pytest
+
+import settings
+
+from economy import bulk, db, ledger, maintenance, profiler, writer
+from economy.migrations import MIGRATIONS, check_query_plans, get_schema_version, run_migrations
+from economy.accounts import AccountCache, accounts
+from economy.backup import backup_database
+from economy.catalog import ShopItem, catalog
+from economy.cooldowns import cooldowns
+from economy.guilds import GLOBAL_ECONOMY, disable_guild_economy, economy_scope, enable_guild_economy, load_guild_economies
+from economy.inventory import SELL_RATE, get_inventory, get_inventory_item, get_item_quantity, remove_item, sell_item
+from economy.job import add_job, apply_for_job, get_user_job, settle_income, work
+from economy.leaderboard import leaderboards
+from economy.loot import AliasTable, build_loot_table
+from economy.market import market
+from economy.pay import add_balance, get_balance, remove_balance, transfer_credits
+from economy.retention import apply_retention
+from economy.settlement import settle
+from economy.stocks import buy_shares, get_portfolio, sell_shares, get_stock_price, get_stocks, update_stock_price, update_user_portfolio
+from economy.store import add_shop_item, buy_item, get_shop_items
+from economy import trade
+
+
+def test_balances(economy):
+    async def scenario():
+        await add_balance(1, 1000)
+        await remove_balance(1, 300)
+        await transfer_credits(1, 2, 200)
+        await bulk.grant_credits([(3, 50), (4, 70)])
+        return [await get_balance(user_id) for user_id in (1, 2, 3, 4, 5)]
+
+    assert economy(scenario) == [500, 200, 50, 70, 0]
+
+
+def test_one_shared_pool(economy):
+    async def scenario():
+        await add_balance(1, 10)
+        # A second init_pool, e.g. from another module, gets the same backend
+        same = await db.init_pool() is db.backend
+
+        async def read():
+            async with db.acquire() as conn:
+                await asyncio.sleep(0.01)
+                return (await conn.fetchone('SELECT balance FROM users WHERE user_id = 1'))[0]
+
+        # More readers than connections wait their turn instead of failing
+        return same, await asyncio.gather(*(read() for _ in range(6)))
+
+    assert economy(scenario) == (True, [10] * 6)
+
+
+def test_storage_profile_applies_to_every_connection(economy):
+    if economy.backend != 'sqlite':
+        pytest.skip("storage profiles only apply to SQLite")
+
+    async def scenario():
+        async with db.acquire() as conn:
+            reader = (await conn.fetchone('PRAGMA synchronous'))[0]
+        return reader, await writer.run(lambda conn: conn.fetchone('PRAGMA synchronous'))
+
+    synchronous = {'OFF': 0, 'NORMAL': 1, 'FULL': 2}[db.PROFILES[settings.DB_PROFILE]['synchronous']]
+    reader, writer_row = economy(scenario)
+    assert reader == writer_row[0] == synchronous
+
+
+def test_unknown_storage_profile(tmp_path):
+    with pytest.raises(ValueError):
+        asyncio.run(db.init_pool(str(tmp_path / 'space.db'), profile='fastest'))
+    assert db.backend is None
+
+
+def test_migrations(economy):
+    async def scenario():
+        version = await get_schema_version()
+        # Already up to date, nothing runs twice
+        again = await run_migrations()
+        return version, again, await check_query_plans()
+
+    version, again, plans = economy(scenario)
+    assert version == again == MIGRATIONS[-1][0]
+    assert [name for name, uses_index, _ in plans if not uses_index] == []
+
+
+def test_failing_write_leaves_its_batch_alone(economy):
+    async def scenario():
+        # Queued together, so they share one transaction
+        results = await asyncio.gather(add_balance(1, 10), writer.execute('INSERT INTO no_such_table VALUES (1)'),
+                                       add_balance(2, 20), return_exceptions=True)
+        accounts.clear()
+        return [isinstance(result, Exception) for result in results], await get_balance(1), await get_balance(2)
+
+    assert economy(scenario) == ([False, True, False], 10, 20)
+
+
+def test_readers_are_read_only(economy):
+    if economy.backend != 'sqlite':
+        pytest.skip("only SQLite readers are read-only")
+
+    async def scenario():
+        await add_balance(1, 10)
+        async with db.acquire() as conn:
+            with pytest.raises(sqlite3.OperationalError, match='readonly'):
+                await conn.execute('DELETE FROM cooldowns')
+            # ...and see what the writer committed
+            return (await conn.fetchone('SELECT balance FROM users WHERE user_id = 1'))[0]
+
+    assert economy(scenario) == 10
+
+
+def test_economies_are_separate(economy):
+    async def scenario():
+        await add_balance(1, 100)
+        await add_balance(1, 40, guild_id=42)
+        return await get_balance(1), await get_balance(1, 42)
+
+    assert economy(scenario) == (100, 40)
+
+
+def test_account_cache(economy):
+    async def scenario():
+        await add_balance(1, 10)
+        misses = accounts.misses
+        # The write put the row it returned, so this read is a hit
+        cached = await get_balance(1)
+        write_through = accounts.misses == misses
+
+        cache = AccountCache(2)
+        for user_id in (1, 2, 1, 3, 2):
+            await cache.get(user_id)
+        return cached, write_through, cache.stats()
+
+    cached, write_through, stats = economy(scenario)
+    assert cached == 10 and write_through
+    # User 2 was the least recently used when user 3 came in
+    assert (stats['size'], stats['hits'], stats['misses']) == (2, 1, 4)
+
+
+def test_online_backup(economy, tmp_path):
+    if economy.backend != 'sqlite':
+        pytest.skip("online backups are SQLite only")
+    backups = tmp_path / 'backups'
+    backups.mkdir()
+    (backups / 'space-20000101-000000.db.gz').write_bytes(b'')
+
+    async def scenario():
+        await add_balance(1, 10)
+        return await backup_database(str(backups), compress=True, keep=1)
+
+    result = economy(scenario)
+    assert result.removed == 1
+    assert sorted(backups.iterdir()) == [result.path]
+    copy = tmp_path / 'copy.db'
+    copy.write_bytes(gzip.decompress(result.path.read_bytes()))
+    with contextlib.closing(sqlite3.connect(copy)) as conn:
+        assert conn.execute('SELECT balance FROM users WHERE user_id = 1').fetchone() == (10,)
+
+
+def test_guild_economy_opt_in(economy):
+    guild, other = discord.Object(42), discord.Object(43)
+
+    async def scenario():
+        await enable_guild_economy(42)
+        await enable_guild_economy(43)
+        await disable_guild_economy(43)
+        # As if the bot restarted
+        await load_guild_economies()
+        return economy_scope(guild), economy_scope(other), economy_scope(None)
+
+    assert economy(scenario) == (42, GLOBAL_ECONOMY, GLOBAL_ECONOMY)
+
+
+def test_shop_and_inventory(economy):
+    async def scenario():
+        await add_shop_item('moon_rock', 'Moon Rock', 101)
+        await add_balance(1, 250)
+        bought = [(await buy_item(1, 'moon_rock'))[0] for _ in range(3)]
+        inventory = await get_inventory(1)
+        item = await get_inventory_item(1, 'MOON_ROCK')
+        removed = [await remove_item(1, 'moon_rock', 1), await remove_item(1, 'moon_rock', 5)]
+        return bought, inventory, item, removed, await get_item_quantity(1, 'moon_rock'), await get_balance(1)
+
+    bought, inventory, item, removed, quantity, balance = economy(scenario)
+    assert bought == [True, True, False]
+    assert [(row.item_id, row.quantity) for row in inventory] == [('moon_rock', 2)]
+    assert item.sell_price == int(101 * SELL_RATE)
+    assert removed == [True, False]
+    assert quantity == 1
+    assert balance == 48
+
+
+def test_sell_pays_only_for_items_still_held(economy):
+    async def scenario():
+        await add_shop_item('moon_rock', 'Moon Rock', 100)
+        await bulk.grant_items([(1, 1)], 'moon_rock')
+        sold = await sell_item(1, 'moon_rock', 75)
+        # Revoked behind the seller's back
+        await bulk.grant_items([(1, 1)], 'moon_rock')
+        await bulk.revoke_items([(1, 1)], 'moon_rock')
+        again = await sell_item(1, 'moon_rock', 75)
+        return sold, again, await get_item_quantity(1, 'moon_rock'), await get_balance(1)
+
+    assert economy(scenario) == (True, False, 0, 75)
+
+
+def test_bulk_grants_and_revokes(economy):
+    async def scenario():
+        await add_shop_item('moon_rock', 'Moon Rock', 100)
+        progress = []
+
+        async def report(done, total):
+            progress.append((done, total))
+
+        granted = await bulk.grant_credits([(user_id, 100) for user_id in range(1, 6)], progress=report)
+        # Never below zero
+        await bulk.revoke_credits([(1, 30), (2, 500)])
+        await bulk.grant_items([(1, 2), (2, 1)], 'moon_rock')
+        await bulk.revoke_items([(1, 1), (2, 1)], 'moon_rock')
+        async with db.acquire() as conn:
+            inventory_rows = (await conn.fetchone('SELECT COUNT(*) FROM user_inventory'))[0]
+        return (granted.users, progress, [await get_balance(user_id) for user_id in (1, 2, 3)],
+                await get_item_quantity(1, 'moon_rock'), inventory_rows)
+
+    assert economy(scenario) == (5, [(5, 5)], [70, 0, 100], 1, 1)
+
+
+def test_catalog(economy):
+    async def scenario():
+        await add_shop_item('star_map', 'Star Map', 300)
+        built = []
+        page = catalog.cached('page', lambda: built.append(1) or len(catalog.items()))
+        catalog.cached('page', lambda: built.append(1))
+        await add_shop_item('moon_rock', 'Moon Rock', 100)
+        # The new item moved the version on, so the page is built again
+        page_after = catalog.cached('page', lambda: built.append(1) or len(catalog.items()))
+        await add_job('pilot', 'Spacecraft Pilot', 'Pilot spacecraft on missions.', 4000, 1.0)
+        served = [item.item_id for item in await get_shop_items()], catalog.job('pilot').job_pay
+        # What a restarted bot reads back
+        await catalog.load()
+        return page, page_after, len(built), served, ([item.item_id for item in await get_shop_items()], catalog.job('pilot').job_pay)
+
+    page, page_after, builds, served, reloaded = economy(scenario)
+    assert (page, page_after, builds) == (1, 2, 2)
+    assert served == reloaded == (['moon_rock', 'star_map'], 4000)
+
+
+def _alias_chances(table: AliasTable) -> list:
+    # A column keeps prob of its own outcome and hands the rest to its alias
+    chances = [0.0] * len(table)
+    for column, (prob, alias) in enumerate(zip(table.prob, table.alias)):
+        chances[column] += prob / len(table)
+        chances[alias] += (1 - prob) / len(table)
+    return chances
+
+
+def test_alias_table_matches_its_weights():
+    weights = [5, 1, 0, 3, 1]
+    assert _alias_chances(AliasTable(weights)) == pytest.approx([weight / sum(weights) for weight in weights])
+    with pytest.raises(ValueError):
+        AliasTable([0, 0])
+
+
+def test_loot_table_weighs_tiers_then_items():
+    items = [ShopItem('rock', 'Rock', 10, 'common', 3), ShopItem('dust', 'Dust', 5, 'common', 1),
+             ShopItem('gem', 'Gem', 500, 'rare', 1), ShopItem('map', 'Map', 50, 'common', 0),
+             ShopItem('relic', 'Relic', 900, 'mythic', 1)]
+    table = build_loot_table(items, {'common': 0.8, 'rare': 0.2, 'empty': 0.5})
+    # Items weighing 0 and tiers without a weight never drop; empty tiers take no share
+    assert [item.item_id for item in table.items] == ['rock', 'dust', 'gem']
+    assert table.chances == pytest.approx([0.6, 0.2, 0.2])
+    assert _alias_chances(table.alias) == pytest.approx(table.chances)
+    assert build_loot_table(items[3:4], {'common': 1}) is None
+
+
+def test_trade_with_items_and_credits(economy):
+    async def scenario():
+        await add_shop_item('moon_rock', 'Moon Rock', 100)
+        await add_shop_item('star_map', 'Star Map', 300)
+        await bulk.grant_items([(1, 3)], 'moon_rock')
+        await bulk.grant_items([(2, 1)], 'star_map')
+        await add_balance(1, 500)
+        trade_id = await trade.create_trade(1, 2, {'moon_rock': 2}, {'star_map': 1}, 150, None)
+        await trade.accept_trade(trade_id, 2)
+        return ([await get_item_quantity(1, item) for item in ('moon_rock', 'star_map')],
+                [await get_item_quantity(2, item) for item in ('moon_rock', 'star_map')],
+                await get_balance(1), await get_balance(2))
+
+    assert economy(scenario) == ([1, 1], [2, 0], 350, 150)
+
+
+def test_failed_trade_moves_nothing(economy):
+    async def scenario():
+        await add_shop_item('moon_rock', 'Moon Rock', 100)
+        await bulk.grant_items([(1, 1)], 'moon_rock')
+        trade_id = await trade.create_trade(1, 2, {'moon_rock': 2}, {}, None, 10)
+        with pytest.raises(trade.TradeError):
+            await trade.accept_trade(trade_id, 2)
+        return await get_item_quantity(1, 'moon_rock'), await get_item_quantity(2, 'moon_rock')
+
+    assert economy(scenario) == (1, 0)
+
+
+def test_retention(economy):
+    async def scenario():
+        await add_shop_item('moon_rock', 'Moon Rock', 100)
+        await bulk.grant_items([(1, 5)], 'moon_rock')
+        old = await trade.create_trade(1, 2, {'moon_rock': 1}, {}, None, None)
+        await trade.cancel_trade(old, 1)
+        await writer.execute('UPDATE trades SET closed_at = ? WHERE trade_id = ?', ((datetime.utcnow() - timedelta(days=30)).isoformat(), old))
+        recent = await trade.create_trade(1, 2, {'moon_rock': 1}, {}, None, None)
+        await trade.cancel_trade(recent, 1)
+        await trade.create_trade(1, 2, {'moon_rock': 1}, {}, None, None)  # still pending
+        await writer.execute('INSERT INTO cooldowns (user_id, action, scope, expires_at) VALUES (1, ?, 0, 1)', ('daily',))
+        results = await apply_retention()
+        async with db.acquire() as conn:
+            counts = [(await conn.fetchone(f'SELECT COUNT(*) FROM {table}'))[0]
+                      for table in ('trades', 'trade_items', 'trades_archive', 'trade_items_archive', 'cooldowns')]
+        return [(result.table, result.removed) for result in results], counts
+
+    results, counts = economy(scenario)
+    assert results == [('trades', 1), ('cooldowns', 1)]
+    # The recent and the pending trade stay, the old one moved with its items
+    assert counts == [2, 2, 1, 1, 0]
+
+
+def test_jobs(economy):
+    async def scenario():
+        await add_job('pilot', 'Spacecraft Pilot', 'Pilot spacecraft on missions.', 4000, 1.0)
+        accepted, _ = await apply_for_job(1, 'pilot')
+        again, _ = await apply_for_job(1, 'pilot')
+        return accepted, again, await get_user_job(1)
+
+    accepted, again, job = economy(scenario)
+    assert accepted and not again
+    assert job[0] == 'Spacecraft Pilot'
+
+
+def test_job_pays_into_the_economy_it_was_taken_in(economy):
+    async def scenario():
+        await add_job('pilot', 'Spacecraft Pilot', 'Pilot spacecraft on missions.', 4000, 1.0)
+        await apply_for_job(1, 'pilot', guild_id=42)
+        # Two hours on the job
+        await writer.execute('UPDATE user_jobs SET accrued_at = ?', ((datetime.utcnow() - timedelta(hours=2)).isoformat(),))
+        settled = await settle_income(1)
+        earned, _, worked_in = await work(1)
+        return settled, earned, worked_in, await get_balance(1), await get_balance(1, 42)
+
+    settled, earned, worked_in, global_balance, guild_balance = economy(scenario)
+    assert settled == (pytest.approx(8000, abs=1), 42)
+    assert worked_in == 42
+    assert (global_balance, guild_balance) == (0, settled[0] + earned)
+
+
+def test_cooldowns(economy):
+    async def scenario():
+        hour = timedelta(hours=1)
+        first, second = cooldowns.try_start(1, 'daily', hour), cooldowns.try_start(1, 'daily', hour)
+        other_economy = cooldowns.try_start(1, 'daily', hour, scope=42)
+        cooldowns.start(2, 'work', hour)
+        cooldowns.clear(2, 'work')
+        written = await cooldowns.flush()
+        # As if the bot restarted
+        cooldowns._expiry.clear()
+        await cooldowns.load()
+        return first, second, other_economy, written, cooldowns.remaining(1, 'daily'), cooldowns.remaining(2, 'work')
+
+    first, second, other_economy, written, daily, work_left = economy(scenario)
+    assert first == other_economy == timedelta(0)
+    assert timedelta(minutes=59) < second <= timedelta(hours=1)
+    assert written == 3
+    assert timedelta(minutes=59) < daily <= timedelta(hours=1)
+    assert work_left == timedelta(0)
+
+
+def test_leaderboards(economy):
+    async def scenario():
+        await bulk.grant_credits([(1, 300), (2, 100), (3, 200)])
+        await add_balance(1, 5, guild_id=42)
+        before = await leaderboards.top('credits')
+        # Cached now; the write must still reach it
+        await add_balance(2, 500)
+        return before, await leaderboards.top('credits'), await leaderboards.standing(3, 'credits'), \
+            await leaderboards.top('credits', 42), await leaderboards.standing(9, 'credits')
+
+    before, after, standing, other_economy, nobody = economy(scenario)
+    assert before == [(1, 300), (3, 200), (2, 100)]
+    assert after == [(2, 600), (1, 300), (3, 200)]
+    assert standing == (200, 3, 3, 100.0)
+    assert other_economy == [(1, 5)]
+    assert nobody is None
+
+
+def test_net_worth_counts_items(economy):
+    async def scenario():
+        await add_shop_item('moon_rock', 'Moon Rock', 100)
+        await bulk.grant_credits([(1, 250), (2, 300)])
+        await bulk.grant_items([(1, 2)], 'moon_rock')
+        return await leaderboards.top('net_worth'), await leaderboards.top('credits')
+
+    net_worth, credits = economy(scenario)
+    assert net_worth == [(1, 450), (2, 300)]
+    assert credits == [(2, 300), (1, 250)]
+
+
+def test_stocks(economy):
+    async def scenario():
+        stock = (await get_stocks('DESC'))[0]
+        await update_user_portfolio(1, stock.stock_id, 4)
+        price = await update_stock_price(stock.stock_id, 10)
+        await market.flush()
+        return stock, price, await get_stock_price(stock.stock_id), await get_portfolio(1), await leaderboards.standing(1, 'net_worth')
+
+    stock, price, current, portfolio, standing = economy(scenario)
+    assert price == current == pytest.approx(stock.price + 10)
+    assert portfolio == [(stock.stock_id, stock.name, 4, current)]
+    # users.holdings followed the price written behind
+    assert standing.value == pytest.approx(4 * current)
+
+
+def test_share_trades_are_one_write(economy):
+    async def scenario():
+        stock = (await get_stocks())[0]
+        await add_balance(1, math.ceil(3 * stock.price))
+        results = [await buy_shares(1, stock.stock_id, 3, 0), await buy_shares(1, stock.stock_id, 1, 0),
+                   await sell_shares(1, stock.stock_id, 4, 0), await sell_shares(1, stock.stock_id, 3, 0),
+                   await buy_shares(1, 'NOPE', 1, 0)]
+        return stock.price, results, await get_balance(1), await get_portfolio(1)
+
+    price, results, balance, portfolio = economy(scenario)
+    assert results == [(math.ceil(3 * price), price), (None, price), (None, price), (math.floor(3 * price), price), None]
+    assert balance == math.floor(3 * price)
+    assert portfolio == []
+
+
+def test_concurrent_trades_settle_at_the_price_they_move(economy):
+    async def scenario():
+        stock = (await get_stocks())[0]
+        await add_balance(1, 10000)
+        await add_balance(2, 10000)
+        first, second = await asyncio.gather(buy_shares(1, stock.stock_id, 1, 0.5), buy_shares(2, stock.stock_id, 1, 0.5))
+        return stock.price, first, second
+
+    price, first, second = economy(scenario)
+    # The second purchase pays the price the first one left behind
+    assert first == (math.ceil(price), pytest.approx(1.5 * price))
+    assert second == (math.ceil(1.5 * price), pytest.approx(2.25 * price))
+
+
+def test_settlement(economy):
+    async def scenario():
+        await add_balance(1, 1000)
+        stock = (await get_stocks())[0]
+        await update_user_portfolio(2, stock.stock_id, 10)
+        # Not written behind yet, dividends must still pay on it
+        price = await update_stock_price(stock.stock_id, 1000)
+        await settle(dividend_rate=0.1, interest_rate=0.5)
+        # Already settled today
+        again = await settle(dividend_rate=0.1, interest_rate=0.5)
+        return price, await get_balance(1), await get_balance(2), again
+
+    price, interest, dividends, again = economy(scenario)
+    assert interest == 1500
+    assert abs(dividends - 10 * price * 0.1) <= 1
+    assert again == []
+
+
+def test_ledger(economy):
+    async def scenario():
+        await add_balance(1, 100)
+        await ledger.take_snapshot()
+        middle = datetime.utcnow()
+        await add_balance(1, 50)
+        await remove_balance(1, 30)
+        return (await ledger.history(1), await ledger.balance_at(1, middle),
+                await ledger.balance_at(1, datetime.utcnow()), await ledger.balance_at(1, middle - timedelta(days=1)))
+
+    history, before, now, too_early = economy(scenario)
+    assert [(entry.delta, entry.balance) for entry in history] == [(-30, 120), (50, 150), (100, 100)]
+    assert (before, now, too_early) == (100, 120, None)
+
+
+def test_maintenance_remembers_analyze(economy):
+    if economy.backend != 'sqlite':
+        pytest.skip("maintenance only applies to SQLite")
+
+    async def scenario():
+        first = await maintenance.run_maintenance(force=True)
+        second = await maintenance.run_maintenance(force=True)
+        # As if the bot restarted a while after the last ANALYZE
+        await writer.execute('UPDATE maintenance_runs SET ran_at = ?', ((datetime.utcnow() - timedelta(days=2)).isoformat(),))
+        due = await maintenance.run_maintenance(force=True)
+        return await maintenance.incremental_vacuum_enabled(), first.analyzed, second.analyzed, due.analyzed
+
+    # A new database starts out with incremental vacuum, and the first check only runs PRAGMA optimize
+    assert economy(scenario) == (True, False, False, True)
+
+
+def test_profiler_leaves_out_transaction_control(economy):
+    async def scenario():
+        profiler.reset()
+        await add_balance(1, 100)
+        return [stats.fingerprint for stats in profiler.top(100)]
+
+    fingerprints = economy(scenario)
+    assert any(key.startswith('INSERT INTO users') for key in fingerprints)
+    assert not [key for key in fingerprints if key.startswith(('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'SELECT set_config'))]
+
+
+def test_potd_channels(economy):
+    utils = pytest.importorskip('utils')
+
+    async def scenario():
+        await utils.add_channel(1, 10)
+        await utils.add_channel(1, 11)
+        await utils.update_last_post_date('2024-01-01')
+        await utils.update_last_post_date('2024-01-02')
+        return await utils.get_channels(), await utils.get_last_post_date()
+
+    assert economy(scenario) == ([11], '2024-01-02')
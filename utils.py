@@ -1,4 +1,4 @@
-import asqlite
+from economy import db, writer
 import aiohttp
 import io
 from starplot import MapPlot, Projection, Star
@@ -108,32 +108,25 @@ async def retrieve(url, params: dict={}, api_key_required: bool=True):
                 raise ValueError(f"Error fetching data from API: {response.status}")
 
 async def add_channel(guild_id: int, channel_id: int):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('''REPLACE INTO channels (guild_id, channel_id) VALUES (?, ?)''',
-                                 (guild_id, channel_id))
-        await conn.commit()
+    await writer.execute('''INSERT INTO channels (guild_id, channel_id) VALUES (?, ?)
+                            ON CONFLICT(guild_id) DO UPDATE SET channel_id = excluded.channel_id''',
+                         (guild_id, channel_id))
 
 async def get_channels():
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT channel_id FROM channels')
-            channels = await cursor.fetchall()
+    async with db.acquire() as conn:
+        channels = await conn.fetchall('SELECT channel_id FROM channels')
     return [channel[0] for channel in channels]
 
 async def get_last_post_date():
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT date FROM potd_last_post ORDER BY date DESC LIMIT 1')
-            date = await cursor.fetchone()
+    async with db.acquire() as conn:
+        date = await conn.fetchone('SELECT date FROM potd_last_post ORDER BY date DESC LIMIT 1')
     return date[0] if date else None
 
 async def update_last_post_date(date: str):
-    async with asqlite.connect('space.db') as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute('DELETE FROM potd_last_post')
-            await cursor.execute('INSERT INTO potd_last_post (date) VALUES (?)', (date,))
-        await conn.commit()
+    await writer.execute_many(
+        ('DELETE FROM potd_last_post', ()),
+        ('INSERT INTO potd_last_post (date) VALUES (?)', (date,)),
+    )
 
 def plot_map(longitude: float, latitude: float) -> io.BytesIO:
     fig, ax = plt.subplots(figsize=(10, 7))